@@ -0,0 +1,334 @@
+"""
+Архив закрытых записей.
+
+Завершенные, отмененные и отклоненные заявки и отклоненные отзывы старше
+ARCHIVE_AFTER_DAYS переносятся из рабочей базы (части requests.json/reviews.json
+по месяцам) в сжатые сегменты archive/<тип>s-<ГГГГ-ММ>-<номер>.jsonl.gz (по месяцу создания).
+Сегменты не изменяются после записи; archive/index.json хранит для каждого
+сегмента диапазон ID и сводку для статистики. Опубликованные отзывы остаются
+в рабочей базе: они нужны ленте /reviews.
+
+get_request/get_review ищут в архиве то, чего нет в рабочей базе, а
+get_statistics складывает счетчики рабочей базы со сводками сегментов.
+
+Запуск (например, раз в сутки по расписанию):
+    python archive.py [--days 30] [--dry-run]
+    python archive.py --list
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import database
+from config import get_settings
+from jsonfiles import file_lock, file_stamp, read_json, write_json
+from records import as_dict, from_epoch, time_of, to_epoch
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Статусы, после которых запись больше не меняется
+CLOSED_STATUSES = {
+    'request': ('completed', 'cancelled', 'rejected'),
+    'review': ('rejected',),
+}
+
+_index_cache = (None, None, None)  # (путь, отпечаток файла, данные)
+_summary_cache = {}
+
+
+# ========== ИНДЕКС ==========
+def _index_path():
+    return os.path.join(get_settings().archive_dir, INDEX_FILE)
+
+
+def load_index():
+    """Индекс архива; перечитывается, только если файл изменился"""
+    global _index_cache
+
+    path = _index_path()
+    stamp = file_stamp(path)
+    if stamp is None:
+        return {'segments': []}
+    if _index_cache[:2] != (path, stamp):
+        _index_cache = (path, stamp, read_json(path))
+    return _index_cache[2]
+
+
+def _save_index(index):
+    os.makedirs(get_settings().archive_dir, exist_ok=True)
+    write_json(_index_path(), index)
+
+
+def _segments(kind):
+    """Записанные до конца сегменты данного типа"""
+    return [segment for segment in load_index()['segments'] if segment['kind'] == kind and segment['committed']]
+
+
+# ========== СЕГМЕНТЫ ==========
+def _segment_path(name):
+    return os.path.join(get_settings().archive_dir, name)
+
+
+def _write_segment(kind, partition, records, index):
+    """Записывает новый сегмент (через временный файл) и возвращает его имя"""
+    taken = {segment['file'] for segment in index['segments']}
+    number = 1
+    while f"{kind}s-{partition}-{number:04d}.jsonl.gz" in taken:
+        number += 1
+    name = f"{kind}s-{partition}-{number:04d}.jsonl.gz"
+
+    directory = get_settings().archive_dir
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            for record in records:
+                f.write(json.dumps(as_dict(record), ensure_ascii=False).encode('utf-8') + b'\n')
+            f.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, _segment_path(name))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return name
+
+
+def read_segment(name):
+    """Все записи сегмента"""
+    with gzip.open(_segment_path(name), 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@lru_cache(maxsize=8)
+def _segment_records(name):
+    # Сегменты неизменяемы, поэтому кэш по имени не устаревает
+    return {record['id']: record for record in read_segment(name)}
+
+
+# ========== ЧТЕНИЕ ==========
+def iter_archived(kind, partitions=None):
+    """
+    Построчно читает записи всех сегментов типа kind, не загружая сегменты
+    целиком. partitions(partition) -> bool позволяет пропустить ненужные месяцы.
+    """
+    for segment in sorted(_segments(kind), key=lambda segment: segment['min_id']):
+        if partitions is not None and not partitions(segment['partition']):
+            continue
+        with gzip.open(_segment_path(segment['file']), 'rt', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def find_archived(kind, record_id):
+    """Ищет запись в архиве по ID; возвращает копию или None"""
+    for segment in _segments(kind):
+        if segment['min_id'] <= record_id <= segment['max_id']:
+            record = _segment_records(segment['file']).get(record_id)
+            if record is not None:
+                return dict(record)
+    return None
+
+
+def archived_summary(kind):
+    """Сводка по всем сегментам типа kind (для get_statistics)"""
+    segments = _segments(kind)
+    key = tuple(segment['file'] for segment in segments)
+    cached = _summary_cache.get(kind)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    total = database.empty_summary()
+    for segment in segments:
+        database.add_summary(total, segment['summary'])
+
+    _summary_cache[kind] = (key, total)
+    return total
+
+
+# ========== АРХИВАЦИЯ ==========
+def _month(record):
+    """Месяц создания записи ГГГГ-ММ (по нему выбирается сегмент); None, если даты нет"""
+    created = time_of(record, 'created_at')
+    return from_epoch(created)[:7] if created is not None else None
+
+
+def cutoff_for(older_than_days=None, now=None):
+    """Граница архивации: записи, закрытые раньше нее, можно переносить в архив"""
+    if older_than_days is None:
+        older_than_days = get_settings().archive_after_days
+    return to_epoch(((now or datetime.now()) - timedelta(days=older_than_days)).strftime(TIME_FORMAT))
+
+
+def is_archivable(kind, record, cutoff):
+    """
+    Закрыта ли запись раньше cutoff. Запись без распознанной даты создания
+    не архивируется: для нее нельзя выбрать сегмент по месяцу.
+    """
+    if record['status'] not in CLOSED_STATUSES[kind]:
+        return False
+    created = time_of(record, 'created_at')
+    if created is None:
+        return False
+    closed = time_of(record, 'updated_at') or created
+    return closed < cutoff
+
+
+def _reconcile(kind, index):
+    """
+    Разбирает сегменты, оставшиеся незавершенными после сбоя (внутри
+    archive_transaction). Такие сегменты - от одного прохода архивации: каждая
+    транзакция сначала разбирает прежние. Записи удаляются из рабочей базы
+    только после записи всех сегментов прохода, поэтому, если ни одна запись
+    сегментов еще не удалена, сегменты удаляются. Если удалена хотя бы одна
+    (сбой посреди remove_records, которое пишет части по очереди), удаление
+    доводится до конца и сегменты принимаются: иначе записи оказались бы и в
+    архиве, и в рабочей базе и дважды попали бы в экспорт, поиск и статистику.
+    """
+    pending = [segment for segment in index['segments'] if segment['kind'] == kind and not segment['committed']]
+    if not pending:
+        return False
+
+    ids = []
+    readable, broken = [], []
+    for segment in pending:
+        try:
+            ids.extend(record['id'] for record in read_segment(segment['file']))
+        except (OSError, EOFError, ValueError):
+            # Сегмент пропал или поврежден: принять его нельзя
+            broken.append(segment)
+            continue
+        readable.append(segment)
+
+    present = database.get_present_ids(kind, ids)
+    started = ids and len(present) < len(ids)
+    if started and database.get_last_id(kind) >= max(segment['max_id'] for segment in readable):
+        if present:
+            database.remove_records(kind, present)
+        for segment in readable:
+            segment['committed'] = True
+    else:
+        broken.extend(readable)
+    for segment in broken:
+        index['segments'].remove(segment)
+        path = _segment_path(segment['file'])
+        if os.path.exists(path):
+            os.unlink(path)
+    return True
+
+
+@contextmanager
+def archive_transaction(kind):
+    """
+    Блокирует индекс архива и рабочую базу kind и отдает копию индекса,
+    в которой уже разобраны незавершенные после сбоя сегменты.
+
+    Запись в архив идет в три шага: add_segments() и сохранение индекса,
+    изменение рабочей базы, commit_segments(). После сбоя на любом шаге
+    следующая транзакция приведет архив в порядок.
+    """
+    os.makedirs(get_settings().archive_dir, exist_ok=True)
+    with file_lock(_index_path()), database.locked(kind):
+        index = json.loads(json.dumps(load_index()))
+        if _reconcile(kind, index):
+            _save_index(index)
+        yield index
+
+
+def add_segments(kind, records, index):
+    """
+    Пишет записи (с уже выданными ID и датой создания, см. is_archivable) в
+    новые сегменты по месяцам и сохраняет индекс.
+    """
+    partitions = {}
+    for record in records:
+        partitions.setdefault(_month(record), []).append(record)
+
+    new_segments = []
+    for partition, group in sorted(partitions.items()):
+        name = _write_segment(kind, partition, group, index)
+        segment = {
+            'file': name,
+            'kind': kind,
+            'partition': partition,
+            'min_id': min(record['id'] for record in group),
+            'max_id': max(record['id'] for record in group),
+            'summary': database.summarize(kind, group),
+            'committed': False,
+        }
+        index['segments'].append(segment)
+        new_segments.append(segment)
+    _save_index(index)
+    return new_segments
+
+
+def commit_segments(segments, index):
+    for segment in segments:
+        segment['committed'] = True
+    _save_index(index)
+
+
+def archive_closed(kind, older_than_days=None, now=None, dry_run=False):
+    """
+    Переносит в архив закрытые записи kind ('request' или 'review'), закрытые
+    раньше older_than_days дней назад. Возвращает {сегмент: число записей}.
+    """
+    cutoff = cutoff_for(older_than_days, now)
+
+    with archive_transaction(kind) as index:
+        records = database.get_all_requests() if kind == 'request' else database.get_all_reviews()
+        candidates = [record for record in records if is_archivable(kind, record, cutoff)]
+        undated = sum(1 for record in records
+                      if record['status'] in CLOSED_STATUSES[kind] and time_of(record, 'created_at') is None)
+        if undated:
+            logger.warning(f"Не архивировано {kind} без распознанной даты создания: {undated}")
+
+        if dry_run or not candidates:
+            return dict(sorted(Counter(_month(record) for record in candidates).items()))
+
+        new_segments = add_segments(kind, candidates, index)
+        database.remove_records(kind, [record['id'] for record in candidates])
+        commit_segments(new_segments, index)
+
+    return {segment['file']: segment['summary']['count'] for segment in new_segments}
+
+
+# ========== ЗАПУСК ИЗ КОМАНДНОЙ СТРОКИ ==========
+def main(argv=None):
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Перенос закрытых заявок и отзывов в архив")
+    parser.add_argument('--days', type=int, default=settings.archive_after_days,
+                        help="архивировать записи, закрытые больше стольких дней назад")
+    parser.add_argument('--dry-run', action='store_true', help="только показать, что будет перенесено")
+    parser.add_argument('--list', action='store_true', help="показать сегменты архива")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for segment in load_index()['segments']:
+            state = '' if segment['committed'] else ' (не завершен)'
+            print(f"{segment['file']}: ID {segment['min_id']}-{segment['max_id']}, "
+                  f"{segment['summary']['count']} записей{state}")
+        return
+
+    for kind, title in (('request', 'Заявки'), ('review', 'Отзывы')):
+        result = archive_closed(kind, args.days, dry_run=args.dry_run)
+        total = sum(result.values())
+        action = "будет перенесено" if args.dry_run else "перенесено"
+        print(f"📦 {title}: {action} {total}")
+        for name, count in result.items():
+            print(f"   {name}: {count}")
+
+
+if __name__ == '__main__':
+    main()
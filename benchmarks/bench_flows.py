@@ -0,0 +1,265 @@
+"""
+Синтетическая нагрузка на диалоги /order и /review.
+
+Собирает настоящий Application из bot.build_application() поверх заглушки
+Bot API и прогоняет через очередь апдейтов тысячи одновременных пользователей.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_flows --users 1000 --sizes 1000,100000,1000000
+
+--concurrency задает режимы обработки апдейтов (0 - последовательно), чтобы
+сравнить пропускную способность при одинаковой нагрузке.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.datagen import CITIES, PRODUCTS, write_dataset
+
+# Настройки должны быть заданы до импорта config
+os.environ.setdefault('BOT_TOKEN', '123456:BENCHMARK')
+os.environ.setdefault('ADMIN_ID', '1')
+
+
+# ========== ГЕНЕРАЦИЯ АПДЕЙТОВ ==========
+class UpdateFactory:
+    """Создает JSON апдейтов Telegram от имени симулированных пользователей"""
+
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def user(user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+
+    def message(self, user_id, text=None, contact=None):
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self.user(user_id),
+        }
+        if contact:
+            message['contact'] = {'phone_number': contact, 'first_name': f'User{user_id}', 'user_id': user_id}
+        else:
+            message['text'] = text
+            if text.startswith('/'):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': next(self._update_ids), 'message': message}
+
+    def callback(self, user_id, data):
+        return {
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': str(next(self._message_ids)),
+                'from': self.user(user_id),
+                'chat_instance': str(user_id),
+                'data': data,
+                'message': {
+                    'message_id': next(self._message_ids),
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'text': '...',
+                },
+            },
+        }
+
+
+# ========== ПРОГОН ==========
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class FlowBenchmark:
+    """Подает апдейты в update_queue и замеряет время до окончания их обработки"""
+
+    def __init__(self, application, admin_id):
+        self.application = application
+        self.admin_id = admin_id
+        self.factory = UpdateFactory()
+        self.pending = {}
+        self.latencies = {'order': [], 'review': []}
+        self.handler_times = []
+        self.processed = 0
+
+        original = application.process_update
+
+        async def process_update(update):
+            started = time.perf_counter()
+            try:
+                await original(update)
+            finally:
+                self.handler_times.append(time.perf_counter() - started)
+                self.processed += 1
+                future = self.pending.pop(getattr(update, 'update_id', None), None)
+                if future is not None:
+                    future.set_result(None)
+
+        application.process_update = process_update
+
+    async def send(self, data, flow):
+        from telegram import Update
+
+        update = Update.de_json(data, self.application.bot)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[update.update_id] = future
+
+        started = time.perf_counter()
+        await self.application.update_queue.put(update)
+        await future
+        self.latencies[flow].append(time.perf_counter() - started)
+
+    async def order_flow(self, user_id, rng):
+        f = self.factory
+        for data in (
+            f.message(user_id, '/order'),
+            f.message(user_id, rng.choice(PRODUCTS)),
+            f.message(user_id, f'https://www.wildberries.ru/catalog/{rng.randrange(10 ** 8)}/detail.aspx'),
+            f.message(user_id, str(rng.randrange(1000, 300000))),
+            f.message(user_id, rng.choice(CITIES)[0]),
+            f.message(user_id, contact=f'7999{user_id:07d}'),
+        ):
+            await self.send(data, 'order')
+
+    async def review_flow(self, user_id, rng):
+        from database import get_user_reviews
+
+        f = self.factory
+        for data in (
+            f.message(user_id, '/review'),
+            f.message(user_id, 'Отличный сервис, нашли товар намного дешевле, чем в магазине!'),
+            f.callback(user_id, f'rating_{rng.randint(1, 5)}'),
+        ):
+            await self.send(data, 'review')
+
+        review_id = get_user_reviews(user_id)[-1]['id']
+        decision = 'approve' if rng.random() < 0.8 else 'reject'
+        await self.send(f.callback(self.admin_id, f'{decision}_{review_id}'), 'review')
+
+    async def run(self, users, review_share, seed=1):
+        rng = random.Random(seed)
+        flows = []
+        for user_id in range(1, users + 1):
+            flow = self.review_flow if rng.random() < review_share else self.order_flow
+            flows.append(flow(1000 + user_id, random.Random(seed + user_id)))
+
+        started = time.perf_counter()
+        await asyncio.gather(*flows)
+        return time.perf_counter() - started
+
+
+async def run_size(size, users, review_share, latency, concurrency):
+    import config
+    from bot import build_application
+    from benchmarks.stubbot import build_stub_application
+
+    write_dataset(os.getcwd(), size)
+    # Как и база, окно обработанных апдейтов (dedupe.py) у каждого прогона свое:
+    # ID апдейтов в новом прогоне снова начинаются с 1
+    if os.path.exists(config.get_settings().dedupe_file):
+        os.unlink(config.get_settings().dedupe_file)
+
+    application, request = build_stub_application(
+        build_application, latency=latency, concurrent_updates=concurrency)
+    benchmark = FlowBenchmark(application, config.ADMIN_ID)
+
+    async with application:
+        await application.start()
+        elapsed = await benchmark.run(users, review_share)
+        await application.stop()
+
+    all_latencies = benchmark.latencies['order'] + benchmark.latencies['review']
+    return {
+        'db_size': size,
+        'users': users,
+        'concurrent_updates': concurrency,
+        'updates': benchmark.processed,
+        'seconds': round(elapsed, 3),
+        'updates_per_sec': round(benchmark.processed / elapsed, 1),
+        'latency_ms': {
+            'p50': round(percentile(all_latencies, 50) * 1000, 2),
+            'p99': round(percentile(all_latencies, 99) * 1000, 2),
+        },
+        'handler_ms': {
+            'p50': round(percentile(benchmark.handler_times, 50) * 1000, 2),
+            'p99': round(percentile(benchmark.handler_times, 99) * 1000, 2),
+        },
+        'flows': {
+            flow: {
+                'updates': len(values),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+            }
+            for flow, values in benchmark.latencies.items()
+        },
+        'api_calls': request.call_counts,
+    }
+
+
+def print_result(result):
+    print(f"\n📦 База: {result['db_size']:,} записей | 👥 Пользователей: {result['users']} | "
+          f"⚡ Параллельно: {result['concurrent_updates'] or 'нет'}")
+    print(f"   Апдейтов: {result['updates']} за {result['seconds']} с "
+          f"→ {result['updates_per_sec']} апдейтов/с")
+    print(f"   Задержка (очередь + обработка): p50 {result['latency_ms']['p50']} мс, "
+          f"p99 {result['latency_ms']['p99']} мс")
+    print(f"   Время обработчика: p50 {result['handler_ms']['p50']} мс, "
+          f"p99 {result['handler_ms']['p99']} мс")
+    for flow, stats in result['flows'].items():
+        print(f"   /{flow}: {stats['updates']} апдейтов, p50 {stats['p50_ms']} мс, p99 {stats['p99_ms']} мс")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест диалогов /order и /review")
+    parser.add_argument('--users', type=int, default=1000, help="число одновременных пользователей")
+    parser.add_argument('--sizes', default='1000', help="размеры базы через запятую, например 1000,100000,1000000")
+    parser.add_argument('--review-share', type=float, default=0.3, help="доля пользователей в диалоге /review")
+    parser.add_argument('--latency', type=float, default=0.05, help="искусственная задержка Bot API, с")
+    parser.add_argument('--concurrency', default='0,32',
+                        help="значения concurrent_updates через запятую (0 - последовательная обработка)")
+    parser.add_argument('--json', help="путь для сохранения результатов в JSON")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    concurrency_levels = [int(level) for level in args.concurrency.split(',') if level]
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, project_root)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench_flows_') as workdir:
+        os.chdir(workdir)
+        import logging
+        logging.disable(logging.INFO)
+
+        for size in sizes:
+            baseline = None
+            for concurrency in concurrency_levels:
+                result = asyncio.run(run_size(size, args.users, args.review_share, args.latency, concurrency))
+                print_result(result)
+                results.append(result)
+                if baseline is None:
+                    baseline = result
+                else:
+                    gain = result['updates_per_sec'] / baseline['updates_per_sec']
+                    print(f"   🚀 Пропускная способность x{gain:.1f} относительно "
+                          f"concurrent_updates={baseline['concurrent_updates']}")
+        os.chdir(project_root)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+
+if __name__ == '__main__':
+    main()
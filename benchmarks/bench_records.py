@@ -0,0 +1,91 @@
+"""
+Память под записи в кэше: словари из JSON против объектов records.py.
+
+Генерирует заявки и отзывы через benchmarks.datagen, разбирает их так же, как
+это делает database.py при чтении файла, и через tracemalloc измеряет, сколько
+памяти занимают 100k записей в каждом представлении. Заодно замеряет время
+преобразования и доступа к полям.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_records --count 100000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from benchmarks.datagen import generate_requests, generate_reviews
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _measure_memory(build):
+    """Размер объектов, созданных build() и оставшихся живыми (байты), и сам результат"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return size, result
+
+
+def bench_kind(title, record_type, source, count):
+    # Как после json.load: каждая строка каждой записи - отдельный объект
+    text = json.dumps(source, ensure_ascii=False)
+
+    dict_size, dicts = _measure_memory(lambda: json.loads(text))
+    slotted_size, slotted = _measure_memory(lambda: [record_type.from_dict(record) for record in json.loads(text)])
+
+    # Время - отдельно, без tracemalloc, который сильно замедляет выделение памяти
+    started = time.perf_counter()
+    for record in dicts:
+        record_type.from_dict(record)
+    from_dict_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for record in slotted:
+        record.to_dict()
+    to_dict_s = time.perf_counter() - started
+
+    def access(records, *fields):
+        started = time.perf_counter()
+        for record in records:
+            for field in fields:
+                record[field]
+        return (time.perf_counter() - started) / count * 1e9
+
+    plain = ('status', 'user_id')
+
+    print(f"\n📦 {title}: {count:,}")
+    print(f"   dict:     {dict_size / 2 ** 20:8.1f} МБ  ({dict_size / count:6.0f} байт на запись)")
+    print(f"   {record_type.__name__ + ':':9} {slotted_size / 2 ** 20:8.1f} МБ  ({slotted_size / count:6.0f} байт на запись)"
+          f"  - в {dict_size / slotted_size:.1f} раза меньше")
+    print(f"   from_dict {from_dict_s:.2f} с, to_dict {to_dict_s:.2f} с")
+    print(f"   record['status'], record['user_id']: dict {access(dicts, *plain):.0f} нс, "
+          f"{record_type.__name__} {access(slotted, *plain):.0f} нс на запись")
+    print(f"   record['created_at'] (строка из числа): dict {access(dicts, 'created_at'):.0f} нс, "
+          f"{record_type.__name__} {access(slotted, 'created_at'):.0f} нс на запись")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Память под записи: dict против records.py")
+    parser.add_argument('--count', type=int, default=100000, help="число заявок и отзывов")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, PROJECT_ROOT)
+    from records import Request, Review
+
+    bench_kind("Заявки", Request, list(generate_requests(args.count, seed=args.seed)), args.count)
+    bench_kind("Отзывы", Review, list(generate_reviews(args.count, seed=args.seed + 1)), args.count)
+
+
+if __name__ == '__main__':
+    main()
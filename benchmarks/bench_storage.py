@@ -0,0 +1,144 @@
+"""
+Микро-бенчмарки хранилища database.py.
+
+Для каждого размера базы генерирует данные через benchmarks.datagen и замеряет
+время отдельных функций. Результат пишется в JSON, который можно сравнить
+с отчетом предыдущей версии через --compare.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_storage --sizes 1000,10000,100000 --output storage.json
+    python -m benchmarks.bench_storage --sizes 1000 --compare storage.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.datagen import BASE_USER_ID, write_dataset
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _summary(timings):
+    ordered = sorted(timings)
+    count = len(ordered)
+    return {
+        'calls': count,
+        'mean_ms': round(sum(ordered) / count * 1000, 3),
+        'p50_ms': round(ordered[count // 2] * 1000, 3),
+        'p99_ms': round(ordered[min(count - 1, int(count * 0.99))] * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+    }
+
+
+def _measure(func, arguments):
+    timings = []
+    for args, kwargs in arguments:
+        started = time.perf_counter()
+        func(*args, **kwargs)
+        timings.append(time.perf_counter() - started)
+    return _summary(timings)
+
+
+def bench_size(size, repeat, seed):
+    """Замеряет функции database.py на базе из size заявок и size отзывов"""
+    import database
+
+    write_dataset(os.getcwd(), size, seed=seed)
+    rng = random.Random(seed)
+    users = max(size // 3, 1)
+
+    new_request = {
+        'user_id': BASE_USER_ID, 'username': 'bench', 'product': 'iPhone 15 Pro 256GB',
+        'known_price': 129990, 'city': 'Казань', 'contact': '+79990000000'
+    }
+
+    results = {}
+    results['save_request'] = _measure(database.save_request, [((dict(new_request),), {})] * repeat)
+    results['get_request'] = _measure(
+        database.get_request, [((rng.randint(1, size),), {}) for _ in range(repeat)])
+    results['get_user_requests'] = _measure(
+        database.get_user_requests, [((BASE_USER_ID + rng.randrange(users),), {}) for _ in range(repeat)])
+    results['update_request'] = _measure(
+        database.update_request,
+        [((rng.randint(1, size),), {'status': 'in_progress'}) for _ in range(repeat)])
+    results['get_approved_reviews'] = _measure(database.get_approved_reviews, [((), {'limit': 5})] * repeat)
+    results['get_statistics'] = _measure(database.get_statistics, [((), {})] * repeat)
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_reports(old, new):
+    """Печатает отношение p50 нового отчета к старому по каждой функции"""
+    print(f"\n📊 Сравнение {old.get('revision')} → {new.get('revision')} (p50, мс)")
+    for size, functions in new['results'].items():
+        old_functions = old['results'].get(size)
+        if not old_functions:
+            continue
+        print(f"\n   База {int(size):,} записей:")
+        for name, stats in functions.items():
+            if name not in old_functions:
+                continue
+            before, after = old_functions[name]['p50_ms'], stats['p50_ms']
+            ratio = after / before if before else float('inf')
+            marker = '🔺' if ratio > 1.2 else '🟢' if ratio < 0.8 else '  '
+            print(f"   {marker} {name:22} {before:10.3f} → {after:10.3f}  (x{ratio:.2f})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микро-бенчмарки database.py")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="размеры базы через запятую")
+    parser.add_argument('--repeat', type=int, default=20, help="число вызовов каждой функции")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="путь для JSON отчета")
+    parser.add_argument('--compare', help="JSON отчет предыдущей версии для сравнения")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, PROJECT_ROOT)
+    report = {
+        'revision': _git_revision(),
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix='bench_storage_') as workdir:
+        os.chdir(workdir)
+        for size in [int(size) for size in args.sizes.split(',') if size]:
+            results = bench_size(size, args.repeat, args.seed)
+            report['results'][str(size)] = results
+
+            print(f"\n📦 База: {size:,} заявок и отзывов")
+            for name, stats in results.items():
+                print(f"   {name:22} mean {stats['mean_ms']:10.3f} мс   p50 {stats['p50_ms']:10.3f} мс   "
+                      f"p99 {stats['p99_ms']:10.3f} мс")
+        os.chdir(PROJECT_ROOT)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчет сохранен в {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_reports(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Детерминированный генератор заявок и отзывов для бенчмарков.
+
+Распределения полей приближены к реальным: есть постоянные клиенты,
+популярные города и товары встречаются чаще, большинство заявок закрыто.
+"""
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+COMMISSION_RATE = 0.4
+BASE_USER_ID = 10_000_000
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+PRODUCTS = [
+    'Телевизор Samsung QE55Q70BAUXRU', 'iPhone 15 Pro 256GB', 'iPhone 15 128GB',
+    'Пылесос Dyson V15 Detect', 'Ноутбук ASUS VivoBook 15 X1504', 'Кофемашина DeLonghi Magnifica S',
+    'Холодильник LG GA-B509', 'Смартфон Xiaomi Redmi Note 13', 'Наушники Sony WH-1000XM5',
+    'Стиральная машина Bosch WAN28281', 'PlayStation 5 Slim', 'Робот-пылесос Roborock S8',
+    'Apple Watch Series 9', 'Микроволновка Samsung MS23K3513', 'Шины Michelin X-Ice North 4',
+]
+PRODUCT_SUFFIXES = ['', '', '', ' черный', ' белый', ' серый', ' 2024', ' новый']
+CITIES = [
+    ('Москва', 35), ('Санкт-Петербург', 15), ('Казань', 6), ('Новосибирск', 6),
+    ('Екатеринбург', 6), ('Нижний Новгород', 4), ('Краснодар', 5), ('Самара', 3),
+    ('Ростов-на-Дону', 4), ('Уфа', 3), ('Челябинск', 3), ('Омск', 2), ('Пермь', 2),
+    ('Воронеж', 2), ('Тула', 2), ('Ёлкино', 2),
+]
+REQUEST_STATUSES = [('new', 8), ('in_progress', 7), ('completed', 55), ('cancelled', 20), ('rejected', 10)]
+REVIEW_STATUSES = [('approved', 70), ('pending', 8), ('rejected', 22)]
+RATINGS = [(5, 55), (4, 25), (3, 10), (2, 5), (1, 5)]
+REVIEW_PHRASES = [
+    'Отличный сервис, нашли дешевле на {pct}%!', 'Доставка быстрая, товар оригинальный.',
+    'Сэкономил {economy} рублей, спасибо!', 'Ответили за пару часов, все понятно.',
+    'Долго искали, но результат того стоил.', 'Цена оказалась ниже, чем на маркетплейсе.',
+    'Рекомендую друзьям, буду обращаться еще.', 'Не удалось найти дешевле, но вежливо объяснили.',
+]
+
+
+def _weighted(rng, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights=weights)[0]
+
+
+def _user_id(rng, users):
+    # Постоянные клиенты (5% пользователей) оставляют около трети заявок
+    if rng.random() < 0.3:
+        return BASE_USER_ID + rng.randrange(max(users // 20, 1))
+    return BASE_USER_ID + rng.randrange(users)
+
+
+def _timestamps(rng, index, total, start, span):
+    """Возрастающие по id даты создания с небольшим разбросом"""
+    created = start + span * (index / max(total, 1)) + timedelta(seconds=rng.randrange(600))
+    updated = created + timedelta(minutes=rng.randrange(5, 60 * 48))
+    return created, updated
+
+
+def generate_requests(count, seed=42, users=None, start=None, span_days=730):
+    """Генерирует count заявок в формате database.save_request"""
+    rng = random.Random(seed)
+    users = users or max(count // 3, 1)
+    start = start or datetime(2024, 1, 1)
+    span = timedelta(days=span_days)
+
+    for index in range(1, count + 1):
+        created, updated = _timestamps(rng, index, count, start, span)
+        status = _weighted(rng, REQUEST_STATUSES)
+        known_price = int(rng.lognormvariate(10.2, 0.9)) // 10 * 10 + 990
+        user_id = _user_id(rng, users)
+
+        found_price = economy = commission = None
+        if status == 'completed':
+            found_price = int(known_price * rng.uniform(0.7, 0.95))
+            economy = known_price - found_price
+            commission = economy * COMMISSION_RATE
+
+        yield {
+            'id': index,
+            'user_id': user_id,
+            'username': f'user{user_id}' if rng.random() < 0.8 else '',
+            'product': rng.choice(PRODUCTS) + rng.choice(PRODUCT_SUFFIXES),
+            'known_price': known_price,
+            'city': _weighted(rng, CITIES),
+            'contact': f'+7{rng.randrange(900, 999)}{rng.randrange(10 ** 7):07d}',
+            'status': status,
+            'created_at': created.strftime(TIME_FORMAT),
+            'updated_at': updated.strftime(TIME_FORMAT),
+            'found_price': found_price,
+            'economy': economy,
+            'commission': commission,
+            'notes': ''
+        }
+
+
+def generate_reviews(count, seed=43, users=None, start=None, span_days=730):
+    """Генерирует count отзывов в формате database.save_review"""
+    rng = random.Random(seed)
+    users = users or max(count // 2, 1)
+    start = start or datetime(2024, 1, 1)
+    span = timedelta(days=span_days)
+
+    for index in range(1, count + 1):
+        created, published = _timestamps(rng, index, count, start, span)
+        status = _weighted(rng, REVIEW_STATUSES)
+        user_id = _user_id(rng, users)
+        text = ' '.join(
+            rng.choice(REVIEW_PHRASES).format(pct=rng.randrange(5, 40), economy=rng.randrange(500, 30000))
+            for _ in range(rng.randint(1, 4))
+        )
+
+        yield {
+            'id': index,
+            'user_id': user_id,
+            'username': f'user{user_id}' if rng.random() < 0.8 else '',
+            'review_text': text,
+            'rating': _weighted(rng, RATINGS),
+            'status': status,
+            'created_at': created.strftime(TIME_FORMAT),
+            'published_at': published.strftime(TIME_FORMAT) if status == 'approved' else None,
+            'published_message_id': index if status == 'approved' else None,
+            'admin_notes': ''
+        }
+
+
+def write_dataset(directory, requests_count, reviews_count=None, seed=42):
+    """Записывает requests.json и reviews.json в directory, возвращает пути к файлам"""
+    if reviews_count is None:
+        reviews_count = requests_count
+
+    requests_path = os.path.join(directory, 'requests.json')
+    reviews_path = os.path.join(directory, 'reviews.json')
+
+    with open(requests_path, 'w', encoding='utf-8') as f:
+        json.dump({'requests': list(generate_requests(requests_count, seed=seed))}, f, ensure_ascii=False)
+    with open(reviews_path, 'w', encoding='utf-8') as f:
+        json.dump({'reviews': list(generate_reviews(reviews_count, seed=seed + 1))}, f, ensure_ascii=False)
+
+    return requests_path, reviews_path
@@ -0,0 +1,599 @@
+"""
+Локальный заменитель Bot API для сквозных нагрузочных тестов.
+
+Настоящий Bot API нагружать нельзя, а заглушка stubbot.py подменяет сетевой
+слой внутри процесса и не проверяет ни HTTP-клиент, ни long polling, ни
+вебхуки, ни повторы после 429. Этот сервер отвечает по HTTP на методы,
+которыми пользуется бот (getUpdates, setWebhook, sendMessage,
+editMessageText, answerCallbackQuery, sendDocument и служебные), и сам
+играет роль пользователей:
+
+- задержка каждого ответа --latency с разбросом --jitter;
+- ошибки 429 с retry_after: случайно (--flood-rate) и при превышении
+  лимитов отправки, как у Telegram (--rate-limit всего и --chat-rate-limit
+  на чат, сообщений в секунду);
+- --users сценарных пользователей проходят /order или /review (доля
+  --review-share): отправляют шаг, ждут ответа бота, думают --think секунд и
+  отправляют следующий; контакт приходит как contact, оценка - нажатием
+  кнопки (callback_query). Администратор (--admin-id) нажимает кнопки
+  approve_/reject_/op_take_ в пришедших ему уведомлениях.
+
+Апдейты отдаются через getUpdates или, если бот вызвал setWebhook, POST на
+адрес вебхука. По Ctrl+C (или сразу, когда все сценарии пройдены, с
+--exit-when-done) печатается отчет: вызовы по методам, выданные 429,
+пройденные сценарии и время ответа бота пользователю.
+
+Запуск из корня проекта (сервер и бот в разных терминалах):
+    python -m benchmarks.fake_telegram --port 8081 --users 200 --latency 0.03 --flood-rate 0.01
+    BOT_API_URL=http://127.0.0.1:8081 BOT_TOKEN=123456:FAKE ADMIN_ID=1 python bot.py
+Вебхук и несколько процессов:
+    BOT_API_URL=http://127.0.0.1:8081 WEBHOOK_URL=http://127.0.0.1:8443 ... python supervisor.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import sys
+import time
+from collections import deque
+from urllib.parse import parse_qsl
+
+from benchmarks.bench_flows import percentile
+from benchmarks.datagen import CITIES, PRODUCTS
+
+BOT_USER = {'id': 100000, 'is_bot': True, 'first_name': 'GiperVygoda', 'username': 'gipervygoda_bot'}
+
+# Методы отправки: на них действуют лимиты и --flood-rate
+SEND_METHODS = {'sendMessage', 'editMessageText', 'sendDocument', 'sendPhoto', 'copyMessage', 'forwardMessage'}
+
+# Методы, которым достаточно ответить true
+TRUE_METHODS = {
+    'answerCallbackQuery', 'answerInlineQuery', 'setMyCommands', 'deleteMyCommands', 'deleteMessage',
+    'sendChatAction', 'close', 'logOut', 'setChatMenuButton',
+}
+
+# Параметры, которые PTB передает JSON-строкой
+_JSON_PARAMS = {'reply_markup', 'allowed_updates', 'entities', 'commands', 'results'}
+_INT_PARAMS = {'chat_id', 'message_id', 'offset', 'limit', 'timeout', 'cache_time', 'retry_after'}
+
+
+def decode_params(params):
+    """Значения формы Bot API: JSON-поля и числа разбираются, остальное - строки"""
+    decoded = {}
+    for key, value in params.items():
+        if key in _JSON_PARAMS:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        elif key in _INT_PARAMS:
+            try:
+                value = int(value)
+            except ValueError:
+                pass
+        decoded[key] = value
+    return decoded
+
+
+def parse_multipart(body, content_type):
+    """Поля multipart/form-data; у файлов запоминается только размер"""
+    boundary = content_type.split('boundary=', 1)[1].strip('"').encode('latin-1')
+    fields = {}
+    for part in body.split(b'--' + boundary):
+        head, _, content = part.partition(b'\r\n\r\n')
+        if not content:
+            continue
+        content = content[:-2] if content.endswith(b'\r\n') else content
+        disposition = next((line for line in head.decode('utf-8', 'replace').split('\r\n')
+                            if line.lower().startswith('content-disposition')), '')
+        attributes = dict(item.strip().split('=', 1) for item in disposition.split(';')[1:] if '=' in item)
+        name = attributes.get('name', '').strip('"')
+        if 'filename' in attributes:
+            fields[name] = {'file_name': attributes['filename'].strip('"'), 'file_size': len(content)}
+        elif name:
+            fields[name] = content.decode('utf-8', 'replace')
+    return fields
+
+
+class FloodControl:
+    """Лимиты отправки Telegram: скользящее окно в 1 с на весь бот и на чат"""
+
+    def __init__(self, rate_limit=0, chat_rate_limit=0, flood_rate=0.0, retry_after=1, rng=None):
+        self.rate_limit = rate_limit
+        self.chat_rate_limit = chat_rate_limit
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.rng = rng or random.Random()
+        self._sent = deque()
+        self._chat_sent = {}
+        self.injected = 0
+        self.limited = 0
+
+    @staticmethod
+    def _wait(window, limit, now):
+        while window and now - window[0] >= 1:
+            window.popleft()
+        if len(window) < limit:
+            return 0
+        return 1 - (now - window[0])
+
+    def check(self, chat_id, now=None):
+        """Секунды retry_after, если отправку нужно отклонить, иначе 0 (и отправка учитывается)"""
+        now = time.monotonic() if now is None else now
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            self.injected += 1
+            return self.retry_after
+        chat_window = self._chat_sent.setdefault(chat_id, deque())
+        wait = 0
+        if self.rate_limit:
+            wait = self._wait(self._sent, self.rate_limit, now)
+        if self.chat_rate_limit:
+            wait = max(wait, self._wait(chat_window, self.chat_rate_limit, now))
+        if wait > 0:
+            self.limited += 1
+            return max(math.ceil(wait), 1)
+        self._sent.append(now)
+        chat_window.append(now)
+        if len(self._chat_sent) > 10000:
+            # Забываем чаты без отправок за последнюю секунду
+            self._chat_sent = {chat: window for chat, window in self._chat_sent.items()
+                               if window and now - window[-1] < 1}
+        return 0
+
+
+# ========== СОСТОЯНИЕ СЕРВЕРА ==========
+class FakeTelegram:
+    """Апдейты для бота, ответы на методы Bot API и почтовые ящики пользователей"""
+
+    def __init__(self, latency=0.0, jitter=0.0, flood=None, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood = flood or FloodControl()
+        self.rng = random.Random(seed)
+        self.updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+        self._new_updates = asyncio.Condition()
+        self.webhook = None
+        self.webhook_secret = None
+        self.webhook_errors = 0
+        self._webhook_client = None
+        # chat_id -> очередь сообщений бота этому чату
+        self.inboxes = {}
+        self.calls = {}
+        self.delivered = 0
+
+    # ----- апдейты от пользователей -----
+    def user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+
+    def message_update(self, user_id, text=None, contact=None):
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self.user(user_id),
+        }
+        if contact:
+            message['contact'] = {'phone_number': contact, 'first_name': f'User{user_id}', 'user_id': user_id}
+        else:
+            message['text'] = text
+            if text.startswith('/'):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'message': message}
+
+    def callback_update(self, user_id, message, data):
+        return {'callback_query': {
+            'id': str(next(self._callback_ids)),
+            'from': self.user(user_id),
+            'chat_instance': str(message['chat']['id']),
+            'data': data,
+            'message': message,
+        }}
+
+    async def push(self, update):
+        """Отдает апдейт боту: в очередь getUpdates или POST на вебхук"""
+        update['update_id'] = next(self._update_ids)
+        self.delivered += 1
+        if self.webhook:
+            await self._post_webhook(update)
+            return
+        async with self._new_updates:
+            self.updates.append(update)
+            self._new_updates.notify_all()
+
+    async def _post_webhook(self, update):
+        import httpx
+
+        if self._webhook_client is None:
+            self._webhook_client = httpx.AsyncClient(timeout=30)
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret} if self.webhook_secret else {}
+        # Telegram повторяет доставку, пока вебхук не ответит 200
+        for attempt in range(5):
+            try:
+                response = await self._webhook_client.post(self.webhook, json=update, headers=headers)
+                if response.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            self.webhook_errors += 1
+            await asyncio.sleep(min(2 ** attempt, 10))
+
+    async def close(self):
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+
+    # ----- методы Bot API -----
+    async def call(self, method, params):
+        """Ответ на вызов метода: (HTTP статус, JSON ответа)"""
+        self.calls[method] = self.calls.get(method, 0) + 1
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay and method != 'getUpdates':
+            await asyncio.sleep(delay)
+
+        if method in SEND_METHODS:
+            retry_after = self.flood.check(params.get('chat_id'))
+            if retry_after:
+                return 429, {'ok': False, 'error_code': 429,
+                             'description': f'Too Many Requests: retry after {retry_after}',
+                             'parameters': {'retry_after': retry_after}}
+
+        handler = getattr(self, f'_method_{method}', None)
+        if handler is not None:
+            return 200, {'ok': True, 'result': await handler(params)}
+        if method in TRUE_METHODS:
+            return 200, {'ok': True, 'result': True}
+        return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'}
+
+    async def _method_getMe(self, params):
+        return BOT_USER
+
+    async def _method_getUpdates(self, params):
+        offset = params.get('offset') or 0
+        limit = params.get('limit') or 100
+        timeout = params.get('timeout') or 0
+        if offset:
+            # Как в Telegram: offset подтверждает все апдейты до него
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        async with self._new_updates:
+            if not self.updates and timeout:
+                try:
+                    await asyncio.wait_for(self._new_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        return self.updates[:limit]
+
+    async def _method_setWebhook(self, params):
+        self.webhook = params.get('url') or None
+        self.webhook_secret = params.get('secret_token') or None
+        return True
+
+    async def _method_deleteWebhook(self, params):
+        self.webhook = self.webhook_secret = None
+        if params.get('drop_pending_updates') in (True, 'true', 'True'):
+            self.updates = []
+        return True
+
+    async def _method_getWebhookInfo(self, params):
+        return {'url': self.webhook or '', 'has_custom_certificate': False, 'pending_update_count': len(self.updates)}
+
+    def _message(self, params, **extra):
+        chat_id = params.get('chat_id', 0)
+        chat = ({'id': chat_id, 'type': 'private'} if isinstance(chat_id, int)
+                else {'id': -1001, 'type': 'channel', 'username': str(chat_id).lstrip('@')})
+        message = {
+            'message_id': params.get('message_id') or next(self._message_ids),
+            'date': int(time.time()),
+            'chat': chat,
+            'from': BOT_USER,
+            **extra,
+        }
+        if isinstance(params.get('reply_markup'), dict) and 'inline_keyboard' in params['reply_markup']:
+            message['reply_markup'] = params['reply_markup']
+        inbox = self.inboxes.get(chat_id)
+        if inbox is not None:
+            inbox.put_nowait(message)
+        return message
+
+    async def _method_sendMessage(self, params):
+        return self._message(params, text=params.get('text', ''))
+
+    async def _method_editMessageText(self, params):
+        if params.get('inline_message_id'):
+            return True
+        return self._message(params, text=params.get('text', ''))
+
+    async def _method_editMessageReplyMarkup(self, params):
+        if params.get('inline_message_id'):
+            return True
+        return self._message(params)
+
+    async def _method_sendDocument(self, params):
+        document = params.get('document')
+        document = document if isinstance(document, dict) else {'file_name': 'document'}
+        return self._message(params, document={'file_id': f'doc{next(self._message_ids)}',
+                                               'file_unique_id': 'doc', **document})
+
+
+# ========== HTTP ==========
+class ApiServer:
+    """Минимальный HTTP/1.1 сервер: POST /bot<токен>/<метод>"""
+
+    def __init__(self, telegram):
+        self.telegram = telegram
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    _, path, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get('content-length', 0) or 0))
+                status, payload = await self.dispatch(path, headers, body)
+                payload = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode('latin-1')
+                    + payload
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Отмена - остановка сервера при открытом соединении (long polling)
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, path, headers, body):
+        path, _, query = path.partition('?')
+        parts = path.strip('/').split('/')
+        if len(parts) != 2 or not parts[0].startswith('bot'):
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+
+        content_type = headers.get('content-type', '')
+        if content_type.startswith('multipart/form-data'):
+            params = parse_multipart(body, content_type)
+        elif content_type.startswith('application/json'):
+            params = json.loads(body or b'{}')
+        else:
+            params = dict(parse_qsl(body.decode('utf-8') + ('&' + query if query else '')))
+        return await self.telegram.call(parts[1], decode_params(params))
+
+
+# ========== СЦЕНАРНЫЕ ПОЛЬЗОВАТЕЛИ ==========
+class ScriptedUsers:
+    """Пользователи, проходящие /order и /review, и администратор, нажимающий кнопки"""
+
+    def __init__(self, telegram, users, review_share=0.3, think=0.5, ramp=5.0, reply_timeout=30.0,
+                 admin_id=1, first_user_id=10000, seed=1):
+        self.telegram = telegram
+        self.users = users
+        self.review_share = review_share
+        self.think = think
+        self.ramp = ramp
+        self.reply_timeout = reply_timeout
+        self.admin_id = admin_id
+        self.first_user_id = first_user_id
+        self.seed = seed
+        # шаг сценария -> время от апдейта до первого ответа бота
+        self.response_times = {}
+        self.completed = {'order': 0, 'review': 0}
+        self.failed = {'order': 0, 'review': 0}
+        self.admin_clicks = 0
+
+    async def _step(self, user_id, inbox, name, update):
+        """Отправляет апдейт и ждет первого ответа бота; None - бот не ответил"""
+        while not inbox.empty():
+            inbox.get_nowait()
+        started = time.perf_counter()
+        await self.telegram.push(update)
+        try:
+            reply = await asyncio.wait_for(inbox.get(), self.reply_timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.response_times.setdefault(name, []).append(time.perf_counter() - started)
+        return reply
+
+    async def _think(self, rng):
+        if self.think:
+            await asyncio.sleep(rng.uniform(0, 2 * self.think))
+
+    async def order_flow(self, user_id, inbox, rng):
+        t = self.telegram
+        steps = [
+            ('/order', t.message_update(user_id, '/order')),
+            ('product', t.message_update(user_id, rng.choice(PRODUCTS))),
+            ('link', t.message_update(user_id, f'https://www.wildberries.ru/catalog/{rng.randrange(10 ** 8)}/detail.aspx')),
+            ('price', t.message_update(user_id, str(rng.randrange(1000, 300000)))),
+            ('city', t.message_update(user_id, rng.choice(CITIES)[0])),
+            ('contact', t.message_update(user_id, contact=f'7999{user_id % 10 ** 7:07d}')),
+        ]
+        for name, update in steps:
+            if await self._step(user_id, inbox, name, update) is None:
+                return False
+            await self._think(rng)
+        return True
+
+    async def review_flow(self, user_id, inbox, rng):
+        t = self.telegram
+        if await self._step(user_id, inbox, '/review', t.message_update(user_id, '/review')) is None:
+            return False
+        await self._think(rng)
+        text = 'Отличный сервис, нашли товар намного дешевле, чем в магазине!'
+        keyboard = await self._step(user_id, inbox, 'review_text', t.message_update(user_id, text))
+        if keyboard is None or 'reply_markup' not in keyboard:
+            return False
+        await self._think(rng)
+        rating = f'rating_{rng.randint(1, 5)}'
+        return await self._step(user_id, inbox, 'rating', t.callback_update(user_id, keyboard, rating)) is not None
+
+    async def run_user(self, index):
+        rng = random.Random(self.seed + index)
+        user_id = self.first_user_id + index
+        inbox = self.telegram.inboxes[user_id] = asyncio.Queue()
+        await asyncio.sleep(self.ramp * index / max(self.users, 1))
+        flow = 'review' if rng.random() < self.review_share else 'order'
+        try:
+            ok = await (self.review_flow if flow == 'review' else self.order_flow)(user_id, inbox, rng)
+        finally:
+            del self.telegram.inboxes[user_id]
+        (self.completed if ok else self.failed)[flow] += 1
+
+    async def run_admin(self):
+        """Нажимает кнопки модерации и взятия заявки в сообщениях администратору"""
+        inbox = self.telegram.inboxes[self.admin_id] = asyncio.Queue()
+        rng = random.Random(self.seed)
+        clicked = set()
+        while True:
+            message = await inbox.get()
+            buttons = [button.get('callback_data') or ''
+                       for row in message.get('reply_markup', {}).get('inline_keyboard', []) for button in row]
+            buttons = [data for data in buttons if data not in clicked]
+            choices = [data for data in buttons if data.startswith('op_take_')]
+            if not choices:
+                decisions = [data for data in buttons if data.startswith(('approve_', 'reject_'))]
+                # Одобряется примерно 80% отзывов
+                choices = decisions[:1] if rng.random() < 0.8 else decisions[-1:]
+            if not choices:
+                continue
+            clicked.add(choices[0])
+            await self._think(rng)
+            self.admin_clicks += 1
+            await self.telegram.push(self.telegram.callback_update(self.admin_id, message, choices[0]))
+
+    async def run(self):
+        admin = asyncio.get_running_loop().create_task(self.run_admin())
+        try:
+            await asyncio.gather(*(self.run_user(index) for index in range(self.users)))
+        finally:
+            admin.cancel()
+
+
+# ========== ОТЧЕТ ==========
+def report(telegram, users, elapsed):
+    result = {
+        'seconds': round(elapsed, 1),
+        'updates_delivered': telegram.delivered,
+        'api_calls': dict(sorted(telegram.calls.items(), key=lambda item: -item[1])),
+        'flood_injected': telegram.flood.injected,
+        'rate_limited': telegram.flood.limited,
+        'webhook_errors': telegram.webhook_errors,
+    }
+    if users is not None:
+        result['flows_completed'] = users.completed
+        result['flows_failed'] = users.failed
+        result['admin_clicks'] = users.admin_clicks
+        result['response_ms'] = {
+            step: {
+                'count': len(values),
+                'p50': round(percentile(values, 50) * 1000, 1),
+                'p95': round(percentile(values, 95) * 1000, 1),
+                'p99': round(percentile(values, 99) * 1000, 1),
+            }
+            for step, values in users.response_times.items()
+        }
+    return result
+
+
+def print_report(result):
+    print(f"\n📡 За {result['seconds']} с доставлено апдейтов: {result['updates_delivered']}")
+    print("   Вызовы Bot API: " + ', '.join(f"{method} {count}" for method, count in result['api_calls'].items()))
+    print(f"   429: случайных {result['flood_injected']}, по лимитам {result['rate_limited']}; "
+          f"ошибок вебхука {result['webhook_errors']}")
+    if 'response_ms' in result:
+        print(f"   Сценарии: пройдено {result['flows_completed']}, не пройдено {result['flows_failed']}, "
+              f"нажатий администратора {result['admin_clicks']}")
+        for step, stats in result['response_ms'].items():
+            print(f"   {step}: {stats['count']} ответов, p50 {stats['p50']} мс, p95 {stats['p95']} мс, "
+                  f"p99 {stats['p99']} мс")
+
+
+async def serve(args, results):
+    flood = FloodControl(args.rate_limit, args.chat_rate_limit, args.flood_rate, args.retry_after,
+                         rng=random.Random(args.seed))
+    telegram = FakeTelegram(args.latency, args.jitter, flood, seed=args.seed)
+    server = await asyncio.start_server(ApiServer(telegram).handle, args.host, args.port)
+    print(f"🛰 Bot API: BOT_API_URL=http://{args.host}:{args.port}")
+
+    users = None
+    if args.users:
+        users = ScriptedUsers(telegram, args.users, args.review_share, args.think, args.ramp,
+                              args.reply_timeout, args.admin_id, seed=args.seed)
+    started = time.perf_counter()
+    try:
+        if users is not None:
+            # Пользователи начинают, когда бот начал забирать апдейты или поставил вебхук
+            while not telegram.webhook and not telegram.calls.get('getUpdates'):
+                await asyncio.sleep(0.1)
+            started = time.perf_counter()
+            scenario = users.run()
+            if args.exit_when_done:
+                await scenario
+            else:
+                await asyncio.gather(scenario, asyncio.Event().wait())
+        else:
+            await asyncio.Event().wait()
+    finally:
+        # Отчет нужен и после Ctrl+C, когда задача отменена
+        results.append(report(telegram, users, time.perf_counter() - started))
+        server.close()
+        await telegram.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный заменитель Bot API со сценарными пользователями")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа на вызов, с")
+    parser.add_argument('--jitter', type=float, default=0.0, help="случайная добавка к задержке, до N с")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="доля отправок, получающих 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after случайных 429, с")
+    parser.add_argument('--rate-limit', type=int, default=30, help="отправок в секунду на бота (0 - без лимита)")
+    parser.add_argument('--chat-rate-limit', type=int, default=0, help="отправок в секунду на чат (0 - без лимита)")
+    parser.add_argument('--users', type=int, default=0, help="число сценарных пользователей")
+    parser.add_argument('--review-share', type=float, default=0.3, help="доля пользователей в диалоге /review")
+    parser.add_argument('--think', type=float, default=0.5, help="средняя пауза пользователя между шагами, с")
+    parser.add_argument('--ramp', type=float, default=5.0, help="за сколько секунд подключаются все пользователи")
+    parser.add_argument('--reply-timeout', type=float, default=30.0, help="сколько ждать ответа бота, с")
+    parser.add_argument('--admin-id', type=int, default=1, help="ID администратора бота (ADMIN_ID)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--exit-when-done', action='store_true', help="завершиться, когда сценарии пройдены")
+    parser.add_argument('--json', help="путь для сохранения отчета в JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    try:
+        asyncio.run(serve(args, results))
+    except KeyboardInterrupt:
+        pass
+    if not results:
+        return 0
+    result = results[0]
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчет сохранен в {args.json}")
+    return 1 if sum(result.get('flows_failed', {}).values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""
+Воспроизведение записанных апдейтов (recorder.py) через настоящие обработчики.
+
+Собирает Application из bot.build_application() поверх заглушки Bot API и
+подает в очередь апдейтов журнал RECORD_UPDATES_DIR с исходными интервалами,
+ускоренными в --speed раз (max - без пауз). Отчет: пропускная способность,
+задержка от постановки в очередь до конца обработки и время обработчиков
+по видам апдейтов.
+
+Запуск из корня проекта:
+    python -m benchmarks.replay run records/ --speed 10 --data snapshot/ --outbound new.jsonl
+    python -m benchmarks.replay diff old.jsonl new.jsonl
+
+--data - каталог с копией файлов хранилища, от которой стартует прогон (копируется
+во временный каталог, исходные файлы не меняются). --outbound сохраняет
+исходящие вызовы Bot API, сгруппированные по номеру апдейта в журнале; diff
+сравнивает два таких файла, например до и после оптимизации, и завершается с
+кодом 1, если ответы бота различаются.
+
+Журнал пишется с администратором 1 и операторами 2, 3, ...: прогон выставляет
+ADMIN_ID=1, если он не задан в окружении (OPERATOR_IDS задается так же вручную).
+"""
+import argparse
+import asyncio
+import contextvars
+import difflib
+import gzip
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_flows import percentile
+from benchmarks.stubbot import StubRequest
+
+# Номер апдейта в журнале, при обработке которого сделан вызов Bot API
+_current_seq = contextvars.ContextVar('replay_seq', default=None)
+
+# Изменчивые части текста, которые diff по умолчанию не сравнивает: даты и время
+DEFAULT_IGNORE = (r'\d{2}\.\d{2}\.\d{4}', r'\b\d{1,2}:\d{2}(:\d{2})?\b')
+
+
+# ========== ЖУРНАЛ ==========
+def journal_files(paths):
+    """Файлы журнала по списку файлов и каталогов, по порядку записи"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.jsonl.gz')))
+        else:
+            files.append(path)
+    return files
+
+
+def load_journal(paths, limit=None):
+    """Записи журнала (ts, JSON апдейта) по порядку времени"""
+    entries = []
+    for path in journal_files(paths):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries.append((entry['ts'], entry['update']))
+            except (EOFError, json.JSONDecodeError):
+                # Файл, который писался в момент остановки, может обрываться
+                print(f"⚠️  {path}: журнал обрывается, прочитано до обрыва", file=sys.stderr)
+    entries.sort(key=lambda entry: entry[0])
+    return entries[:limit] if limit else entries
+
+
+def update_kind(data):
+    """Вид апдейта для отчета: команда, префикс callback data или тип сообщения"""
+    if 'callback_query' in data:
+        callback = data['callback_query'].get('data') or ''
+        return f"callback:{re.sub(r'[_0-9]+$', '', callback.split('_')[0]) or '?'}"
+    message = data.get('message') or data.get('edited_message')
+    if message is None:
+        return next((key for key in data if key != 'update_id'), 'unknown')
+    text = message.get('text') or ''
+    if text.startswith('/'):
+        return text.split()[0].split('@')[0]
+    if 'contact' in message:
+        return 'contact'
+    return 'text' if text else 'message'
+
+
+# ========== ПРОГОН ==========
+class ReplayRequest(StubRequest):
+    """Заглушка Bot API, относящая каждый вызов к апдейту журнала"""
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency=latency)
+        # номер апдейта (None - фоновые задачи) -> [(метод, параметры)]
+        self.outbound = {}
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        if request_data is not None:
+            endpoint = url.rsplit('/', 1)[-1]
+            self.outbound.setdefault(_current_seq.get(), []).append((endpoint, request_data.parameters))
+        return await super().do_request(url, method, request_data, **kwargs)
+
+
+class Replay:
+    """Подает записанные апдейты в update_queue с заданным ускорением"""
+
+    def __init__(self, application, entries, speed):
+        self.application = application
+        self.entries = entries
+        self.speed = speed
+        self.pending = {}
+        # id(Update) -> номер в журнале: update_id в журнале может повторяться
+        self._seqs = {}
+        self.latencies = []
+        self.handler_times = {}
+        self.processed = 0
+
+        original = application.process_update
+
+        async def process_update(update):
+            seq = self._seqs.pop(id(update), None)
+            _current_seq.set(seq)
+            started = time.perf_counter()
+            try:
+                await original(update)
+            finally:
+                kind = update_kind(self.entries[seq][1]) if seq is not None else 'unknown'
+                self.handler_times.setdefault(kind, []).append(time.perf_counter() - started)
+                self.processed += 1
+                future = self.pending.pop(seq, None)
+                if future is not None:
+                    future.set_result(time.perf_counter())
+
+        application.process_update = process_update
+
+    async def run(self):
+        from telegram import Update
+
+        loop = asyncio.get_running_loop()
+        first_ts = self.entries[0][0] if self.entries else 0
+        started = time.perf_counter()
+        waits = []
+        for seq, (ts, data) in enumerate(self.entries):
+            if self.speed:
+                delay = started + (ts - first_ts) / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = Update.de_json(data, self.application.bot)
+            self._seqs[id(update)] = seq
+            future = self.pending[seq] = loop.create_future()
+            waits.append((time.perf_counter(), future))
+            await self.application.update_queue.put(update)
+
+        for enqueued, future in waits:
+            self.latencies.append(await future - enqueued)
+        return time.perf_counter() - started
+
+
+def prepare_workdir(workdir, data_dir):
+    if data_dir:
+        shutil.copytree(data_dir, workdir, dirs_exist_ok=True)
+    os.chdir(workdir)
+    # Настройки должны быть заданы до импорта config; прогон сам ничего не записывает
+    os.environ.setdefault('BOT_TOKEN', '123456:REPLAY')
+    os.environ.setdefault('ADMIN_ID', '1')
+    os.environ['RECORD_UPDATES_DIR'] = ''
+    os.environ['HEALTH_PORT'] = '0'
+
+
+async def replay(entries, speed, latency, concurrency):
+    from telegram.ext import Application
+
+    from bot import build_application
+
+    request = ReplayRequest(latency=latency)
+    builder = (
+        Application.builder()
+        .token(os.environ['BOT_TOKEN'])
+        .request(request)
+        .get_updates_request(StubRequest())
+        .updater(None)
+    )
+    application = build_application(builder, concurrent_updates=concurrency)
+    benchmark = Replay(application, entries, speed)
+
+    async with application:
+        await application.start()
+        elapsed = await benchmark.run()
+        await application.stop()
+
+    return benchmark, request, elapsed
+
+
+def summarize(benchmark, request, elapsed, speed, concurrency):
+    all_handler_times = [value for values in benchmark.handler_times.values() for value in values]
+    return {
+        'updates': benchmark.processed,
+        'speed': speed or 'max',
+        'concurrent_updates': concurrency,
+        'seconds': round(elapsed, 3),
+        'updates_per_sec': round(benchmark.processed / elapsed, 1) if elapsed else 0,
+        'latency_ms': {
+            f'p{p}': round(percentile(benchmark.latencies, p) * 1000, 2) for p in (50, 95, 99)
+        },
+        'handler_ms': {
+            f'p{p}': round(percentile(all_handler_times, p) * 1000, 2) for p in (50, 95, 99)
+        },
+        'kinds': {
+            kind: {
+                'updates': len(values),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+            }
+            for kind, values in sorted(benchmark.handler_times.items(), key=lambda item: -len(item[1]))
+        },
+        'api_calls': request.call_counts,
+    }
+
+
+def print_summary(result):
+    print(f"\n🎞 Апдейтов: {result['updates']} | скорость: {result['speed']}"
+          f"{'x' if result['speed'] != 'max' else ''} | "
+          f"⚡ Параллельно: {result['concurrent_updates'] or 'нет'}")
+    print(f"   {result['seconds']} с → {result['updates_per_sec']} апдейтов/с")
+    latency, handler = result['latency_ms'], result['handler_ms']
+    print(f"   Задержка (очередь + обработка): p50 {latency['p50']} мс, p95 {latency['p95']} мс, "
+          f"p99 {latency['p99']} мс")
+    print(f"   Время обработчика: p50 {handler['p50']} мс, p95 {handler['p95']} мс, p99 {handler['p99']} мс")
+    for kind, stats in result['kinds'].items():
+        print(f"   {kind}: {stats['updates']} апдейтов, p50 {stats['p50_ms']} мс, p99 {stats['p99_ms']} мс")
+
+
+def write_outbound(path, outbound):
+    """Сохраняет исходящие вызовы: строка на апдейт журнала, фоновые вызовы последними"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for seq in sorted(outbound, key=lambda seq: (seq is None, seq or 0)):
+            calls = [[endpoint, params] for endpoint, params in outbound[seq]]
+            f.write(json.dumps({'seq': seq, 'calls': calls}, ensure_ascii=False, sort_keys=True, default=str) + '\n')
+
+
+def run_command(args):
+    speed = None if args.speed == 'max' else float(args.speed.rstrip('x'))
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, project_root)
+    entries = load_journal(args.journal, limit=args.limit)
+    if not entries:
+        print("Журнал пуст")
+        return 1
+    outbound_path = os.path.abspath(args.outbound) if args.outbound else None
+    json_path = os.path.abspath(args.json) if args.json else None
+    data_dir = os.path.abspath(args.data) if args.data else None
+
+    with tempfile.TemporaryDirectory(prefix='replay_') as workdir:
+        prepare_workdir(workdir, data_dir)
+        import logging
+        logging.disable(logging.INFO)
+
+        concurrency = args.concurrency
+        if concurrency is None:
+            from config import get_settings
+            concurrency = get_settings().concurrent_updates
+        benchmark, request, elapsed = asyncio.run(replay(entries, speed, args.latency, concurrency))
+        os.chdir(project_root)
+
+    result = summarize(benchmark, request, elapsed, speed, concurrency)
+    print_summary(result)
+    if outbound_path:
+        write_outbound(outbound_path, request.outbound)
+        print(f"\n💾 Исходящие вызовы сохранены в {outbound_path}")
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 Отчет сохранен в {json_path}")
+    return 0
+
+
+# ========== СРАВНЕНИЕ ==========
+def load_outbound(path, ignore):
+    patterns = [re.compile(pattern) for pattern in ignore]
+    result = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            text = json.dumps(entry['calls'], ensure_ascii=False, sort_keys=True, indent=1)
+            for pattern in patterns:
+                text = pattern.sub('…', text)
+            result[entry['seq']] = text
+    return result
+
+
+def diff_command(args):
+    ignore = DEFAULT_IGNORE + tuple(args.ignore or ())
+    old, new = load_outbound(args.old, ignore), load_outbound(args.new, ignore)
+    seqs = sorted(set(old) | set(new), key=lambda seq: (seq is None, seq or 0))
+    changed = [seq for seq in seqs if old.get(seq) != new.get(seq)]
+
+    for seq in changed[:args.show]:
+        label = 'фоновые вызовы' if seq is None else f'апдейт #{seq}'
+        print(f"\n=== {label} ===")
+        sys.stdout.writelines(difflib.unified_diff(
+            (old.get(seq) or '').splitlines(keepends=True), (new.get(seq) or '').splitlines(keepends=True),
+            fromfile=args.old, tofile=args.new, n=2))
+        print()
+    print(f"\n🔍 Апдейтов: {len(seqs)}, ответы различаются: {len(changed)}")
+    if len(changed) > args.show:
+        print(f"   Показаны первые {args.show}")
+    return 1 if changed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных апдейтов и сравнение ответов бота")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="прогнать журнал через обработчики")
+    run.add_argument('journal', nargs='+', help="файлы *.jsonl.gz или каталоги журнала")
+    run.add_argument('--speed', default='max', help="ускорение относительно записи: 1, 10, ... или max")
+    run.add_argument('--data', help="каталог с файлами хранилища, от которых стартует прогон")
+    run.add_argument('--limit', type=int, help="воспроизвести только первые N апдейтов")
+    run.add_argument('--latency', type=float, default=0.0, help="искусственная задержка Bot API, с")
+    run.add_argument('--concurrency', type=int, help="concurrent_updates (по умолчанию из настроек)")
+    run.add_argument('--outbound', help="куда сохранить исходящие вызовы для diff")
+    run.add_argument('--json', help="путь для сохранения отчета в JSON")
+    run.set_defaults(handler=run_command)
+
+    diff = commands.add_parser('diff', help="сравнить исходящие вызовы двух прогонов")
+    diff.add_argument('old')
+    diff.add_argument('new')
+    diff.add_argument('--ignore', action='append', help="регулярное выражение, которое не сравнивается")
+    diff.add_argument('--show', type=int, default=20, help="сколько различий показать")
+    diff.set_defaults(handler=diff_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
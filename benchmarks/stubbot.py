@@ -0,0 +1,71 @@
+import asyncio
+import itertools
+import json
+import time
+
+from telegram.request import BaseRequest
+
+BOT_USER = {'id': 100000, 'is_bot': True, 'first_name': 'GiperVygoda', 'username': 'gipervygoda_bot'}
+
+
+class StubRequest(BaseRequest):
+    """Заглушка сетевого слоя Bot API: отвечает мгновенно и запоминает исходящие вызовы"""
+
+    def __init__(self, latency=0.0, record=False):
+        self.latency = latency
+        self.record = record
+        self.calls = []
+        self.call_counts = {}
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+
+        self.call_counts[endpoint] = self.call_counts.get(endpoint, 0) + 1
+        if self.record:
+            self.calls.append((endpoint, params))
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        return 200, json.dumps({'ok': True, 'result': self._result(endpoint, params)}).encode('utf-8')
+
+    def _result(self, endpoint, params):
+        if endpoint == 'getMe':
+            return BOT_USER
+        if endpoint == 'getUpdates':
+            return []
+        if endpoint in ('sendMessage', 'sendDocument', 'editMessageText'):
+            chat_id = params.get('chat_id', 0)
+            return {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'} if isinstance(chat_id, int)
+                else {'id': -1001, 'type': 'channel', 'username': str(chat_id).lstrip('@')},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+        return True
+
+
+def build_stub_application(build_application, latency=0.0, record=False, **app_options):
+    """Собирает настоящий Application бота поверх StubRequest"""
+    from telegram.ext import Application
+
+    request = StubRequest(latency=latency, record=record)
+    builder = (
+        Application.builder()
+        .token('123456:STUB-TOKEN')
+        .request(request)
+        .get_updates_request(StubRequest())
+        .updater(None)
+    )
+    return build_application(builder, **app_options), request
@@ -1,3 +1,9 @@
+import time
+
+_STARTED_AT = time.perf_counter()
+
+import argparse
+import asyncio
 import logging
 import re
 from urllib.parse import urlparse, parse_qs
@@ -5,18 +11,27 @@ from urllib.parse import urlparse, parse_qs
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, MessageHandler,
-    ConversationHandler, filters, ContextTypes, CallbackQueryHandler
+    ConversationHandler, filters, ContextTypes, CallbackQueryHandler, InlineQueryHandler
 )
 
-from config import BOT_TOKEN, ADMIN_ID, COMMISSION_RATE, WAITING_FOR_PRODUCT, WAITING_FOR_LINK, WAITING_FOR_CITY, \
-    WAITING_FOR_CONTACT, WAITING_REVIEW_TEXT, WAITING_REVIEW_RATING, CHANNEL_ID, MAX_REVIEW_LENGTH, MIN_REVIEW_LENGTH
-from database import save_request, get_user_requests, save_review, get_review, update_review_status
+from clusters import clusters_command, similar_open_requests
+from config import get_settings, print_config_report, validate_config, WAITING_FOR_PRODUCT, WAITING_FOR_LINK, \
+    WAITING_FOR_CITY, WAITING_FOR_CONTACT, WAITING_REVIEW_TEXT, WAITING_REVIEW_RATING, MAX_PRODUCT_LENGTH, \
+    MAX_URL_LENGTH, MAX_CITY_LENGTH, MAX_CONTACT_LENGTH
+from database import count_pending_reviews, save_request, get_user_requests, save_review, get_review, update_review_status, \
+    update_review, get_approved_reviews, get_approved_feed_version, get_statistics, init_databases
+from dedupe import DEDUPE_GROUP, dedupe_handler
+from export import export_command
+from inline import inline_query
+from moderation import moderate_command, moderate_callback
+from operators import operators_command, take_button, take_request_callback
+from profiling import profile_command, cprofile_command, memsnap_command
+from publisher import channel_review_text
+from runtime import BotApplication, StartupProfile
+from logsetup import setup_logging
+from search import search_command, search_page_callback
+from watchdog import HealthServer
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 
@@ -68,6 +83,7 @@ def extract_price_from_url(url):
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user = update.effective_user
+    commission_percent = int(get_settings().commission_rate * 100)
     welcome_text = f"""
     🛍 <b>Добро пожаловать в ГиперВыгоду, {user.first_name}!</b>
 
@@ -76,14 +92,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     📌 <b>Как это работает:</b>
     1. Вы находите товар и его цену в магазине
     2. Я ищу этот же товар дешевле
-    3. Вы платите мне только <b>{int(COMMISSION_RATE * 100)}% от сэкономленной суммы</b>
+    3. Вы платите мне только <b>{commission_percent}% от сэкономленной суммы</b>
     4. Вы все равно покупаете дешевле, чем нашли сами!
 
     💰 <b>Пример:</b>
     • Ваша цена: 70 000 ₽
     • Моя цена: 57 000 ₽
     • Экономия: 13 000 ₽
-    • Моя комиссия ({int(COMMISSION_RATE * 100)}%): 5 200 ₽
+    • Моя комиссия ({commission_percent}%): 5 200 ₽
     • <b>Ваш итог: 62 200 ₽ (выгода 7 800 ₽!)</b>
 
     🚀 Чтобы начать, нажмите /order
@@ -127,6 +143,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     📝 <b>Начать поиск:</b> /order
     ⭐ <b>Оставить отзыв:</b> /review
     📋 <b>Мои заявки:</b> /myrequest
+
+    💬 <b>В любом чате:</b> напишите @{context.bot.username} 123 - статус заявки #123,
+    @{context.bot.username} отзывы - отзывы наших клиентов
     """
     await update.message.reply_html(help_text)
 
@@ -159,6 +178,14 @@ async def receive_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return WAITING_FOR_PRODUCT
 
+    if len(product) > MAX_PRODUCT_LENGTH:
+        await update.message.reply_text(
+            f"❌ <b>Название товара слишком длинное.</b>\n"
+            f"Уложитесь в {MAX_PRODUCT_LENGTH} символов: модель или артикул:",
+            parse_mode='HTML'
+        )
+        return WAITING_FOR_PRODUCT
+
     context.user_data['product'] = product
     await update.message.reply_text(
         "🔗 <b>Шаг 2 из 4:</b>\n"
@@ -186,6 +213,14 @@ async def receive_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return WAITING_FOR_LINK
 
+    if len(url) > MAX_URL_LENGTH:
+        await update.message.reply_text(
+            "❌ <b>Ссылка слишком длинная.</b>\n"
+            "Пришлите ссылку на страницу товара без лишних параметров:",
+            parse_mode='HTML'
+        )
+        return WAITING_FOR_LINK
+
     # Сохраняем ссылку
     context.user_data['product_url'] = url
 
@@ -284,6 +319,14 @@ async def receive_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return WAITING_FOR_CITY
 
+    if len(city) > MAX_CITY_LENGTH:
+        await update.message.reply_text(
+            "❌ <b>Название города слишком длинное.</b>\n"
+            "Пожалуйста, укажите только город:",
+            parse_mode='HTML'
+        )
+        return WAITING_FOR_CITY
+
     context.user_data['city'] = city
 
     # Создаем кнопку для отправки контакта
@@ -314,6 +357,13 @@ async def receive_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode='HTML'
             )
             return WAITING_FOR_CONTACT
+        if len(contact) > MAX_CONTACT_LENGTH:
+            await update.message.reply_text(
+                "❌ <b>Контакт слишком длинный.</b>\n"
+                "Пожалуйста, укажите только username или номер телефона:",
+                parse_mode='HTML'
+            )
+            return WAITING_FOR_CONTACT
 
     # Проверяем, что у нас есть все необходимые данные
     required_fields = ['product', 'product_url', 'known_price', 'city']
@@ -340,8 +390,8 @@ async def receive_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
         'price_source': context.user_data.get('price_source', 'unknown')
     }
 
-    # Сохраняем в базу
-    request_id = save_request(user_data)
+    # Сохраняем в базу сразу с оператором (см. operators.py)
+    request_id = save_request(user_data, operator_id=context.application.operators.pick(user_data['user_id']))
 
     # Форматируем цену для красивого отображения
     formatted_price = f"{user_data['known_price']:,}".replace(',', ' ')
@@ -362,25 +412,8 @@ async def receive_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
         disable_web_page_preview=True
     )
 
-    # Уведомляем администратора (вас)
-    admin_text = (
-        f"🚨 <b>НОВАЯ ЗАЯВКА #{request_id}</b>\n\n"
-        f"👤 <b>Пользователь:</b> @{user_data['username'] or 'без username'}\n"
-        f"📞 <b>Контакт:</b> {user_data['contact']}\n"
-        f"📦 <b>Товар:</b> {user_data['product']}\n"
-        f"🔗 <b>Ссылка:</b> {user_data['product_url']}\n"
-        f"💰 <b>Цена клиента:</b> {formatted_price} ₽\n"
-        f"🏙️ <b>Город:</b> {user_data['city']}\n"
-        f"📊 <b>Источник цены:</b> {user_data['price_source']}\n\n"
-        f"🆔 <b>ID заявки:</b> {request_id}"
-    )
-
-    await context.bot.send_message(
-        chat_id=ADMIN_ID,
-        text=admin_text,
-        parse_mode='HTML',
-        disable_web_page_preview=True
-    )
+    # Уведомляем оператора, которому назначена заявка (см. operators.py)
+    await context.application.operators.dispatch('request', request_id, details=user_data)
 
     # Очищаем временные данные
     context.user_data.clear()
@@ -388,10 +421,35 @@ async def receive_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+def request_alert(request, details=None):
+    """Уведомление оператору о заявке; details - данные диалога, которых нет в записи"""
+    details = details or {}
+    formatted_price = f"{request['known_price']:,}".replace(',', ' ')
+    lines = [
+        f"🚨 <b>НОВАЯ ЗАЯВКА #{request['id']}</b>\n",
+        f"👤 <b>Пользователь:</b> @{request['username'] or 'без username'}",
+        f"📞 <b>Контакт:</b> {request['contact']}",
+        f"📦 <b>Товар:</b> {request['product']}",
+    ]
+    if details.get('product_url'):
+        lines.append(f"🔗 <b>Ссылка:</b> {details['product_url']}")
+    lines.append(f"💰 <b>Цена клиента:</b> {formatted_price} ₽")
+    lines.append(f"🏙️ <b>Город:</b> {request['city']}")
+    if details.get('price_source'):
+        lines.append(f"📊 <b>Источник цены:</b> {details['price_source']}")
+    total, similar_ids = similar_open_requests(request)
+    if total:
+        more = f" (+{total - len(similar_ids)})" if total > len(similar_ids) else ""
+        lines.append(f"🔁 <b>Похожие открытые заявки:</b> {', '.join(f'#{i}' for i in similar_ids)}{more}")
+    lines.append(f"\n🆔 <b>ID заявки:</b> {request['id']}")
+    return '\n'.join(lines), take_button(request['id'])
+
+
 async def myrequest(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать заявки пользователя"""
     user_id = update.effective_user.id
     requests = get_user_requests(user_id)
+    commission_percent = int(get_settings().commission_rate * 100)
 
     if not requests:
         await update.message.reply_text(
@@ -430,7 +488,7 @@ async def myrequest(update: Update, context: ContextTypes.DEFAULT_TYPE):
             response += (
                 f"🎯 <b>Найдена цена:</b> {found_price_formatted} ₽\n"
                 f"💸 <b>Экономия:</b> {economy_formatted} ₽\n"
-                f"🧾 <b>Комиссия ({int(COMMISSION_RATE * 100)}%):</b> {commission_formatted} ₽\n"
+                f"🧾 <b>Комиссия ({commission_percent}%):</b> {commission_formatted} ₽\n"
             )
 
         response += f"📅 <b>Создана:</b> {req['created_at']}\n\n"
@@ -441,13 +499,15 @@ async def myrequest(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ========== СИСТЕМА ОТЗЫВОВ ==========
 async def review(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало диалога для оставления отзыва"""
+    settings = get_settings()
+
     # Очищаем предыдущие данные
     context.user_data.clear()
 
     await update.message.reply_text(
         "⭐️ <b>Оставить отзыв</b>\n\n"
         f"Вы можете оценить нашу работу от 1 до 5 звезд.\n"
-        f"Отзыв должен быть от {MIN_REVIEW_LENGTH} до {MAX_REVIEW_LENGTH} символов.\n"
+        f"Отзыв должен быть от {settings.min_review_length} до {settings.max_review_length} символов.\n"
         f"Ваш отзыв будет отправлен на модерацию.\n\n"
         "📝 <b>Напишите ваш отзыв:</b>",
         parse_mode='HTML'
@@ -459,22 +519,23 @@ async def review(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def receive_review_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение текста отзыва"""
     review_text = update.message.text.strip()
+    settings = get_settings()
 
     # Проверяем длину отзыва
-    if len(review_text) < MIN_REVIEW_LENGTH:
+    if len(review_text) < settings.min_review_length:
         await update.message.reply_text(
             f"❌ <b>Отзыв слишком короткий.</b>\n"
-            f"Минимальная длина: {MIN_REVIEW_LENGTH} символов.\n"
+            f"Минимальная длина: {settings.min_review_length} символов.\n"
             f"Сейчас: {len(review_text)} символов.\n\n"
             f"Пожалуйста, напишите более подробный отзыв:",
             parse_mode='HTML'
         )
         return WAITING_REVIEW_TEXT
 
-    if len(review_text) > MAX_REVIEW_LENGTH:
+    if len(review_text) > settings.max_review_length:
         await update.message.reply_text(
             f"❌ <b>Отзыв слишком длинный.</b>\n"
-            f"Максимальная длина: {MAX_REVIEW_LENGTH} символов.\n"
+            f"Максимальная длина: {settings.max_review_length} символов.\n"
             f"Сейчас: {len(review_text)} символов.\n\n"
             f"Пожалуйста, сократите отзыв:",
             parse_mode='HTML'
@@ -516,7 +577,8 @@ async def receive_review_rating(update: Update, context: ContextTypes.DEFAULT_TY
         user_id=update.effective_user.id,
         username=update.effective_user.username,
         review_text=context.user_data['review_text'],
-        rating=rating
+        rating=rating,
+        operator_id=context.application.operators.pick(update.effective_user.id)
     )
 
     # Уведомляем пользователя
@@ -540,13 +602,13 @@ async def receive_review_rating(update: Update, context: ContextTypes.DEFAULT_TY
 
 
 async def send_review_to_admin(context: ContextTypes.DEFAULT_TYPE, review_id: int):
-    """Отправляет отзыв админу на модерацию"""
-    review = get_review(review_id)
+    """Отправляет отзыв на модерацию оператору, которому он назначен"""
+    await context.application.operators.dispatch('review', review_id)
 
-    if not review:
-        logger.error(f"Отзыв #{review_id} не найден в базе")
-        return
 
+def review_alert(review, details=None):
+    """Карточка модерации отзыва"""
+    review_id = review['id']
     stars = "⭐" * review['rating']
 
     keyboard = [
@@ -571,58 +633,64 @@ async def send_review_to_admin(context: ContextTypes.DEFAULT_TYPE, review_id: in
         f"🆔 <b>ID отзыва:</b> {review_id}"
     )
 
-    try:
-        await context.bot.send_message(
-            chat_id=ADMIN_ID,
-            text=message_text,
-            parse_mode='HTML',
-            reply_markup=reply_markup
-        )
-    except Exception as e:
-        logger.error(f"Ошибка при отправке отзыва админу: {e}")
+    pending = count_pending_reviews()
+    if pending > 1:
+        message_text += f"\n\n🛡 На модерации: {pending}. Массовая модерация: /moderate"
+
+    return message_text, reply_markup
 
 
 async def handle_review_decision(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка решений админа (публикация/отклонение)"""
+    """Обработка решений оператора (публикация/отклонение)"""
     query = update.callback_query
-    await query.answer()
+    operators = context.application.operators
 
     action, review_id = query.data.split('_')
     review_id = int(review_id)
     review = get_review(review_id)
+    channel_id = get_settings().channel_id
+
+    # Решение принимает оператор, которому назначен отзыв (или администратор)
+    if review and not operators.can_handle(update.effective_user.id, review):
+        await query.answer(f"Отзыв #{review_id} назначен другому оператору", show_alert=True)
+        return
+    await query.answer()
 
     if not review:
         await query.edit_message_text("❌ Отзыв не найден")
         return
 
+    if review['status'] != 'pending':
+        await query.edit_message_text(f"ℹ️ Отзыв #{review_id} уже обработан (статус: {review['status']})")
+        return
+
     if action == 'approve':
+        # Сначала занимаем переход pending -> approved, чтобы отзыв не опубликовали дважды
+        if not update_review_status(review_id, 'approved', expected_status='pending'):
+            await query.edit_message_text(f"ℹ️ Отзыв #{review_id} уже обработан")
+            return
+        operators.record_handled(update.effective_user.id, review)
+
+        channel_message = None
         try:
             # Публикуем в канал
             stars = "⭐" * review['rating']
-            channel_message_text = (
-                f"📢 <b>НОВЫЙ ОТЗЫВ</b>\n\n"
-                f"⭐ <b>Оценка:</b> {stars}\n"
-                f"📝 <b>Отзыв:</b>\n{review['review_text']}\n\n"
-                f"<i>Спасибо за доверие! ❤️</i>"
-            )
-
-            # Отправляем в канал
             channel_message = await context.bot.send_message(
-                chat_id=CHANNEL_ID,
-                text=channel_message_text,
+                chat_id=channel_id,
+                text=channel_review_text(review),
                 parse_mode='HTML'
             )
 
-            # Обновляем статус
-            update_review_status(review_id, 'approved', channel_message.message_id)
+            # Сохраняем ID сообщения в канале
+            update_review(review_id, published_message_id=channel_message.message_id)
 
             # Формируем ссылку на сообщение
-            if CHANNEL_ID.startswith('@'):
-                channel_name = CHANNEL_ID.replace('@', '')
+            if channel_id.startswith('@'):
+                channel_name = channel_id.replace('@', '')
                 message_url = f"https://t.me/{channel_name}/{channel_message.message_id}"
             else:
                 # Для числовых ID каналов
-                channel_id_clean = str(CHANNEL_ID).replace('-100', '')
+                channel_id_clean = str(channel_id).replace('-100', '')
                 message_url = f"https://t.me/c/{channel_id_clean}/{channel_message.message_id}"
 
             # Обновляем сообщение админу
@@ -650,15 +718,21 @@ async def handle_review_decision(update: Update, context: ContextTypes.DEFAULT_T
 
         except Exception as e:
             logger.error(f"Ошибка при публикации отзыва: {e}")
+            # Если пост не вышел, возвращаем отзыв на модерацию для повторной попытки
+            if channel_message is None:
+                update_review_status(review_id, 'pending', expected_status='approved')
             await query.edit_message_text(
                 f"❌ <b>Ошибка при публикации:</b>\n{str(e)[:100]}...\n\n"
-                f"Проверьте, что бот добавлен как администратор канала {CHANNEL_ID}",
+                f"Проверьте, что бот добавлен как администратор канала {channel_id}",
                 parse_mode='HTML'
             )
 
     elif action == 'reject':
         # Обновляем статус
-        update_review_status(review_id, 'rejected')
+        if not update_review_status(review_id, 'rejected', expected_status='pending'):
+            await query.edit_message_text(f"ℹ️ Отзыв #{review_id} уже обработан")
+            return
+        operators.record_handled(update.effective_user.id, review)
 
         # Обновляем сообщение админу
         await query.edit_message_text(
@@ -668,21 +742,30 @@ async def handle_review_decision(update: Update, context: ContextTypes.DEFAULT_T
         )
 
 
+# Готовый HTML ответа /reviews: ((версия ленты, канал), текст)
+_reviews_page_cache = (None, None)
+
+
 async def show_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать последние опубликованные отзывы (команда /reviews)"""
-    from database import get_approved_reviews
+    global _reviews_page_cache
+
+    cache_key = (get_approved_feed_version(), get_settings().channel_id)
+    if _reviews_page_cache[0] != cache_key:
+        _reviews_page_cache = (cache_key, render_reviews_page(get_approved_reviews(limit=5)))
 
-    approved_reviews = get_approved_reviews(limit=5)
+    await update.message.reply_html(_reviews_page_cache[1])
 
+
+def render_reviews_page(approved_reviews):
+    """HTML ответа /reviews по списку опубликованных отзывов"""
     if not approved_reviews:
-        await update.message.reply_text(
+        return (
             "📢 <b>Опубликованные отзывы</b>\n\n"
             "Пока нет опубликованных отзывов.\n"
             "Будьте первым - оставьте отзыв через /review\n\n"
-            "Все отзывы публикуются в нашем канале.",
-            parse_mode='HTML'
+            "Все отзывы публикуются в нашем канале."
         )
-        return
 
     response = "📢 <b>Последние отзывы:</b>\n\n"
 
@@ -695,11 +778,10 @@ async def show_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
     response += (
-        f"<i>Все отзывы в канале: {CHANNEL_ID}</i>\n\n"
+        f"<i>Все отзывы в канале: {get_settings().channel_id}</i>\n\n"
         f"⭐ <b>Оставить свой отзыв:</b> /review"
     )
-
-    await update.message.reply_html(response)
+    return response
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -727,13 +809,12 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ========== АДМИН КОМАНДЫ ==========
 async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать статистику (только для админа)"""
-    if update.effective_user.id != ADMIN_ID:
+    if update.effective_user.id != get_settings().admin_id:
         await update.message.reply_text("❌ Эта команда только для администратора")
         return
 
-    from database import get_statistics
-
     stats = get_statistics()
+    memory = context.application.sessions.memory()
 
     stats_text = (
         f"📊 <b>СТАТИСТИКА БОТА</b>\n\n"
@@ -751,6 +832,14 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"• Опубликовано: {stats['approved_reviews']}\n"
         f"• Средний рейтинг: {stats['average_rating']:.1f}/5.0\n\n"
 
+        f"📦 <b>В архиве:</b> заявок {stats['archived_requests']}, отзывов {stats['archived_reviews']}\n\n"
+
+        f"💬 <b>Диалоги в памяти:</b>\n"
+        f"• Заявки: {memory['conversations'].get('order', 0)}, отзывы: {memory['conversations'].get('review', 0)}\n"
+        f"• Данные пользователей: {memory['user_data_users']} "
+        f"(~{memory['user_data_bytes'] / 1024:.1f} КБ)\n"
+        f"• Завершено по таймауту: {memory['expired']}\n\n"
+
         f"🤖 <b>Бот работает стабильно!</b>"
     )
 
@@ -758,21 +847,36 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # ========== ЗАПУСК БОТА ==========
-def main():
-    """Запуск бота"""
-    # Проверяем наличие обязательных настроек
-    if not BOT_TOKEN or not ADMIN_ID:
-        logger.error("❌ КРИТИЧЕСКАЯ ОШИБКА: BOT_TOKEN или ADMIN_ID не установлены!")
-        print("=" * 50)
-        print("ПРОВЕРЬТЕ ФАЙЛ .env В КОРНЕ ПРОЕКТА!")
-        print("Он должен содержать:")
-        print("BOT_TOKEN=ваш_токен_от_BotFather")
-        print("ADMIN_ID=ваш_telegram_id")
-        print("=" * 50)
-        return
+def application_builder(token=None):
+    """ApplicationBuilder с токеном и адресом Bot API из настроек"""
+    settings = get_settings()
+    builder = Application.builder().token(token or settings.bot_token)
+    urls = settings.bot_api_urls()
+    if urls:
+        builder = builder.base_url(urls['base_url']).base_file_url(urls['base_file_url'])
+    return builder
+
+
+def build_application(builder=None, concurrent_updates=None):
+    """Создает Application со всеми обработчиками (без запуска)"""
+    settings = get_settings()
+    if builder is None:
+        builder = application_builder()
+    if concurrent_updates is None:
+        concurrent_updates = settings.concurrent_updates
+
+    application = (
+        builder
+        .application_class(BotApplication)
+        .concurrent_updates(concurrent_updates)
+        # Ограниченная очередь: пока прием (ingest.py) ждет места, Updater и
+        # воркеры супервизора ждут на put() и не забирают новые апдейты
+        .update_queue(asyncio.Queue(maxsize=settings.ingest_queue_size))
+        .build()
+    )
 
-    # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Повторно доставленные апдейты отбрасываются раньше всех обработчиков
+    application.add_handler(dedupe_handler(), group=DEDUPE_GROUP)
 
     # Настройка ConversationHandler для заявки
     conv_handler = ConversationHandler(
@@ -818,8 +922,25 @@ def main():
         allow_reentry=True
     )
 
+    # Брошенные диалоги завершаются по таймауту (sessions.py)
+    application.sessions.track('order', conv_handler,
+                               "⌛ <b>Сессия оформления заявки истекла.</b>\n"
+                               "Вы долго не отвечали, поэтому введенные данные удалены. "
+                               "Чтобы начать заново, отправьте /order")
+    application.sessions.track('review', review_handler,
+                               "⌛ <b>Сессия отзыва истекла.</b>\n"
+                               "Чтобы оставить отзыв, отправьте /review еще раз")
+
     # Обработчик кнопок модерации отзывов
     application.add_handler(CallbackQueryHandler(handle_review_decision, pattern='^(approve|reject)_'))
+    application.add_handler(CallbackQueryHandler(search_page_callback, pattern='^search_'))
+    application.add_handler(CallbackQueryHandler(moderate_callback, pattern='^mod_'))
+    application.add_handler(CallbackQueryHandler(take_request_callback, pattern='^op_take_'))
+    application.add_handler(InlineQueryHandler(inline_query))
+
+    # Уведомления операторам о назначенных им заявках и отзывах
+    application.operators.register_alert('request', request_alert)
+    application.operators.register_alert('review', review_alert)
 
     # Регистрируем обработчики команд
     application.add_handler(CommandHandler("start", start))
@@ -827,28 +948,95 @@ def main():
     application.add_handler(CommandHandler("myrequest", myrequest))
     application.add_handler(CommandHandler("reviews", show_reviews))
     application.add_handler(CommandHandler("stats", admin_stats))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CommandHandler("moderate", moderate_command))
+    application.add_handler(CommandHandler("operators", operators_command))
+    application.add_handler(CommandHandler("clusters", clusters_command))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("cprofile", cprofile_command))
+    application.add_handler(CommandHandler("memsnap", memsnap_command))
     application.add_handler(conv_handler)  # Для заявок
     application.add_handler(review_handler)  # Для отзывов
 
+    return application
+
+
+def main(argv=None):
+    """Запуск бота"""
+    parser = argparse.ArgumentParser(description="Телеграм-бот ГиперВыгода")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="замерить фазы запуска, вывести отчет и выйти без подключения к Telegram")
+    args = parser.parse_args(argv)
+
+    startup = StartupProfile(_STARTED_AT)
+    startup.mark("импорт модулей")
+
+    settings = get_settings()
+    startup.mark("чтение настроек")
+
+    # Логи пишет фоновый поток; print в процессе бота не используется
+    setup_logging()
+    startup.mark("настройка логирования")
+
+    print_config_report(settings)
+    is_config_valid = validate_config(settings)
+    startup.mark("проверка конфигурации")
+
+    # Проверяем наличие обязательных настроек
+    if not args.startup_report and (not settings.bot_token or not settings.admin_id):
+        logger.error(
+            "❌ КРИТИЧЕСКАЯ ОШИБКА: BOT_TOKEN или ADMIN_ID не установлены!\n"
+            "ПРОВЕРЬТЕ ФАЙЛ .env В КОРНЕ ПРОЕКТА! Он должен содержать:\n"
+            "BOT_TOKEN=ваш_токен_от_BotFather\n"
+            "ADMIN_ID=ваш_telegram_id"
+        )
+        return
+
+    init_databases()
+    startup.mark("открытие хранилища")
+
+    # Создаем приложение
+    builder = application_builder(settings.bot_token or '0:STARTUP-REPORT')
+    application = build_application(builder)
+    startup.mark("сборка приложения и обработчиков")
+
+    if args.startup_report:
+        logger.info(startup.report())
+        if not is_config_valid:
+            logger.warning("⚠️  Конфигурация некорректна: для реального запуска исправьте .env")
+        return
+
     # Запускаем бота
-    print("=" * 50)
-    print("🤖 БОТ 'ГИПЕРВЫГОДА' ЗАПУЩЕН!")
-    print("=" * 50)
-    print(f"👑 Админ ID: {ADMIN_ID}")
-    print(f"📢 Канал для публикации: {CHANNEL_ID}")
-    print(f"💰 Комиссия: {int(COMMISSION_RATE * 100)}%")
-    print("=" * 50)
-    print("📝 Основные команды:")
-    print("• /start - Начало работы")
-    print("• /order - Оформить заявку")
-    print("• /review - Оставить отзыв")
-    print("• /myrequest - Мои заявки")
-    print("• /reviews - Посмотреть отзывы")
-    print("• /help - Помощь")
-    print("• /stats - Статистика (админ)")
-    print("=" * 50)
-    print("Для остановки нажмите Ctrl+C")
-    print("=" * 50)
+    logger.info('\n'.join([
+        "=" * 50,
+        "🤖 БОТ 'ГИПЕРВЫГОДА' ЗАПУЩЕН!",
+        "=" * 50,
+        f"👑 Админ ID: {settings.admin_id}",
+        f"📢 Канал для публикации: {settings.channel_id}",
+        f"💰 Комиссия: {int(settings.commission_rate * 100)}%",
+        "=" * 50,
+        "📝 Основные команды:",
+        "• /start - Начало работы",
+        "• /order - Оформить заявку",
+        "• /review - Оставить отзыв",
+        "• /myrequest - Мои заявки",
+        "• /reviews - Посмотреть отзывы",
+        "• /help - Помощь",
+        "• @бот 123, @бот отзывы - Инлайн-режим в любом чате",
+        "• /stats - Статистика (админ)",
+        "• /operators - Очереди операторов (админ)",
+        "• /clusters - Похожие открытые заявки (админ)",
+        "• /profile, /cprofile, /memsnap - Профилирование (админ)",
+        "=" * 50,
+        "Для остановки нажмите Ctrl+C",
+        "Перечитать .env без остановки: kill -HUP <pid>",
+        "=" * 50,
+    ]))
+    logger.info(startup.report())
+
+    if settings.health_port:
+        HealthServer(application.watchdog).start()
 
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
@@ -0,0 +1,333 @@
+"""
+Группировка открытых заявок по похожим названиям товара.
+
+Название товара - свободный текст: "Телевизор Samsung QE55Q70BAUXRU" и
+"samsung qe55q70b" - один и тот же товар, который иначе ищут дважды.
+ProductIndex держит для каждой открытой заявки (new, in_progress)
+MinHash-подпись названия и LSH-таблицы по полосам подписи, поэтому поиск
+похожих - это BANDS обращений к словарям и проверка найденных кандидатов,
+а не перебор всех открытых заявок.
+
+Подпись хранится как bytes (NUM_HASHES 32-битных значений), а ее значения
+считаются одним проходом map(min, ...) по закешированным векторам хешей
+признаков - без цикла Python по каждой хеш-функции.
+
+Признаки названия - символьные триграммы слов и, для артикулов (слов с
+цифрами), их префиксы от PREFIX_MIN символов: "qe55q70bauxru" и "qe55q70b"
+совпадают по префиксам, а "qe55q70b" и "qe65q80b" - нет, хотя триграмм
+у них общих много. Одинаковые после нормализации названия индексируются
+один раз (группой ID).
+
+Индекс обновляется по изменениям заявок (как поисковый индекс search.py);
+заявки, перечитанные с диска после изменения другим процессом, индексируются
+заново только в перечитанных диапазонах ID. Используется в уведомлении
+о новой заявке (похожие открытые) и в команде /clusters.
+"""
+import html
+import logging
+import random
+import re
+from array import array
+from functools import lru_cache
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import database
+from config import get_settings
+from search import stem
+
+logger = logging.getLogger(__name__)
+
+# MinHash: BANDS полос по ROWS значений; заявки-кандидаты совпадают хотя бы в одной полосе
+BANDS = 16
+ROWS = 3
+NUM_HASHES = BANDS * ROWS
+
+# Доля совпавших значений подписи (оценка сходства Жаккара), с которой названия считаются одним товаром
+SIMILARITY = 0.45
+
+# Минимальная длина префикса артикула
+PREFIX_MIN = 4
+
+_WORD_RE = re.compile(r'[0-9a-zа-я]+')
+_MASK = (1 << 32) - 1
+# Случайные маски задают семейство хеш-функций h_i(x) = hash(x) XOR mask_i
+_random = random.Random(20240601)
+_SEEDS = tuple(_random.getrandbits(32) for _ in range(NUM_HASHES))
+_BAND_BYTES = ROWS * 4
+
+
+@lru_cache(maxsize=65536)
+def normalize(product):
+    """
+    Нижний регистр, ё -> е, только буквы и цифры через пробел. Короткая
+    буквенная часть артикула склеивается с цифровой: "WH-1000XM5" и
+    "wh1000xm5" дают одно слово.
+    """
+    words = _WORD_RE.findall(str(product).lower().replace('ё', 'е'))
+    merged = []
+    for word in words:
+        if merged and word[0].isdigit() and len(merged[-1]) <= 3 and merged[-1].isalpha():
+            merged[-1] += word
+        else:
+            merged.append(word)
+    return ' '.join(merged)
+
+
+def features(name):
+    """
+    Признаки нормализованного названия. Русские слова - чаще всего тип
+    товара ("телевизор", "пылесос") - дают один признак (основу слова), чтобы
+    не перевешивать бренд и модель; латинские слова и числа - триграммы,
+    а артикулы еще и префиксы.
+    """
+    result = set()
+    for word in name.split():
+        if 'а' <= word[0] <= 'я':
+            result.add(stem(word))
+            continue
+        padded = f' {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        if not word.isalpha() and not word.isdigit():
+            result.update(f'#{word[:end]}' for end in range(PREFIX_MIN, len(word) + 1))
+    return result
+
+
+@lru_cache(maxsize=16384)
+def _feature_hashes(feature):
+    """Значения всех NUM_HASHES хеш-функций для признака (триграммы повторяются)"""
+    base = hash(feature) & _MASK
+    return array('I', [base ^ seed for seed in _SEEDS])
+
+
+@lru_cache(maxsize=16384)
+def signature(name):
+    """MinHash-подпись нормализованного названия в виде bytes (None для пустого)"""
+    vectors = [_feature_hashes(feature) for feature in features(name)]
+    if not vectors:
+        return None
+    if len(vectors) == 1:
+        return vectors[0].tobytes()
+    return array('I', map(min, *vectors)).tobytes()
+
+
+def similarity(first, second):
+    """Оценка сходства Жаккара по двум подписям"""
+    return sum(a == b for a, b in zip(memoryview(first).cast('I'), memoryview(second).cast('I'))) / NUM_HASHES
+
+
+def _band_keys(sig):
+    """Ключи полос подписи для LSH-таблиц (по таблице на полосу)"""
+    return [int.from_bytes(sig[start:start + _BAND_BYTES], 'little')
+            for start in range(0, BANDS * _BAND_BYTES, _BAND_BYTES)]
+
+
+class ProductIndex:
+    """LSH-индекс MinHash-подписей названий открытых заявок"""
+
+    def __init__(self):
+        self.version = None
+        # подпись -> {ID заявок}; заявки с одинаковым названием - одна группа
+        self._groups = {}
+        # ID заявки -> подпись
+        self._doc_sig = {}
+        # По таблице на полосу: ключ полосы -> подпись, а при совпадении
+        # нескольких названий - множество подписей (одиночных подавляющее большинство)
+        self._buckets = [{} for _ in range(BANDS)]
+
+    def __len__(self):
+        return len(self._doc_sig)
+
+    @staticmethod
+    def _indexable(request):
+        return request.status in database.OPEN_STATUSES['request'] and bool(request.product)
+
+    def rebuild(self):
+        """Строит индекс заново по открытым заявкам"""
+        self.version = database.get_data_version('request')
+        self._groups = {}
+        self._doc_sig = {}
+        self._buckets = [{} for _ in range(BANDS)]
+        for request in database.get_open_records('request'):
+            if request.product:
+                self._add(request.id, signature(normalize(request.product)))
+        logger.info(f"Индекс похожих товаров: {len(self._doc_sig)} заявок, {len(self._groups)} названий")
+
+    def ensure_fresh(self):
+        """Подтягивает изменения заявок другим процессом (см. SearchIndex.ensure_fresh)"""
+        version = database.get_data_version('request')
+        if version == self.version:
+            return
+        ranges = database.get_reloaded_ranges('request', self.version)
+        if ranges is None:
+            self.rebuild()
+            return
+        for min_id, max_id in ranges:
+            self._reindex_range(min_id, max_id)
+        self.version = version
+
+    def _reindex_range(self, min_id, max_id):
+        """Индексирует заново заявки с ID из диапазона (max_id None - до конца)"""
+        stale = [request_id for request_id in self._doc_sig
+                 if min_id <= request_id and (max_id is None or request_id <= max_id)]
+        for request_id in stale:
+            self._remove(request_id)
+        for request in database.iter_range('request', min_id, max_id):
+            if self._indexable(request):
+                self._add(request.id, signature(normalize(request.product)))
+
+    def _add(self, request_id, sig):
+        if sig is None:
+            return
+        self._doc_sig[request_id] = sig
+        group = self._groups.get(sig)
+        if group is None:
+            group = self._groups[sig] = set()
+            for table, key in zip(self._buckets, _band_keys(sig)):
+                bucket = table.get(key)
+                if bucket is None:
+                    table[key] = sig
+                elif isinstance(bucket, set):
+                    bucket.add(sig)
+                else:
+                    table[key] = {bucket, sig}
+        group.add(request_id)
+
+    def _remove(self, request_id):
+        sig = self._doc_sig.pop(request_id, None)
+        if sig is None:
+            return
+        group = self._groups[sig]
+        group.discard(request_id)
+        if group:
+            return
+        del self._groups[sig]
+        for table, key in zip(self._buckets, _band_keys(sig)):
+            bucket = table[key]
+            if not isinstance(bucket, set):
+                del table[key]
+                continue
+            bucket.discard(sig)
+            if len(bucket) == 1:
+                table[key] = bucket.pop()
+
+    def update(self, request, deleted=False):
+        """Обновляет индекс после изменения заявки этим процессом"""
+        if self.version != database.get_data_version('request'):
+            # Индекс построится заново при следующем обращении
+            return
+        self._remove(request.id)
+        if not deleted and self._indexable(request):
+            self._add(request.id, signature(normalize(request.product)))
+
+    def _similar_groups(self, sig):
+        """Подписи похожих названий (включая саму sig, если она в индексе)"""
+        candidates = set()
+        for table, key in zip(self._buckets, _band_keys(sig)):
+            bucket = table.get(key)
+            if bucket is None:
+                continue
+            if isinstance(bucket, set):
+                candidates |= bucket
+            else:
+                candidates.add(bucket)
+        return [other for other in candidates if similarity(sig, other) >= SIMILARITY]
+
+    def similar(self, product, exclude=None):
+        """ID открытых заявок с похожим названием товара, от новых к старым"""
+        self.ensure_fresh()
+        sig = signature(normalize(product))
+        if sig is None:
+            return []
+        ids = set()
+        for other in self._similar_groups(sig):
+            ids |= self._groups[other]
+        ids.discard(exclude)
+        return sorted(ids, reverse=True)
+
+    def clusters(self, min_size=2):
+        """Группы похожих открытых заявок: списки ID, от больших групп к меньшим"""
+        self.ensure_fresh()
+        # Объединение названий, связанных сходством (система непересекающихся множеств)
+        parent = {sig: sig for sig in self._groups}
+
+        def find(sig):
+            while parent[sig] != sig:
+                parent[sig] = parent[parent[sig]]
+                sig = parent[sig]
+            return sig
+
+        for sig in self._groups:
+            for other in self._similar_groups(sig):
+                root, other_root = find(sig), find(other)
+                if root != other_root:
+                    parent[other_root] = root
+
+        clusters = {}
+        for sig, ids in self._groups.items():
+            clusters.setdefault(find(sig), []).extend(ids)
+        result = [sorted(ids) for ids in clusters.values() if len(ids) >= min_size]
+        result.sort(key=len, reverse=True)
+        return result
+
+
+_index = ProductIndex()
+
+
+def get_index():
+    return _index
+
+
+def similar_open_requests(request, limit=5):
+    """Похожие открытые заявки для уведомления о заявке: (всего, первые limit ID)"""
+    ids = _index.similar(request['product'], exclude=request['id'])
+    return len(ids), ids[:limit]
+
+
+def _on_change(kind, record, deleted):
+    if kind == 'request':
+        _index.update(record, deleted)
+
+
+database.add_change_listener(_on_change)
+
+
+# ========== КОМАНДА /clusters ==========
+# Сколько групп и заявок в группе показывать (ответ должен уложиться в 4096 символов)
+CLUSTERS_SHOWN = 10
+IDS_SHOWN = 8
+NAME_SHOWN = 60
+
+
+def _short(name):
+    return name if len(name) <= NAME_SHOWN else name[:NAME_SHOWN - 1] + '…'
+
+
+async def clusters_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Открытые заявки, сгруппированные по похожим товарам (команда /clusters)"""
+    if update.effective_user.id != get_settings().admin_id:
+        await update.message.reply_text("❌ Эта команда только для администратора")
+        return
+
+    clusters = _index.clusters()
+    if not clusters:
+        await update.message.reply_text("🧩 Похожих открытых заявок нет")
+        return
+
+    lines = [f"🧩 <b>ПОХОЖИЕ ОТКРЫТЫЕ ЗАЯВКИ</b>: групп {len(clusters)}, заявок {sum(map(len, clusters))}\n"]
+    for ids in clusters[:CLUSTERS_SHOWN]:
+        requests = [request for request in map(database.get_request, ids[-IDS_SHOWN:]) if request is not None]
+        names = sorted({_short(request['product']) for request in requests}, key=len)
+        cities = sorted({request['city'] for request in requests})
+        shown = ', '.join(f"#{request_id}" for request_id in ids[-IDS_SHOWN:])
+        more = f" и еще {len(ids) - IDS_SHOWN}" if len(ids) > IDS_SHOWN else ""
+        lines.append(
+            f"📦 <b>{html.escape(names[0])}</b> - {len(ids)} заявок\n"
+            + (f"   Варианты: {html.escape('; '.join(names[1:3]))}\n" if len(names) > 1 else "")
+            + f"   🏙️ {html.escape(', '.join(cities[:5]))}\n"
+            f"   {shown}{more}"
+        )
+    if len(clusters) > CLUSTERS_SHOWN:
+        lines.append(f"\n<i>Показаны {CLUSTERS_SHOWN} крупнейших групп из {len(clusters)}</i>")
+    await update.message.reply_html('\n'.join(lines))
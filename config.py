@@ -1,71 +1,14 @@
+import logging
 import os
-from dotenv import load_dotenv
-
-# ========== ЗАГРУЗКА ПЕРЕМЕННЫХ ОКРУЖЕНИЯ ==========
-# Загружаем переменные из файла .env
-load_dotenv()
-
-# Выводим информацию о загрузке для отладки
-print("=" * 50)
-print("🔧 НАСТРОЙКИ КОНФИГУРАЦИИ")
-print("=" * 50)
-
-# ========== ОБЯЗАТЕЛЬНЫЕ ПЕРЕМЕННЫЕ ==========
-# Токен бота от @BotFather
-BOT_TOKEN = os.getenv('BOT_TOKEN')
-if not BOT_TOKEN:
-    print("❌ ОШИБКА: BOT_TOKEN не найден в файле .env")
-    print("   Добавьте в .env строку: BOT_TOKEN=ваш_токен_бота")
-    BOT_TOKEN = None  # Без токена бот не запустится
-else:
-    print(f"✅ BOT_TOKEN загружен (первые 15 символов): {BOT_TOKEN[:15]}...")
-
-# ID администратора (ваш Telegram ID)
-ADMIN_ID_STR = os.getenv('ADMIN_ID')
-if not ADMIN_ID_STR:
-    print("❌ ОШИБКА: ADMIN_ID не найден в файле .env")
-    print("   Добавьте в .env строку: ADMIN_ID=ваш_telegram_id")
-    print("   ID можно получить у бота @userinfobot")
-    ADMIN_ID = None
-else:
-    try:
-        ADMIN_ID = int(ADMIN_ID_STR)
-        print(f"✅ ADMIN_ID загружен: {ADMIN_ID}")
-    except ValueError:
-        print(f"❌ ОШИБКА: ADMIN_ID должен быть числом, а не '{ADMIN_ID_STR}'")
-        ADMIN_ID = None
-
-# ========== ОПЦИОНАЛЬНЫЕ ПЕРЕМЕННЫЕ ==========
-# ID канала для публикации отзывов
-# Можно использовать username (@gipervygoda) или числовой ID (например: -1001234567890)
-CHANNEL_ID = os.getenv('CHANNEL_ID', '@gipervygoda')
-print(f"📢 Канал для публикации: {CHANNEL_ID}")
-print("   Примечание: Для ID каналов используйте формат -1001234567890")
-
-# Процент комиссии (по умолчанию 40%)
-COMMISSION_RATE_STR = os.getenv('COMMISSION_RATE', '0.4')
-try:
-    COMMISSION_RATE = float(COMMISSION_RATE_STR)
-    if not 0.01 <= COMMISSION_RATE <= 0.99:
-        print(f"⚠️  Внимание: COMMISSION_RATE {COMMISSION_RATE} выходит за разумные пределы (0.01-0.99)")
-        COMMISSION_RATE = 0.4
-except ValueError:
-    print(f"⚠️  Ошибка: COMMISSION_RATE должен быть числом, установлено 0.4 по умолчанию")
-    COMMISSION_RATE = 0.4
-print(f"💰 Процент комиссии: {int(COMMISSION_RATE * 100)}%")
-
-# Лимиты и настройки
-MAX_REVIEW_LENGTH = int(os.getenv('MAX_REVIEW_LENGTH', '1000'))  # Максимальная длина отзыва
-MIN_REVIEW_LENGTH = int(os.getenv('MIN_REVIEW_LENGTH', '10'))  # Минимальная длина отзыва
-REQUEST_TIMEOUT_HOURS = int(os.getenv('REQUEST_TIMEOUT_HOURS', '24'))  # Таймаут выполнения заявки
-
-print(f"📝 Максимальная длина отзыва: {MAX_REVIEW_LENGTH} символов")
-print(f"📝 Минимальная длина отзыва: {MIN_REVIEW_LENGTH} символов")
-print(f"⏰ Таймаут заявки: {REQUEST_TIMEOUT_HOURS} часов")
-
-# ========== НАСТРОЙКИ ПУБЛИКАЦИИ ==========
+from dataclasses import dataclass, fields, replace
+
+from dotenv import dotenv_values, find_dotenv, load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# ========== ШАБЛОНЫ ПО УМОЛЧАНИЮ ==========
 # Форматирование отзывов для канала
-REVIEW_TEMPLATE = os.getenv('REVIEW_TEMPLATE', """
+DEFAULT_REVIEW_TEMPLATE = """
 📢 <b>НОВЫЙ ОТЗЫВ</b>
 
 ⭐ <b>Оценка:</b> {stars}
@@ -73,10 +16,10 @@ REVIEW_TEMPLATE = os.getenv('REVIEW_TEMPLATE', """
 {review_text}
 
 <i>Спасибо за доверие! ❤️</i>
-""")
+"""
 
 # Форматирование уведомлений о новых заявках
-REQUEST_NOTIFICATION_TEMPLATE = os.getenv('REQUEST_NOTIFICATION_TEMPLATE', """
+DEFAULT_REQUEST_NOTIFICATION_TEMPLATE = """
 🚨 <b>НОВАЯ ЗАЯВКА #{request_id}</b>
 
 👤 Пользователь: @{username}
@@ -87,7 +30,7 @@ REQUEST_NOTIFICATION_TEMPLATE = os.getenv('REQUEST_NOTIFICATION_TEMPLATE', """
 
 🆔 ID заявки: {request_id}
 ⏰ Время создания: {created_at}
-""")
+"""
 
 # ========== КОНСТАНТЫ ДЛЯ СОСТОЯНИЙ ДИАЛОГА ==========
 # Состояния для диалога оформления заявки
@@ -100,51 +43,366 @@ REQUEST_NOTIFICATION_TEMPLATE = os.getenv('REQUEST_NOTIFICATION_TEMPLATE', """
 (WAITING_REVIEW_TEXT,
  WAITING_REVIEW_RATING) = range(4, 6)
 
-print(f"🎯 Состояния диалогов инициализированы")
+# Максимальная длина полей заявки, которые диалог держит в context.user_data
+MAX_PRODUCT_LENGTH = 200
+MAX_URL_LENGTH = 1000
+MAX_CITY_LENGTH = 100
+MAX_CONTACT_LENGTH = 100
+
+
+# ========== НАСТРОЙКИ ==========
+@dataclass(frozen=True)
+class Settings:
+    """Неизменяемые настройки бота, прочитанные из окружения один раз"""
+    bot_token: str = None
+    admin_id: int = None
+    # Адрес Bot API без /bot<токен> (пусто - api.telegram.org), например локальный
+    # benchmarks/fake_telegram.py или свой telegram-bot-api сервер
+    bot_api_url: str = None
+    # Можно использовать username (@gipervygoda) или числовой ID (например: -1001234567890)
+    channel_id: str = '@gipervygoda'
+    commission_rate: float = 0.4
+    max_review_length: int = 1000
+    min_review_length: int = 10
+    request_timeout_hours: int = 24
+    # Через сколько минут бездействия диалог /order или /review завершается (0 - никогда)
+    conversation_timeout_minutes: int = 30
+    # Сколько апдейтов обрабатывается параллельно (0 - строго по очереди)
+    concurrent_updates: int = 32
+    # Сколько секунд после SIGTERM дорабатываются апдейты и публикации
+    shutdown_timeout: int = 25
+    # Сколько постов в минуту публикуется в канал при массовой модерации
+    channel_posts_per_minute: int = 20
+    # Архивация закрытых заявок и отклоненных отзывов (archive.py)
+    archive_dir: str = 'archive'
+    archive_after_days: int = 30
+    # Пул операторов (operators.py): ((ID, вес), ...), пусто - только администратор;
+    # стратегия least_loaded|round_robin и через сколько минут невзятая заявка
+    # или непроверенный отзыв переходит к другому оператору
+    operators: tuple = ()
+    operator_strategy: str = 'least_loaded'
+    operator_timeout_minutes: int = 30
+    # Защита от повторных апдейтов (dedupe.py): журнал ('' - только в памяти), окно и размер
+    dedupe_file: str = 'dedupe.log'
+    dedupe_window_hours: int = 24
+    dedupe_max_entries: int = 100000
+    # Прием апдейтов (ingest.py): сколько апдейтов ждут обработки, пока менее
+    # срочные не начнут отбрасываться с ответом "попробуйте позже"
+    ingest_queue_size: int = 1000
+    # Запись обезличенных апдейтов (recorder.py): каталог ('' - выключено), размер файла,
+    # сколько файлов хранить и соль псевдонимов (пусто - выводится из токена)
+    record_updates_dir: str = ''
+    record_max_mb: int = 50
+    record_keep_files: int = 20
+    record_salt: str = None
+    # Сторож event loop (watchdog.py): порог зависания и адрес /healthz (порт 0 - выключен)
+    stall_threshold_ms: int = 1000
+    health_host: str = '127.0.0.1'
+    health_port: int = 0
+    # Логирование (logsetup.py): уровень, формат json|text и доля частых INFO событий
+    log_level: str = 'INFO'
+    log_format: str = 'json'
+    log_sample_rate: float = 0.1
+    # Многопроцессный запуск через supervisor.py (прием апдейтов вебхуком)
+    workers: int = 2
+    webhook_listen: str = '0.0.0.0'
+    webhook_port: int = 8443
+    webhook_path: str = '/webhook'
+    webhook_url: str = None
+    webhook_secret: str = None
+    review_template: str = DEFAULT_REVIEW_TEMPLATE
+    request_notification_template: str = DEFAULT_REQUEST_NOTIFICATION_TEMPLATE
+    # Замечания, найденные при разборе (выводятся в отчете о конфигурации)
+    warnings: tuple = ()
+
+    def bot_api_urls(self):
+        """base_url и base_file_url для Bot (пусто - официальный Bot API)"""
+        if not self.bot_api_url:
+            return {}
+        url = self.bot_api_url.rstrip('/')
+        return {'base_url': f"{url}/bot", 'base_file_url': f"{url}/file/bot"}
+
+
+def load_settings(environ=None):
+    """Разбирает переменные окружения в объект Settings, ничего не печатая"""
+    if environ is None:
+        # Загружаем переменные из файла .env
+        load_dotenv()
+        environ = os.environ
+
+    warnings = []
+
+    # Токен бота от @BotFather
+    bot_token = environ.get('BOT_TOKEN') or None
+
+    # ID администратора (ваш Telegram ID)
+    admin_id = None
+    admin_id_str = environ.get('ADMIN_ID')
+    if admin_id_str:
+        try:
+            admin_id = int(admin_id_str)
+        except ValueError:
+            warnings.append(f"ADMIN_ID должен быть числом, а не '{admin_id_str}'")
+
+    # Операторы: OPERATOR_IDS=111:3,222,333 (ID:вес, вес по умолчанию 1)
+    operators = []
+    for item in environ.get('OPERATOR_IDS', '').replace(';', ',').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        operator_id, _, weight = item.partition(':')
+        try:
+            operator_id, weight = int(operator_id), int(weight or '1')
+        except ValueError:
+            warnings.append(f"OPERATOR_IDS: пропущен некорректный элемент '{item}' (формат ID или ID:вес)")
+            continue
+        if weight < 1:
+            warnings.append(f"OPERATOR_IDS: вес оператора {operator_id} должен быть не меньше 1")
+            weight = 1
+        if operator_id not in dict(operators):
+            operators.append((operator_id, weight))
+
+    operator_strategy = environ.get('OPERATOR_STRATEGY', 'least_loaded').lower()
+    if operator_strategy not in ('least_loaded', 'round_robin'):
+        warnings.append(f"OPERATOR_STRATEGY должен быть least_loaded или round_robin, а не '{operator_strategy}'")
+        operator_strategy = 'least_loaded'
+
+    # Процент комиссии (по умолчанию 40%)
+    commission_rate_str = environ.get('COMMISSION_RATE', '0.4')
+    try:
+        commission_rate = float(commission_rate_str)
+        if not 0.01 <= commission_rate <= 0.99:
+            warnings.append(f"COMMISSION_RATE {commission_rate} выходит за разумные пределы (0.01-0.99)")
+            commission_rate = 0.4
+    except ValueError:
+        warnings.append("COMMISSION_RATE должен быть числом, установлено 0.4 по умолчанию")
+        commission_rate = 0.4
+
+    return Settings(
+        bot_token=bot_token,
+        admin_id=admin_id,
+        bot_api_url=environ.get('BOT_API_URL') or None,
+        channel_id=environ.get('CHANNEL_ID', '@gipervygoda'),
+        commission_rate=commission_rate,
+        # Лимиты и настройки
+        max_review_length=int(environ.get('MAX_REVIEW_LENGTH', '1000')),
+        min_review_length=int(environ.get('MIN_REVIEW_LENGTH', '10')),
+        request_timeout_hours=int(environ.get('REQUEST_TIMEOUT_HOURS', '24')),
+        conversation_timeout_minutes=max(int(environ.get('CONVERSATION_TIMEOUT_MINUTES', '30')), 0),
+        concurrent_updates=max(int(environ.get('CONCURRENT_UPDATES', '32')), 0),
+        shutdown_timeout=max(int(environ.get('SHUTDOWN_TIMEOUT', '25')), 1),
+        operators=tuple(operators),
+        operator_strategy=operator_strategy,
+        operator_timeout_minutes=max(int(environ.get('OPERATOR_TIMEOUT_MINUTES', '30')), 0),
+        channel_posts_per_minute=max(int(environ.get('CHANNEL_POSTS_PER_MINUTE', '20')), 1),
+        archive_dir=environ.get('ARCHIVE_DIR', 'archive'),
+        archive_after_days=max(int(environ.get('ARCHIVE_AFTER_DAYS', '30')), 0),
+        dedupe_file=environ.get('DEDUPE_FILE', 'dedupe.log'),
+        dedupe_window_hours=max(int(environ.get('DEDUPE_WINDOW_HOURS', '24')), 1),
+        dedupe_max_entries=max(int(environ.get('DEDUPE_MAX_ENTRIES', '100000')), 1000),
+        ingest_queue_size=max(int(environ.get('INGEST_QUEUE_SIZE', '1000')), 10),
+        record_updates_dir=environ.get('RECORD_UPDATES_DIR', ''),
+        record_max_mb=max(int(environ.get('RECORD_MAX_MB', '50')), 1),
+        record_keep_files=max(int(environ.get('RECORD_KEEP_FILES', '20')), 1),
+        record_salt=environ.get('RECORD_SALT') or None,
+        stall_threshold_ms=max(int(environ.get('STALL_THRESHOLD_MS', '1000')), 50),
+        health_host=environ.get('HEALTH_HOST', '127.0.0.1'),
+        health_port=int(environ.get('HEALTH_PORT', '0')),
+        log_level=environ.get('LOG_LEVEL', 'INFO').upper(),
+        log_format='text' if environ.get('LOG_FORMAT', 'json').lower() == 'text' else 'json',
+        log_sample_rate=min(max(float(environ.get('LOG_SAMPLE_RATE', '0.1')), 0.0), 1.0),
+        workers=max(int(environ.get('WORKERS', '2')), 1),
+        webhook_listen=environ.get('WEBHOOK_LISTEN', '0.0.0.0'),
+        # PORT выставляет Heroku для web-процесса
+        webhook_port=int(environ.get('WEBHOOK_PORT') or environ.get('PORT') or '8443'),
+        webhook_path=environ.get('WEBHOOK_PATH', '/webhook'),
+        webhook_url=environ.get('WEBHOOK_URL') or None,
+        webhook_secret=environ.get('WEBHOOK_SECRET') or None,
+        review_template=environ.get('REVIEW_TEMPLATE', DEFAULT_REVIEW_TEMPLATE),
+        request_notification_template=environ.get('REQUEST_NOTIFICATION_TEMPLATE',
+                                                  DEFAULT_REQUEST_NOTIFICATION_TEMPLATE),
+        warnings=tuple(warnings),
+    )
+
+
+_settings = None
+
+# Переменные окружения процесса до чтения .env: как и при запуске, они важнее .env
+_PROCESS_ENV = frozenset(os.environ)
+
+# Настройки, которые применяются только перезапуском: от них зависит уже
+# созданное (токен и адрес Bot API, процессы, порты, файлы журналов)
+RESTART_REQUIRED = frozenset({
+    'bot_token', 'bot_api_url', 'concurrent_updates', 'conversation_timeout_minutes',
+    'dedupe_file', 'dedupe_window_hours', 'dedupe_max_entries', 'ingest_queue_size',
+    'record_updates_dir', 'record_max_mb', 'record_keep_files', 'record_salt',
+    'health_host', 'health_port', 'log_format', 'workers',
+    'webhook_listen', 'webhook_port', 'webhook_path', 'webhook_url', 'webhook_secret',
+})
+
+
+def get_settings():
+    """Возвращает настройки, при первом вызове читая их из окружения"""
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
+
+def reload_settings():
+    """
+    Перечитывает .env и подменяет настройки одним присваиванием (по SIGHUP).
+    Обработчики, начатые до подмены, дорабатывают со старыми настройками,
+    следующие читают новые. Если новые настройки не проходят проверку,
+    остаются старые. Настройки из RESTART_REQUIRED сохраняют прежние значения
+    до перезапуска. Возвращает имена измененных настроек или None.
+    """
+    global _settings
+    old = get_settings()
+    dotenv = {key: value for key, value in dotenv_values(find_dotenv()).items()
+              if value is not None and key not in _PROCESS_ENV}
+    environ = {key: value for key, value in os.environ.items() if key in _PROCESS_ENV}
+    environ.update(dotenv)
+
+    try:
+        new = load_settings(environ)
+    except ValueError as e:
+        logger.error(f"❌ Настройки не перезагружены, остаются прежние: {e}")
+        return None
+    if not validate_config(new):
+        logger.error("❌ Настройки не перезагружены, остаются прежние")
+        return None
+
+    postponed = [name for name in sorted(RESTART_REQUIRED) if getattr(new, name) != getattr(old, name)]
+    if postponed:
+        logger.warning(f"⚠️  Применятся только после перезапуска: {', '.join(postponed)}")
+    new = replace(new, **{name: getattr(old, name) for name in RESTART_REQUIRED})
+    changed = [field.name for field in fields(Settings)
+               if field.name != 'warnings' and getattr(new, field.name) != getattr(old, field.name)]
+
+    # Окружение процесса тоже обновляется: его наследуют перезапускаемые процессы
+    for key in [key for key in os.environ if key not in _PROCESS_ENV and key not in dotenv]:
+        del os.environ[key]
+    os.environ.update(dotenv)
+
+    _settings = new
+    for warning in new.warnings:
+        logger.warning(f"⚠️  Внимание: {warning}")
+    logger.info(f"🔄 Настройки перезагружены: {', '.join(changed) if changed else 'без изменений'}")
+    return changed
+
+
+# Старые имена модуля (config.BOT_TOKEN и т.д.) читаются из объекта настроек
+_LEGACY_NAMES = {
+    'BOT_TOKEN': 'bot_token',
+    'ADMIN_ID': 'admin_id',
+    'CHANNEL_ID': 'channel_id',
+    'COMMISSION_RATE': 'commission_rate',
+    'MAX_REVIEW_LENGTH': 'max_review_length',
+    'MIN_REVIEW_LENGTH': 'min_review_length',
+    'REQUEST_TIMEOUT_HOURS': 'request_timeout_hours',
+    'CONCURRENT_UPDATES': 'concurrent_updates',
+    'CHANNEL_POSTS_PER_MINUTE': 'channel_posts_per_minute',
+    'WORKERS': 'workers',
+    'REVIEW_TEMPLATE': 'review_template',
+    'REQUEST_NOTIFICATION_TEMPLATE': 'request_notification_template',
+}
+
+
+def __getattr__(name):
+    if name in _LEGACY_NAMES:
+        return getattr(get_settings(), _LEGACY_NAMES[name])
+    if name == 'CONFIG_INFO':
+        return config_info()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ========== ОТЧЕТ О КОНФИГУРАЦИИ ==========
+def print_config_report(settings=None):
+    """Пишет в лог загруженные настройки (раньше печаталось при импорте модуля)"""
+    settings = settings or get_settings()
+    lines = []
+
+    lines.append("=" * 50)
+    lines.append("🔧 НАСТРОЙКИ КОНФИГУРАЦИИ")
+    lines.append("=" * 50)
+
+    if not settings.bot_token:
+        lines.append("❌ ОШИБКА: BOT_TOKEN не найден в файле .env")
+        lines.append("   Добавьте в .env строку: BOT_TOKEN=ваш_токен_бота")
+    else:
+        lines.append(f"✅ BOT_TOKEN загружен (первые 15 символов): {settings.bot_token[:15]}...")
+
+    if not settings.admin_id:
+        lines.append("❌ ОШИБКА: ADMIN_ID не найден в файле .env или некорректен")
+        lines.append("   Добавьте в .env строку: ADMIN_ID=ваш_telegram_id")
+        lines.append("   ID можно получить у бота @userinfobot")
+    else:
+        lines.append(f"✅ ADMIN_ID загружен: {settings.admin_id}")
+
+    if settings.bot_api_url:
+        lines.append(f"🛰 Bot API: {settings.bot_api_url}")
+    lines.append(f"📢 Канал для публикации: {settings.channel_id}")
+    lines.append("   Примечание: Для ID каналов используйте формат -1001234567890")
+    lines.append(f"💰 Процент комиссии: {int(settings.commission_rate * 100)}%")
+    lines.append(f"📝 Максимальная длина отзыва: {settings.max_review_length} символов")
+    lines.append(f"📝 Минимальная длина отзыва: {settings.min_review_length} символов")
+    lines.append(f"⏰ Таймаут заявки: {settings.request_timeout_hours} часов")
+    lines.append(f"⌛ Таймаут диалога: {settings.conversation_timeout_minutes or 'выключен'} мин")
+    if settings.operators:
+        operators = ', '.join(f"{operator_id}×{weight}" for operator_id, weight in settings.operators)
+        lines.append(f"👥 Операторы ({settings.operator_strategy}): {operators}, "
+                     f"переназначение через {settings.operator_timeout_minutes} мин")
+    lines.append(f"⚡ Параллельная обработка апдейтов: {settings.concurrent_updates or 'выключена'}")
+    lines.append(f"📥 Очередь апдейтов: до {settings.ingest_queue_size}")
+    if settings.record_updates_dir:
+        lines.append(f"🎞 Запись апдейтов: {settings.record_updates_dir} "
+                     f"(по {settings.record_max_mb} МБ, хранить {settings.record_keep_files} файлов)")
+
+    logger.info('\n'.join(lines))
+
+    for warning in settings.warnings:
+        logger.warning(f"⚠️  Внимание: {warning}")
 
 
 # ========== ПРОВЕРКА КОНФИГУРАЦИИ ==========
-def validate_config():
+def validate_config(settings=None):
     """Проверяет корректность конфигурации"""
+    settings = settings or get_settings()
     errors = []
 
-    if not BOT_TOKEN:
+    if not settings.bot_token:
         errors.append("BOT_TOKEN не установлен")
 
-    if not ADMIN_ID:
+    if not settings.admin_id:
         errors.append("ADMIN_ID не установлен или некорректен")
 
     # Проверяем, что токен выглядит как Telegram токен
-    if BOT_TOKEN and ':' not in BOT_TOKEN:
+    if settings.bot_token and ':' not in settings.bot_token:
         errors.append("BOT_TOKEN должен содержать двоеточие (формат: 123456:ABC-DEF1234)")
 
-    if not CHANNEL_ID:
+    if not settings.channel_id:
         errors.append("CHANNEL_ID не установлен")
 
     if errors:
-        print("\n" + "=" * 50)
-        print("❌ ОШИБКИ КОНФИГУРАЦИИ:")
-        for error in errors:
-            print(f"   • {error}")
-        print("=" * 50)
+        logger.error("❌ ОШИБКИ КОНФИГУРАЦИИ:\n" + '\n'.join(f"   • {error}" for error in errors))
         return False
 
-    print("\n" + "=" * 50)
-    print("✅ ВСЕ НАСТРОЙКИ ЗАГРУЖЕНЫ КОРРЕКТНО")
-    print("=" * 50)
+    logger.info("✅ ВСЕ НАСТРОЙКИ ЗАГРУЖЕНЫ КОРРЕКТНО")
     return True
 
 
 # ========== УТИЛИТЫ ==========
 def get_channel_message_url(message_id):
     """Генерирует ссылку на сообщение в канале"""
-    if CHANNEL_ID.startswith('-100'):
+    channel_id = str(get_settings().channel_id)
+    if channel_id.startswith('-100'):
         # Для числовых ID каналов
-        channel_id_clean = CHANNEL_ID.replace('-100', '')
+        channel_id_clean = channel_id.replace('-100', '')
         return f"https://t.me/c/{channel_id_clean}/{message_id}"
     else:
         # Для username каналов (@channelname)
-        channel_name = CHANNEL_ID.replace('@', '')
+        channel_name = channel_id.replace('@', '')
         return f"https://t.me/{channel_name}/{message_id}"
 
 
@@ -159,25 +417,30 @@ def format_price(price):
 def format_commission(price, commission_rate=None):
     """Рассчитывает и форматирует комиссию"""
     if commission_rate is None:
-        commission_rate = COMMISSION_RATE
+        commission_rate = get_settings().commission_rate
     commission = price * commission_rate
     return f"{int(commission):,}".replace(',', ' ')
 
 
 # ========== ИНФОРМАЦИЯ О КОНФИГЕ ==========
-CONFIG_INFO = f"""
+def config_info(settings=None):
+    """Возвращает справку по текущей конфигурации и формату .env"""
+    settings = settings or get_settings()
+    return f"""
 🛠️ Конфигурация бота "ГиперВыгода"
 
 Базовые настройки:
-• Токен бота: {'Установлен' if BOT_TOKEN else 'ОТСУТСТВУЕТ'}
-• Администратор: {ADMIN_ID if ADMIN_ID else 'НЕ УСТАНОВЛЕН'}
-• Канал для публикаций: {CHANNEL_ID}
-• Комиссия: {int(COMMISSION_RATE * 100)}%
+• Токен бота: {'Установлен' if settings.bot_token else 'ОТСУТСТВУЕТ'}
+• Администратор: {settings.admin_id if settings.admin_id else 'НЕ УСТАНОВЛЕН'}
+• Операторы: {', '.join(str(operator_id) for operator_id, _ in settings.operators) or 'только администратор'}
+• Канал для публикаций: {settings.channel_id}
+• Комиссия: {int(settings.commission_rate * 100)}%
 
 Лимиты:
-• Макс. длина отзыва: {MAX_REVIEW_LENGTH} символов
-• Мин. длина отзыва: {MIN_REVIEW_LENGTH} символов
-• Таймаут заявки: {REQUEST_TIMEOUT_HOURS} часов
+• Макс. длина отзыва: {settings.max_review_length} символов
+• Мин. длина отзыва: {settings.min_review_length} символов
+• Таймаут заявки: {settings.request_timeout_hours} часов
+• Параллельных апдейтов: {settings.concurrent_updates}
 
 Файл .env должен содержать:
 BOT_TOKEN=ваш_токен_от_BotFather
@@ -188,19 +451,36 @@ COMMISSION_RATE=0.4
 MAX_REVIEW_LENGTH=1000
 MIN_REVIEW_LENGTH=10
 REQUEST_TIMEOUT_HOURS=24
+CONVERSATION_TIMEOUT_MINUTES=30
+CONCURRENT_UPDATES=32
+OPERATOR_IDS=111111:2,222222
+OPERATOR_STRATEGY=least_loaded
+OPERATOR_TIMEOUT_MINUTES=30
+CHANNEL_POSTS_PER_MINUTE=20
+ARCHIVE_AFTER_DAYS=30
+DEDUPE_WINDOW_HOURS=24
+INGEST_QUEUE_SIZE=1000
+STALL_THRESHOLD_MS=1000
+HEALTH_PORT=8080
+LOG_FORMAT=json
+LOG_SAMPLE_RATE=0.1
+# Для supervisor.py (несколько процессов за вебхуком):
+WORKERS=2
+WEBHOOK_URL=https://example.com
+WEBHOOK_PORT=8443
+# Обязателен, если WEBHOOK_LISTEN не 127.0.0.1 (без него supervisor.py не запустится)
+WEBHOOK_SECRET=случайная_строка
 """
 
-# Автоматическая проверка конфигурации при импорте
+
+# Проверка конфигурации при запуске модуля напрямую; при импорте ничего не выполняется
 if __name__ == "__main__":
-    print(CONFIG_INFO)
+    from logsetup import setup_logging
+    setup_logging(fmt='text')
+    print_config_report()
+    print(config_info())
     validate_config()
-else:
-    # При импорте модуля просто проверяем конфигурацию
-    is_config_valid = validate_config()
-    if not is_config_valid and (BOT_TOKEN is None or ADMIN_ID is None):
-        print("\n⚠️  ВНИМАНИЕ: Бот может не запуститься из-за ошибок конфигурации")
-        print("   Проверьте файл .env в корневой папке проекта")
 
 
 def WAITING_FOR_LINK():
-    return None
\ No newline at end of file
+    return None
@@ -1,181 +1,899 @@
-import json
+import logging
 import os
+import time
+from bisect import bisect_right, insort
+from collections import Counter, deque
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import chain
+from operator import attrgetter
+
+from config import get_settings
+from jsonfiles import file_lock, file_stamp, read_json, touch, write_json
+from records import TIME_FORMAT, Request, Review
+
+logger = logging.getLogger(__name__)
 
 # Имена файлов для хранения данных
 DB_FILE = 'requests.json'
 REVIEWS_FILE = 'reviews.json'
 
+# Длительность последних записей таблиц на диск, с (для /healthz в watchdog.py)
+save_timings = deque(maxlen=200)
 
-# ========== УТИЛИТЫ ==========
-def _read_json(filename):
-    """Читает JSON файл, создает если его нет"""
-    if not os.path.exists(filename):
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump({'requests': []} if 'request' in filename else {'reviews': []},
-                      f, ensure_ascii=False, indent=2)
+# Сколько последних перечитываний частей помнит таблица (см. get_reloaded_ranges)
+RELOAD_LOG_SIZE = 64
 
-    with open(filename, 'r', encoding='utf-8') as f:
-        return json.load(f)
 
+# ========== СВОДКИ ==========
+def summarize(kind, records):
+    """Сводка по записям типа kind: число, статусы и суммы для get_statistics"""
+    summary = {
+        'count': len(records),
+        'statuses': dict(Counter(record['status'] for record in records)),
+    }
+    if kind == 'request':
+        summary['economy'] = sum(record['economy'] or 0 for record in records)
+        summary['commission'] = sum(record['commission'] or 0 for record in records)
+    else:
+        summary['approved_rating_sum'] = sum(record['rating'] for record in records if record['status'] == 'approved')
+    return summary
+
+
+def empty_summary():
+    return {'count': 0, 'statuses': Counter(), 'economy': 0, 'commission': 0, 'approved_rating_sum': 0}
+
+
+def add_summary(total, summary):
+    """Добавляет сводку summary к итогу total (из empty_summary())"""
+    total['count'] += summary['count']
+    total['statuses'].update(summary['statuses'])
+    for field in ('economy', 'commission', 'approved_rating_sum'):
+        total[field] += summary.get(field, 0)
+    return total
+
+
+def _legacy_month(record):
+    """Месяц создания записи старого формата ГГГГ-ММ; None, если даты нет или она не в TIME_FORMAT"""
+    try:
+        return datetime.strptime(record.get('created_at'), TIME_FORMAT).strftime('%Y-%m')
+    except (TypeError, ValueError):
+        return None
+
+
+class _Partition:
+    """Часть таблицы: записи одного месяца в отдельном JSON файле"""
+
+    __slots__ = ('file', 'month', 'min_id', 'max_id', 'statuses', 'users', 'summary', 'data', 'stamp')
+
+    def __init__(self, file, month, min_id, max_id=None, statuses=None, users=None, summary=None):
+        self.file = file
+        self.month = month
+        self.min_id = min_id
+        # None у текущей части: ее диапазон ID открыт сверху
+        self.max_id = max_id
+        # Для закрытой части (у текущей не ведутся): статусы и пользователи,
+        # которые могут в ней встретиться, и сводка для статистики
+        self.statuses = set(statuses) if statuses is not None else None
+        self.users = set(users) if users is not None else None
+        self.summary = summary
+        self.data = None
+        self.stamp = None
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(entry['file'], entry['month'], entry['min_id'], entry.get('max_id'), entry.get('statuses'),
+                   entry.get('users'), entry.get('summary'))
+
+    def entry(self):
+        """Запись о части в манифесте"""
+        entry = {'file': self.file, 'month': self.month, 'min_id': self.min_id, 'max_id': self.max_id}
+        if self.max_id is not None:
+            entry['statuses'] = sorted(self.statuses)
+            if self.users is not None:
+                entry['users'] = sorted(self.users)
+            if self.summary is not None:
+                entry['summary'] = self.summary
+        return entry
+
+    def seal(self, kind, records):
+        """Заполняет статусы, пользователей и сводку закрытой части по ее записям"""
+        self.statuses = {record['status'] for record in records}
+        self.users = {record['user_id'] for record in records}
+        self.summary = summarize(kind, records)
+
+    @property
+    def indexed(self):
+        """Есть ли у части все, что манифест хранит для закрытых частей"""
+        return self.max_id is None or (self.users is not None and self.summary is not None)
+
+
+class _Table:
+    """
+    Таблица записей, разбитая по месяцам: requests.json - манифест со списком
+    частей и диапазонов ID, сами записи - в requests-ГГГГ-ММ.json рядом с ним.
+    Новые записи попадают в текущую (последнюю) часть; в начале транзакции в
+    новом месяце начинается новая часть, а прежняя закрывается с диапазоном
+    [min_id, max_id]. Поэтому запись на диск переписывает только одну часть,
+    и ее размер не растет с историей. last_id и прогресс импорта (migrations)
+    хранятся в текущей части.
+
+    Части читаются при первом обращении: find() загружает только часть,
+    которой принадлежит ID, выборки по статусу и пользователю - только
+    части, где этот статус или пользователь может быть (манифест хранит для
+    закрытых частей наборы статусов и пользователей), records() - все.
+    Статистика (summary()) складывается из сводок закрытых частей в
+    манифесте и текущей части, не читая прошлые месяцы. Разобранные части держатся в памяти и перечитываются,
+    только если файл изменился на диске (другим процессом или вручную).
+    Чтобы не проверять каждую загруженную часть, save() отмечает изменение
+    временем файла блокировки <файл>.lock: refresh() и версии данных
+    сверяют только его, а части перебирают, когда его тронул другой процесс.
+    Все изменения идут через transaction(), которая держит блокировку
+    манифеста между процессами; save() записывает части, записи которых
+    были выданы или изменены в транзакции.
+
+    Для выборок по статусу и пользователю ведутся индексы status -> {id: запись}
+    и user_id -> {id: запись}; статус записи меняется только через
+    set_status(), чтобы индекс не разошелся.
+    В памяти записи хранятся компактными объектами record_type (records.py),
+    в словари они превращаются только при записи на диск.
+
+    Старый файл с одним списком записей при первом открытии разбивается на
+    части по месяцам создания записей; в манифест прежнего формата при первом
+    открытии дописываются пользователи и сводки закрытых частей.
+    """
+
+    def __init__(self, filename_getter, kind, key, record_type):
+        self._filename_getter = filename_getter
+        self.kind = kind
+        self.key = key
+        self.record_type = record_type
+        self._filename = None
+        self._stamp = None
+        self._marker = None  # отпечаток <файл>.lock после последней сверки
+        self._partitions = []  # по возрастанию ID, последняя - текущая
+        self._starts = []
+        self._dirty = set()
+        self._by_id = {}
+        self._by_status = {}
+        self._by_user = {}
+        self._in_transaction = False
+        # Растет, когда загруженные данные перечитаны с диска, но не при собственных save()
+        self.generation = 0
+        # (generation, min_id, max_id) перечитанных или сброшенных частей
+        self.reloads = deque(maxlen=RELOAD_LOG_SIZE)
+
+    # ----- манифест и части -----
+    def _path(self, partition):
+        return os.path.join(os.path.dirname(os.path.abspath(self._filename)), partition.file)
+
+    def _marker_path(self):
+        # Файл блокировки заодно служит отметкой об изменении таблицы
+        return self._filename + '.lock'
+
+    def _partition_file(self, month):
+        root, ext = os.path.splitext(os.path.basename(self._filename))
+        return f"{root}-{month}{ext}"
+
+    def _open(self):
+        """Перечитывает манифест, если он изменился; возвращает текущую часть"""
+        filename = self._filename_getter()
+        if filename != self._filename:
+            self._filename = filename
+            self._stamp = None
+            self._marker = None
+            self._set_partitions([])
+        stamp = file_stamp(filename)
+        if stamp is None or stamp != self._stamp:
+            if stamp is None:
+                self._create()
+            manifest = read_json(filename)
+            if self.key in manifest:
+                manifest = self._split_legacy()
+            self._set_partitions([_Partition.from_entry(entry) for entry in manifest['partitions']])
+            if not all(partition.indexed for partition in self._partitions):
+                self._index_sealed()
+            self._stamp = file_stamp(filename)
+        return self._partitions[-1]
+
+    def _set_partitions(self, partitions):
+        # Уже разобранные части переносятся, если остались в манифесте
+        known = {partition.file for partition in self._partitions}
+        loaded = {partition.file: partition for partition in self._partitions if partition.data is not None}
+        for partition in partitions:
+            previous = loaded.pop(partition.file, None)
+            if previous is not None:
+                partition.data, partition.stamp = previous.data, previous.stamp
+            elif known and partition.file not in known:
+                # Часть начал другой процесс (новый месяц): в ней уже могут быть записи
+                self._reloaded(partition)
+        for dropped in loaded.values():
+            self._unindex(dropped)
+            self._reloaded(dropped)
+        self._partitions = partitions
+        self._starts = [partition.min_id for partition in partitions]
+
+    def _write_manifest(self, partitions):
+        write_json(self._filename, {'partitions': [partition.entry() for partition in partitions]})
+
+    def _save_manifest(self):
+        self._write_manifest(self._partitions)
+        self._stamp = file_stamp(self._filename)
+
+    def _fresh(self, partition):
+        """Данные части, при необходимости (пере)читанные с диска"""
+        path = self._path(partition)
+        stamp = file_stamp(path)
+        if partition.data is not None:
+            if stamp == partition.stamp:
+                return partition.data
+            self._unindex(partition)
+            self._reloaded(partition)
+
+        data = read_json(path)
+        from_dict = self.record_type.from_dict
+        data[self.key] = [from_dict(record) for record in data[self.key]]
+        partition.data = data
+        partition.stamp = stamp
+        for record in data[self.key]:
+            self._add_to_index(record)
+        return data
+
+    def _add_to_index(self, record):
+        self._by_id[record.id] = record
+        self._by_status.setdefault(record.status, {})[record.id] = record
+        self._by_user.setdefault(record.user_id, {})[record.id] = record
+
+    def _remove_from_index(self, record):
+        self._by_id.pop(record.id, None)
+        for index, key in ((self._by_status, record.status), (self._by_user, record.user_id)):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(record.id, None)
+                if not bucket and index is self._by_user:
+                    del index[key]
+
+    def _unindex(self, partition):
+        for record in partition.data[self.key]:
+            self._remove_from_index(record)
+        partition.data = None
+        partition.stamp = None
+
+    def _reloaded(self, partition):
+        """Данные части сброшены и будут перечитаны с диска"""
+        self.generation += 1
+        self.reloads.append((self.generation, partition.min_id, partition.max_id))
+
+    def _owner(self, record_id):
+        """Часть, диапазону которой принадлежит ID (None - ID меньше первой части)"""
+        index = bisect_right(self._starts, record_id) - 1
+        return self._partitions[index] if index >= 0 else None
+
+    @contextmanager
+    def _locked(self):
+        if self._in_transaction:
+            yield
+            return
+        with file_lock(self._filename):
+            yield
+
+    def _create(self):
+        """Создает пустую таблицу из одной части, если манифеста еще нет"""
+        with self._locked():
+            if os.path.exists(self._filename):
+                return
+            month = datetime.now().strftime('%Y-%m')
+            head = _Partition(self._partition_file(month), month, 1)
+            if not os.path.exists(self._path(head)):
+                write_json(self._path(head), {self.key: []})
+            self._write_manifest([head])
+
+    def _split_legacy(self):
+        """Разбивает файл старого формата (один список записей) на части по месяцам"""
+        with self._locked():
+            data = read_json(self._filename)
+            if self.key not in data:
+                return data
+
+            records = sorted(data[self.key], key=lambda record: record['id'])
+            now = datetime.now().strftime('%Y-%m')
+            # Месяц части не убывает с ID, чтобы диапазоны частей не пересекались.
+            # Запись без распознанной даты остается в части предыдущей записи
+            # (первые такие - в части первой записи с датой)
+            months = [_legacy_month(record) for record in records]
+            fallback = next((month for month in months if month is not None), now)
+            groups = []
+            for record, month in zip(records, months):
+                if month is None:
+                    month = groups[-1][0] if groups else fallback
+                if not groups or month > groups[-1][0]:
+                    groups.append((month, []))
+                groups[-1][1].append(record)
+            if not groups:
+                groups.append((now, []))
+
+            last_id = data.get('last_id') or (records[-1]['id'] if records else 0)
+            metadata = {key: value for key, value in data.items() if key != self.key}
+            metadata['last_id'] = last_id
+
+            partitions = []
+            for index, (month, group) in enumerate(groups):
+                is_head = index == len(groups) - 1
+                partition = _Partition(
+                    self._partition_file(month), month,
+                    partitions[-1].max_id + 1 if partitions else 1,
+                    None if is_head else groups[index + 1][1][0]['id'] - 1)
+                if not is_head:
+                    partition.seal(self.kind, group)
+                write_json(self._path(partition), {self.key: group, **metadata} if is_head else {self.key: group})
+                partitions.append(partition)
+
+            # Манифест записывается последним: до этого момента файл остается в старом формате
+            self._write_manifest(partitions)
+            logger.info(f"{self._filename} разбит по месяцам: {len(partitions)} частей, {len(records)} записей")
+            return read_json(self._filename)
+
+    def _index_sealed(self):
+        """Дописывает в манифест прежнего формата пользователей и сводки закрытых частей"""
+        with self._locked():
+            # Под блокировкой: манифест мог измениться, пока ее ждали
+            self._set_partitions([_Partition.from_entry(entry) for entry in read_json(self._filename)['partitions']])
+            missing = [partition for partition in self._partitions if not partition.indexed]
+            if not missing:
+                return
+            for partition in missing:
+                loaded = partition.data is not None
+                partition.seal(self.kind, self._fresh(partition)[self.key])
+                if not loaded:
+                    # Часть читалась только ради сводки, держать ее в памяти незачем
+                    self._unindex(partition)
+            self._save_manifest()
+            logger.info(f"В манифест {self._filename} добавлены сводки частей: {len(missing)}")
+
+    def _roll_over(self):
+        """В новом месяце закрывает текущую часть и начинает новую (внутри transaction)"""
+        head = self._partitions[-1]
+        month = datetime.now().strftime('%Y-%m')
+        if month <= head.month:
+            return
+
+        data = self._fresh(head)
+        records = data[self.key]
+        last_id = data.get('last_id') or max((record.id for record in records), default=head.min_id - 1)
+        metadata = {key: value for key, value in data.items() if key != self.key}
+        metadata['last_id'] = last_id
+        new_head = _Partition(self._partition_file(month), month, last_id + 1 if records else head.min_id)
+        new_head.data = {self.key: [], **metadata}
+        write_json(self._path(new_head), new_head.data)
+        new_head.stamp = file_stamp(self._path(new_head))
+
+        if records:
+            head.max_id = last_id
+            head.seal(self.kind, records)
+            self._partitions = self._partitions + [new_head]
+        else:
+            # Пустая часть не нужна: ее диапазон переходит к новой
+            self._partitions = self._partitions[:-1] + [new_head]
+        self._starts = [partition.min_id for partition in self._partitions]
+        self._save_manifest()
+        if not records and os.path.exists(self._path(head)):
+            os.unlink(self._path(head))
+        logger.info(f"Начата новая часть {new_head.file} с ID {new_head.min_id}")
+
+    # ----- чтение -----
+    def load(self):
+        """Загружает все части (для выборок по всей таблице)"""
+        self._open()
+        for partition in self._partitions:
+            self._fresh(partition)
+
+    def refresh(self):
+        """
+        Перечитывает загруженные части, если таблицу изменил другой процесс,
+        не загружая новых. Без чужих изменений - две проверки файлов.
+        """
+        self._open()
+        stamp = file_stamp(self._marker_path())
+        if stamp == self._marker:
+            return
+        self._marker = stamp
+        for partition in self._partitions:
+            if partition.data is not None:
+                self._fresh(partition)
+
+    def head(self):
+        """Данные текущей части (с last_id и migrations)"""
+        head = self._open()
+        if self._in_transaction:
+            self._dirty.add(head)
+        return self._fresh(head)
+
+    def records(self):
+        """Все записи в порядке ID (новый список)"""
+        self.load()
+        return list(chain.from_iterable(partition.data[self.key] for partition in self._partitions))
+
+    def iter_records(self, months=None):
+        """Записи по частям; months(месяц) -> bool позволяет не читать ненужные месяцы"""
+        self._open()
+        for partition in list(self._partitions):
+            if months is None or months(partition.month):
+                yield from self._fresh(partition)[self.key]
+
+    def iter_range(self, min_id, max_id=None):
+        """Записи с ID от min_id до max_id включительно (None - до конца)"""
+        self._open()
+        for partition in list(self._partitions):
+            if max_id is not None and partition.min_id > max_id:
+                break
+            if partition.max_id is not None and partition.max_id < min_id:
+                continue
+            for record in self._fresh(partition)[self.key]:
+                if min_id <= record.id and (max_id is None or record.id <= max_id):
+                    yield record
+
+    def find(self, record_id):
+        self._open()
+        partition = self._owner(record_id)
+        if partition is None:
+            return None
+        self._fresh(partition)
+        record = self._by_id.get(record_id)
+        if record is not None and self._in_transaction:
+            self._dirty.add(partition)
+        return record
+
+    def _load_status(self, status):
+        self._open()
+        for partition in self._partitions:
+            if partition.statuses is None or status in partition.statuses:
+                self._fresh(partition)
+
+    def with_status(self, status):
+        """Записи со статусом status в порядке ID"""
+        self._load_status(status)
+        bucket = self._by_status.get(status)
+        if not bucket:
+            return []
+        return sorted(bucket.values(), key=attrgetter('id'))
+
+    def count_status(self, status):
+        self._load_status(status)
+        return len(self._by_status.get(status, ()))
+
+    def with_user(self, user_id):
+        """Записи пользователя в порядке ID (читаются только части, где он есть)"""
+        self._open()
+        for partition in self._partitions:
+            if partition.users is None or user_id in partition.users:
+                self._fresh(partition)
+        bucket = self._by_user.get(user_id)
+        if not bucket:
+            return []
+        return sorted(bucket.values(), key=attrgetter('id'))
+
+    def summary(self):
+        """Сводка по таблице: сводки закрытых частей из манифеста и текущая часть"""
+        self._open()
+        total = empty_summary()
+        for partition in self._partitions:
+            if partition.summary is not None:
+                add_summary(total, partition.summary)
+            else:
+                add_summary(total, summarize(self.kind, self._fresh(partition)[self.key]))
+        return total
+
+    def last_id(self):
+        data = self.head()
+        return data.get('last_id') or max((record.id for record in data[self.key]), default=0)
+
+    # ----- изменение (внутри transaction) -----
+    @contextmanager
+    def transaction(self):
+        """Блокирует таблицу для чтения-изменения-записи; вложенные вызовы разрешены"""
+        if self._in_transaction:
+            yield self
+            return
+
+        self._open()
+        with file_lock(self._filename):
+            self._in_transaction = True
+            try:
+                # Перечитываем манифест и части, если другой процесс успел их изменить
+                self.refresh()
+                self._roll_over()
+                yield self
+            finally:
+                self._in_transaction = False
+                self._dirty.clear()
+
+    def next_id(self):
+        """Выделяет следующий ID в текущей части"""
+        data = self.head()
+        last_id = data.get('last_id')
+        if last_id is None:
+            last_id = max((record.id for record in data[self.key]), default=self._partitions[-1].min_id - 1)
+        data['last_id'] = last_id + 1
+        return last_id + 1
+
+    def set_status(self, record, status):
+        """Меняет статус записи с обновлением индекса"""
+        old_bucket = self._by_status.get(record['status'])
+        if old_bucket is not None:
+            old_bucket.pop(record['id'], None)
+        record['status'] = status
+        self._by_status.setdefault(status, {})[record['id']] = record
+        self._dirty.add(self._owner(record['id']))
+
+    def append(self, record):
+        """Добавляет запись (объект record_type или словарь) и возвращает добавленный объект"""
+        if not isinstance(record, self.record_type):
+            record = self.record_type.from_dict(record)
+        partition = self._owner(record['id'])
+        self._fresh(partition)[self.key].append(record)
+        self._add_to_index(record)
+        self._dirty.add(partition)
+        return record
+
+    def remove(self, record_ids):
+        """Удаляет записи по ID из их частей; возвращает удаленные записи"""
+        wanted = {}
+        for record_id in record_ids:
+            partition = self._owner(record_id)
+            if partition is not None:
+                wanted.setdefault(partition, set()).add(record_id)
+
+        removed = []
+        for partition in sorted(wanted, key=attrgetter('min_id')):
+            ids = wanted[partition]
+            data = self._fresh(partition)
+            kept = []
+            for record in data[self.key]:
+                (removed if record.id in ids else kept).append(record)
+            if len(kept) == len(data[self.key]):
+                continue
+            data[self.key] = kept
+            for record_id in ids:
+                record = self._by_id.get(record_id)
+                if record is not None:
+                    self._remove_from_index(record)
+            self._dirty.add(partition)
+        return removed
+
+    def save(self):
+        """Записывает измененные части на диск; при ошибке сбрасывает кэш части"""
+        started = time.perf_counter()
+        for partition in sorted(self._dirty, key=attrgetter('min_id')):
+            sealed = None
+            if partition.max_id is not None:
+                sealed = _Partition(partition.file, partition.month, partition.min_id, partition.max_id)
+                sealed.seal(self.kind, partition.data[self.key])
+                if (not sealed.statuses <= partition.statuses or not sealed.users <= partition.users
+                        or sealed.summary != partition.summary):
+                    # Наборы статусов и пользователей в манифесте расширяются до
+                    # записи части и сужаются после нее, а сводка на это время
+                    # снимается: при сбое наборы только шире настоящих, а сводку
+                    # пересчитает следующее открытие таблицы
+                    partition.statuses |= sealed.statuses
+                    partition.users |= sealed.users
+                    partition.summary = None
+                    self._save_manifest()
+
+            try:
+                write_json(self._path(partition), partition.data)
+            except Exception:
+                self._unindex(partition)
+                self._reloaded(partition)
+                raise
+            partition.stamp = file_stamp(self._path(partition))
+
+            if sealed is not None and (sealed.statuses != partition.statuses or sealed.users != partition.users
+                                       or sealed.summary != partition.summary):
+                partition.statuses, partition.users, partition.summary = sealed.statuses, sealed.users, sealed.summary
+                self._save_manifest()
+        if self._dirty:
+            # Под блокировкой транзакции: чужих изменений после refresh() не было
+            touch(self._marker_path())
+            self._marker = file_stamp(self._marker_path())
+        self._dirty.clear()
+        save_timings.append(time.perf_counter() - started)
+
+
+_requests = _Table(lambda: DB_FILE, 'request', 'requests', Request)
+_reviews = _Table(lambda: REVIEWS_FILE, 'review', 'reviews', Review)
+_tables = {'request': _requests, 'review': _reviews}
+
+
+# ========== ПОДПИСКА НА ИЗМЕНЕНИЯ ==========
+_change_listeners = []
+
+
+def add_change_listener(listener):
+    """
+    Регистрирует listener(kind, record, deleted), который вызывается после
+    каждой записи этим процессом. kind - 'request' или 'review'.
+    """
+    _change_listeners.append(listener)
+
+
+def remove_change_listener(listener):
+    """Отменяет регистрацию listener (add_change_listener)"""
+    try:
+        _change_listeners.remove(listener)
+    except ValueError:
+        pass
+
+
+def _notify(kind, record, deleted=False):
+    for listener in _change_listeners:
+        try:
+            listener(kind, record, deleted)
+        except Exception as e:
+            logger.error(f"Ошибка в обработчике изменений {listener!r}: {e}")
+
+
+def locked(kind):
+    """Транзакция над хранилищем kind ('request' или 'review') для внешних модулей"""
+    return _tables[kind].transaction()
+
+
+def remove_records(kind, record_ids):
+    """
+    Удаляет записи из хранилища; возвращает удаленные записи. Части разных
+    месяцев записываются по очереди: после сбоя удаленной может оказаться
+    только часть записей (archive.py доводит такое удаление до конца).
+    """
+    table = _tables[kind]
+    with table.transaction():
+        removed = table.remove(set(record_ids))
+        if removed:
+            table.save()
+
+    for record in removed:
+        _notify(kind, record, deleted=True)
+    return removed
+
+
+def get_present_ids(kind, record_ids):
+    """ID из record_ids, записи которых есть в рабочей базе (архив не смотрится)"""
+    table = _tables[kind]
+    return {record_id for record_id in record_ids if table.find(record_id) is not None}
+
+
+def get_last_id(kind):
+    """Последний выданный ID"""
+    return _tables[kind].last_id()
+
+
+def import_records(kind, records, source_key=None, position=None, before_save=None):
+    """
+    Добавляет записи с новыми ID одной записью на диск (для migrate.py).
+
+    Позиция position в источнике source_key сохраняется в том же файле, так что
+    после сбоя пачка либо импортирована вместе с отметкой о прогрессе, либо нет.
+    before_save(records) вызывается после выдачи ID и возвращает записи,
+    которые нужно оставить в рабочей базе (остальные он сохраняет сам).
+    """
+    table = _tables[kind]
+    with table.transaction():
+        for record in records:
+            record['id'] = table.next_id()
+        hot = before_save(records) if before_save is not None else records
+
+        hot = [table.append(record) for record in hot]
+        if source_key is not None:
+            table.head().setdefault('migrations', {})[source_key] = position
+        table.save()
+
+    for record in hot:
+        _notify(kind, record)
+    return hot
+
+
+def get_migration_position(kind, source_key):
+    """Сколько записей источника source_key уже импортировано"""
+    return _tables[kind].head().get('migrations', {}).get(source_key, 0)
 
-def _write_json(filename, data):
-    """Записывает данные в JSON файл"""
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
 
+def iter_records(kind, months=None):
+    """
+    Итератор по записям рабочей базы без копирования списка. months(ГГГГ-ММ)
+    -> bool пропускает части за ненужные месяцы, не читая их.
+    """
+    return _tables[kind].iter_records(months)
 
-# ========== СИСТЕМА ЗАЯВОК ==========
-def save_request(user_data):
-    """Сохраняет заявку в базу и возвращает её ID"""
-    data = _read_json(DB_FILE)
-
-    request_id = len(data['requests']) + 1
-    request = {
-        'id': request_id,
-        'user_id': user_data['user_id'],
-        'username': user_data.get('username', ''),
-        'product': user_data['product'],
-        'known_price': user_data['known_price'],
-        'city': user_data['city'],
-        'contact': user_data['contact'],
-        'status': 'new',  # new, in_progress, completed, cancelled
-        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'found_price': None,
-        'economy': None,
-        'commission': None,
-        'notes': ''
-    }
 
-    data['requests'].append(request)
-    _write_json(DB_FILE, data)
+def get_data_version(kind):
+    """
+    Версия данных ('request' или 'review'): меняется, когда данные перечитаны
+    с диска (их изменил другой процесс). Собственные записи процесса приходят
+    в обработчики изменений и версию не меняют. Проверка не зависит от числа
+    загруженных частей (см. _Table.refresh).
+    """
+    table = _tables[kind]
+    table.refresh()
+    return table.generation
+
+
+def get_reloaded_ranges(kind, since):
+    """
+    Диапазоны ID (min_id, max_id; max_id None - до конца), перечитанные с
+    диска после версии since, - чтобы индекс поверх хранилища мог обновить
+    только их. Версию нужно сначала проверить get_data_version. None - если
+    since еще не было или журнал перечитываний его уже не покрывает: тогда
+    данные нужно взять заново целиком.
+    """
+    table = _tables[kind]
+    if since is None or since > table.generation:
+        return None
+    reloads = [(generation, min_id, max_id) for generation, min_id, max_id in table.reloads if generation > since]
+    if len(reloads) < table.generation - since:
+        return None
+    return sorted({(min_id, max_id) for _, min_id, max_id in reloads}, key=lambda item: item[0])
+
+
+def iter_range(kind, min_id, max_id=None):
+    """Записи рабочей базы с ID от min_id до max_id включительно (None - до конца)"""
+    return _tables[kind].iter_range(min_id, max_id)
 
+
+# ========== СИСТЕМА ЗАЯВОК ==========
+def save_request(user_data, operator_id=None):
+    """Сохраняет заявку в базу и возвращает её ID; operator_id - сразу назначить оператору"""
+    with _requests.transaction():
+        request_id = _requests.next_id()
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        request = {
+            'id': request_id,
+            'user_id': user_data['user_id'],
+            'username': user_data.get('username', ''),
+            'product': user_data['product'],
+            'known_price': user_data['known_price'],
+            'city': user_data['city'],
+            'contact': user_data['contact'],
+            'status': 'new',  # new, in_progress, completed, cancelled
+            'created_at': now,
+            'updated_at': now,
+            'found_price': None,
+            'economy': None,
+            'commission': None,
+            'notes': '',
+            'operator_id': operator_id,  # оператор, которому назначена заявка (operators.py)
+            'assigned_at': now if operator_id is not None else None
+        }
+
+        request = _requests.append(request)
+        _requests.save()
+
+    _notify('request', request)
     return request_id
 
 
 def get_user_requests(user_id):
     """Получает все заявки пользователя"""
-    data = _read_json(DB_FILE)
-    return [req for req in data['requests'] if req['user_id'] == user_id]
+    return _requests.with_user(user_id)
 
 
 def get_all_requests():
     """Получает все заявки (для админа)"""
-    data = _read_json(DB_FILE)
-    return data['requests']
+    return _requests.records()
 
 
 def get_request(request_id):
-    """Получает заявку по ID"""
-    data = _read_json(DB_FILE)
-    for request in data['requests']:
-        if request['id'] == request_id:
-            return request
-    return None
-
-
-def update_request(request_id, **kwargs):
-    """Обновляет заявку (найденная цена, статус и т.д.)"""
-    data = _read_json(DB_FILE)
-    updated = False
-
-    for request in data['requests']:
-        if request['id'] == request_id:
-            # Обновляем поля
-            for key, value in kwargs.items():
-                if key in request:
-                    request[key] = value
-
-            # Автоматически рассчитываем экономию и комиссию
-            if 'found_price' in kwargs and request['known_price'] and kwargs['found_price']:
-                request['economy'] = request['known_price'] - kwargs['found_price']
-                if request['economy'] > 0:
-                    request['commission'] = request['economy'] * 0.4  # 40% комиссия
-
-            request['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            updated = True
-            break
-
-    if updated:
-        _write_json(DB_FILE, data)
-        return True
-    return False
+    """Получает заявку по ID (если ее нет в рабочей базе - ищет в архиве)"""
+    request = _requests.find(request_id)
+    if request is None:
+        from archive import find_archived
+        request = find_archived('request', request_id)
+    return request
+
+
+def update_request(request_id, expected_status=None, **kwargs):
+    """
+    Обновляет заявку (найденная цена, статус и т.д.).
+    Если передан expected_status, заявка меняется только из этого статуса -
+    так несколько процессов не применят один и тот же переход дважды.
+    """
+    with _requests.transaction():
+        request = _requests.find(request_id)
+        if request is None:
+            return False
+        if expected_status is not None and request['status'] != expected_status:
+            return False
+
+        # Обновляем поля
+        for key, value in kwargs.items():
+            if key == 'status':
+                _requests.set_status(request, value)
+            elif key in request:
+                request[key] = value
+
+        # Автоматически рассчитываем экономию и комиссию
+        if 'found_price' in kwargs and request['known_price'] and kwargs['found_price']:
+            request['economy'] = request['known_price'] - kwargs['found_price']
+            if request['economy'] > 0:
+                request['commission'] = request['economy'] * get_settings().commission_rate
+
+        request['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        _requests.save()
+
+    _notify('request', request)
+    return True
 
 
 def get_requests_by_status(status):
     """Получает заявки по статусу"""
-    data = _read_json(DB_FILE)
-    return [req for req in data['requests'] if req['status'] == status]
+    return _requests.with_status(status)
 
 
 def delete_request(request_id):
     """Удаляет заявку (для админа)"""
-    data = _read_json(DB_FILE)
-    initial_length = len(data['requests'])
+    with _requests.transaction():
+        request = _requests.find(request_id)
+        if request is None:
+            return False
 
-    data['requests'] = [req for req in data['requests'] if req['id'] != request_id]
+        _requests.remove([request_id])
+        _requests.save()
 
-    if len(data['requests']) < initial_length:
-        _write_json(DB_FILE, data)
-        return True
-    return False
+    _notify('request', request, deleted=True)
+    return True
 
 
 # ========== СИСТЕМА ОТЗЫВОВ ==========
-def save_review(user_id, username, review_text, rating):
-    """Сохраняет отзыв и возвращает его ID"""
-    data = _read_json(REVIEWS_FILE)
-
+def save_review(user_id, username, review_text, rating, operator_id=None):
+    """Сохраняет отзыв и возвращает его ID; operator_id - сразу назначить оператору"""
     # Проверяем корректность рейтинга
     if not 1 <= rating <= 5:
         rating = 5  # По умолчанию 5 звезд
 
-    review_id = len(data['reviews']) + 1
-    review = {
-        'id': review_id,
-        'user_id': user_id,
-        'username': username or '',
-        'review_text': review_text,
-        'rating': rating,
-        'status': 'pending',  # pending, approved, rejected
-        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'published_at': None,
-        'published_message_id': None,
-        'admin_notes': ''
-    }
-
-    data['reviews'].append(review)
-    _write_json(REVIEWS_FILE, data)
-
+    with _reviews.transaction():
+        review_id = _reviews.next_id()
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        review = {
+            'id': review_id,
+            'user_id': user_id,
+            'username': username or '',
+            'review_text': review_text,
+            'rating': rating,
+            'status': 'pending',  # pending, approved, rejected
+            'created_at': now,
+            'published_at': None,
+            'published_message_id': None,
+            'admin_notes': '',
+            'operator_id': operator_id,
+            'assigned_at': now if operator_id is not None else None
+        }
+
+        review = _reviews.append(review)
+        _reviews.save()
+
+    _notify('review', review)
     return review_id
 
 
 def get_review(review_id):
-    """Получает отзыв по ID"""
-    data = _read_json(REVIEWS_FILE)
-    for review in data['reviews']:
-        if review['id'] == review_id:
-            return review
-    return None
+    """Получает отзыв по ID (если его нет в рабочей базе - ищет в архиве)"""
+    review = _reviews.find(review_id)
+    if review is None:
+        from archive import find_archived
+        review = find_archived('review', review_id)
+    return review
 
 
 def get_user_reviews(user_id):
     """Получает все отзывы пользователя"""
-    data = _read_json(REVIEWS_FILE)
-    return [rev for rev in data['reviews'] if rev['user_id'] == user_id]
+    return _reviews.with_user(user_id)
 
 
 def get_all_reviews():
     """Получает все отзывы (для админа)"""
-    data = _read_json(REVIEWS_FILE)
-    return data['reviews']
+    return _reviews.records()
 
 
 def get_reviews_by_status(status):
     """Получает отзывы по статусу"""
-    data = _read_json(REVIEWS_FILE)
-    return [rev for rev in data['reviews'] if rev['status'] == status]
+    return _reviews.with_status(status)
 
 
 def get_pending_reviews():
@@ -183,109 +901,291 @@ def get_pending_reviews():
     return get_reviews_by_status('pending')
 
 
+def count_pending_reviews():
+    """Число отзывов на модерации"""
+    return _reviews.count_status('pending')
+
+
 def get_approved_reviews(limit=10):
     """Получает опубликованные отзывы (для команды /reviews)"""
-    data = _read_json(REVIEWS_FILE)
-    approved = [rev for rev in data['reviews'] if rev['status'] == 'approved']
+    if limit <= FEED_SIZE:
+        return _feed.reviews(limit)
+
+    approved = get_reviews_by_status('approved')
 
     # Сортируем по дате публикации (новые первые)
-    approved.sort(key=lambda x: x['published_at'] or x['created_at'], reverse=True)
+    approved.sort(key=lambda x: x.published_at or x.created_at, reverse=True)
 
     return approved[:limit]
 
 
-def update_review_status(review_id, status, published_message_id=None):
-    """Обновляет статус отзыва и при необходимости добавляет ID сообщения"""
-    data = _read_json(REVIEWS_FILE)
-    updated = False
+def update_review_status(review_id, status, published_message_id=None, expected_status=None):
+    """
+    Обновляет статус отзыва и при необходимости добавляет ID сообщения.
+    С expected_status переход выполняется только из указанного статуса.
+    """
+    with _reviews.transaction():
+        review = _reviews.find(review_id)
+        if review is None:
+            return False
+        if expected_status is not None and review['status'] != expected_status:
+            return False
+
+        _set_review_status(review, status, published_message_id)
+        _reviews.save()
+
+    _notify('review', review)
+    return True
+
+
+def update_reviews_status(review_ids, status, expected_status=None):
+    """
+    Меняет статус сразу нескольких отзывов одной записью на диск.
+    Возвращает список измененных отзывов (отзывы не в expected_status пропускаются).
+    """
+    updated = []
+    with _reviews.transaction():
+        for review_id in review_ids:
+            review = _reviews.find(review_id)
+            if review is None:
+                continue
+            if expected_status is not None and review['status'] != expected_status:
+                continue
+            _set_review_status(review, status)
+            updated.append(review)
+
+        if updated:
+            _reviews.save()
 
-    for review in data['reviews']:
-        if review['id'] == review_id:
-            review['status'] = status
+    for review in updated:
+        _notify('review', review)
+    return updated
 
-            if status == 'approved':
-                review['published_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                if published_message_id:
-                    review['published_message_id'] = published_message_id
 
-            updated = True
-            break
+def _set_review_status(review, status, published_message_id=None):
+    _reviews.set_status(review, status)
 
-    if updated:
-        _write_json(REVIEWS_FILE, data)
-        return True
-    return False
+    if status == 'approved':
+        review['published_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if published_message_id:
+            review['published_message_id'] = published_message_id
 
 
 def update_review(review_id, **kwargs):
     """Обновляет поля отзыва (для админа)"""
-    data = _read_json(REVIEWS_FILE)
-    updated = False
+    with _reviews.transaction():
+        review = _reviews.find(review_id)
+        if review is None:
+            return False
 
-    for review in data['reviews']:
-        if review['id'] == review_id:
-            for key, value in kwargs.items():
-                if key in review:
-                    review[key] = value
-            updated = True
-            break
+        for key, value in kwargs.items():
+            if key == 'status':
+                _reviews.set_status(review, value)
+            elif key in review:
+                review[key] = value
 
-    if updated:
-        _write_json(REVIEWS_FILE, data)
-        return True
-    return False
+        _reviews.save()
+
+    _notify('review', review)
+    return True
 
 
 def delete_review(review_id):
     """Удаляет отзыв (для админа)"""
-    data = _read_json(REVIEWS_FILE)
-    initial_length = len(data['reviews'])
-
-    data['reviews'] = [rev for rev in data['reviews'] if rev['id'] != review_id]
-
-    if len(data['reviews']) < initial_length:
-        _write_json(REVIEWS_FILE, data)
-        return True
-    return False
+    with _reviews.transaction():
+        review = _reviews.find(review_id)
+        if review is None:
+            return False
+
+        _reviews.remove([review_id])
+        _reviews.save()
+
+    _notify('review', review, deleted=True)
+    return True
+
+
+# ========== ЛЕНТА ОПУБЛИКОВАННЫХ ОТЗЫВОВ ==========
+# Сколько последних опубликованных отзывов держится в ленте
+FEED_SIZE = 50
+
+
+class _ReviewFeed:
+    """
+    Последние FEED_SIZE опубликованных отзывов, отсортированные по дате
+    публикации. Обновляется по изменениям отзывов этим процессом и строится
+    заново, только если отзывы перечитаны с диска или из ленты ушел отзыв,
+    а замену ему нужно найти среди остальных опубликованных.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        # Растет при каждом изменении содержимого ленты
+        self.version = 0
+        self._entries = []  # ключи (дата публикации, id) по возрастанию
+        self._keys = {}
+        self._generation = None
+
+    @staticmethod
+    def _key(review):
+        # Время в записях хранится числом - сравнивать его дешевле строк
+        return review.published_at or review.created_at, review.id
+
+    def _rebuild(self):
+        approved = _reviews.with_status('approved')
+        self._entries = sorted(self._key(review) for review in approved)[-self.size:]
+        self._keys = {key[1]: key for key in self._entries}
+        self._generation = _reviews.generation
+        self.version += 1
+
+    def _refresh(self):
+        _reviews.refresh()
+        if self._generation != _reviews.generation:
+            self._rebuild()
+
+    def reviews(self, limit):
+        """Последние limit опубликованных отзывов, новые первыми"""
+        self._refresh()
+        return [_reviews.find(review_id) for _, review_id in reversed(self._entries[-limit:])] if limit > 0 else []
+
+    def get_version(self):
+        self._refresh()
+        return self.version
+
+    def on_change(self, kind, review, deleted):
+        if kind != 'review' or self._generation != _reviews.generation:
+            # Лента не строилась или отзывы перечитаны с диска - построится при чтении
+            return
+
+        old_key = self._keys.pop(review['id'], None)
+        if old_key is not None:
+            self._entries.remove(old_key)
+
+        if not deleted and review['status'] == 'approved':
+            key = self._key(review)
+            if len(self._entries) < self.size or key > self._entries[0]:
+                insort(self._entries, key)
+                self._keys[review['id']] = key
+                if len(self._entries) > self.size:
+                    _, dropped_id = self._entries.pop(0)
+                    del self._keys[dropped_id]
+            elif old_key is None:
+                return
+        elif old_key is None:
+            return
+
+        if old_key is not None and len(self._entries) < self.size:
+            # Освободилось место - ближайший следующий отзыв есть только в полном списке
+            self._rebuild()
+            return
+        self.version += 1
+
+
+_feed = _ReviewFeed(FEED_SIZE)
+add_change_listener(_feed.on_change)
+
+
+def get_approved_feed_version():
+    """Версия ленты опубликованных отзывов: меняется при любом изменении ее содержимого"""
+    return _feed.get_version()
+
+
+# ========== НАЗНАЧЕНИЕ ОПЕРАТОРАМ ==========
+# Статусы, в которых запись числится в очереди оператора
+OPEN_STATUSES = {'request': ('new', 'in_progress'), 'review': ('pending',)}
+
+
+def get_open_records(kind):
+    """Записи kind ('request' или 'review') в открытых статусах (по индексу статусов)"""
+    table = _tables[kind]
+    records = []
+    for status in OPEN_STATUSES[kind]:
+        records.extend(table.with_status(status))
+    return records
+
+
+def assign_operator(kind, record_id, operator_id, expected_status=None, expected_assigned_at=None):
+    """
+    Назначает запись оператору и отмечает время назначения; возвращает запись
+    или None. expected_status и expected_assigned_at (время предыдущего
+    назначения, None - запись еще не назначалась) делают назначение
+    условным: если другой процесс уже сменил статус или переназначил
+    запись, ничего не меняется.
+    """
+    table = _tables[kind]
+    with table.transaction():
+        record = table.find(record_id)
+        if record is None:
+            return None
+        if expected_status is not None and record['status'] != expected_status:
+            return None
+        if expected_assigned_at is not None and record['assigned_at'] != expected_assigned_at:
+            return None
+
+        record['operator_id'] = operator_id
+        record['assigned_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        table.save()
+
+    _notify(kind, record)
+    return record
 
 
 # ========== СТАТИСТИКА ==========
 def get_statistics():
-    """Возвращает статистику по заявкам и отзывам"""
-    requests_data = _read_json(DB_FILE)
-    reviews_data = _read_json(REVIEWS_FILE)
+    """Возвращает статистику по заявкам и отзывам (рабочая база вместе с архивом)"""
+    from archive import archived_summary
+
+    # Сводки закрытых частей хранятся в манифестах, прошлые месяцы не читаются
+    requests = _requests.summary()
+    reviews = _reviews.summary()
+    archived_requests = archived_summary('request')
+    archived_reviews = archived_summary('review')
 
     stats = {
-        'total_requests': len(requests_data['requests']),
-        'new_requests': len([r for r in requests_data['requests'] if r['status'] == 'new']),
-        'completed_requests': len([r for r in requests_data['requests'] if r['status'] == 'completed']),
-        'total_economy': sum([r['economy'] or 0 for r in requests_data['requests']]),
-        'total_commission': sum([r['commission'] or 0 for r in requests_data['requests']]),
-
-        'total_reviews': len(reviews_data['reviews']),
-        'pending_reviews': len([r for r in reviews_data['reviews'] if r['status'] == 'pending']),
-        'approved_reviews': len([r for r in reviews_data['reviews'] if r['status'] == 'approved']),
-        'average_rating': 0
+        'total_requests': requests['count'] + archived_requests['count'],
+        'new_requests': requests['statuses'].get('new', 0),
+        'completed_requests': requests['statuses'].get('completed', 0) + archived_requests['statuses'].get('completed', 0),
+        'total_economy': requests['economy'] + archived_requests['economy'],
+        'total_commission': requests['commission'] + archived_requests['commission'],
+
+        'total_reviews': reviews['count'] + archived_reviews['count'],
+        'pending_reviews': reviews['statuses'].get('pending', 0),
+        'approved_reviews': reviews['statuses'].get('approved', 0) + archived_reviews['statuses'].get('approved', 0),
+        'average_rating': 0,
+
+        'archived_requests': archived_requests['count'],
+        'archived_reviews': archived_reviews['count'],
     }
 
     # Рассчитываем средний рейтинг
-    approved_reviews = [r for r in reviews_data['reviews'] if r['status'] == 'approved']
-    if approved_reviews:
-        stats['average_rating'] = sum([r['rating'] for r in approved_reviews]) / len(approved_reviews)
+    if stats['approved_reviews']:
+        rating_sum = reviews['approved_rating_sum'] + archived_reviews['approved_rating_sum']
+        stats['average_rating'] = rating_sum / stats['approved_reviews']
 
     return stats
 
 
 # ========== ИНИЦИАЛИЗАЦИЯ ==========
 def init_databases():
-    """Инициализирует базы данных при первом запуске"""
-    # Создаем файлы если их нет
-    _read_json(DB_FILE)
-    _read_json(REVIEWS_FILE)
-    print("✅ Базы данных инициализированы")
-    print(f"   - Заявки: {DB_FILE}")
-    print(f"   - Отзывы: {REVIEWS_FILE}")
-
-
-# Инициализация при импорте
-init_databases()
\ No newline at end of file
+    """Открывает базы данных (создает файлы при первом запуске); прошлые месяцы читаются по мере надобности"""
+    _requests.head()
+    _reviews.head()
+    logger.info(f"✅ Базы данных инициализированы: заявки {DB_FILE}, отзывы {REVIEWS_FILE}")
+
+
+def sync():
+    """
+    Сбрасывает на диск каталоги файлов хранилища перед остановкой: запись через
+    os.replace атомарна, но без fsync каталога последнее переименование может
+    не пережить сбой питания сразу после выхода.
+    """
+    for directory in {os.path.dirname(os.path.abspath(name)) for name in (DB_FILE, REVIEWS_FILE)}:
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
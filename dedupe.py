@@ -0,0 +1,161 @@
+"""
+Отбрасывание повторно доставленных апдейтов.
+
+Telegram доставляет апдейт повторно, если не получил подтверждения: после
+перезапуска бота (offset getUpdates не успел сдвинуться) или когда вебхук
+ответил с ошибкой или по таймауту. Повтор /order-диалога создает вторую
+заявку, а повтор нажатия "Опубликовать" - второй пост в канале.
+
+UpdateDeduplicator помнит update_id и ID callback query за последние
+DEDUPE_WINDOW_HOURS часов (не больше DEDUPE_MAX_ENTRIES ключей, старые
+вытесняются первыми). Проверка стоит обработчиком TypeHandler в группе
+DEDUPE_GROUP, раньше всех остальных: повтор останавливается через
+ApplicationHandlerStop и не доходит ни до обработчиков, ни до хранилища.
+
+Чтобы окно переживало перезапуск, каждый новый ключ дописывается строкой в
+журнал DEDUPE_FILE (без fsync: одна короткая запись на апдейт), а при
+запуске журнал читается обратно. Журнал атомарно переписывается только
+ключами окна при запуске (если устаревших строк больше половины) и во время
+работы, когда в нем набирается 2 * DEDUPE_MAX_ENTRIES строк.
+"""
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes, TypeHandler
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Группа обработчика проверки: меньше групп всех остальных обработчиков
+DEDUPE_GROUP = -100
+
+
+def update_keys(update):
+    """Ключи апдейта: update_id (int) и ID callback query (str), если есть"""
+    keys = [update.update_id]
+    if update.callback_query is not None:
+        keys.append(update.callback_query.id)
+    return keys
+
+
+class UpdateDeduplicator:
+    """Ограниченное по времени и размеру множество уже обработанных ключей"""
+
+    def __init__(self, path=None, window_seconds=None, max_entries=None):
+        settings = get_settings()
+        self.path = settings.dedupe_file if path is None else path
+        self.window = settings.dedupe_window_hours * 3600 if window_seconds is None else window_seconds
+        self.max_entries = settings.dedupe_max_entries if max_entries is None else max_entries
+        # ключ -> time.time() первого появления, в порядке появления
+        self._seen = OrderedDict()
+        self.suppressed = 0
+        self._journal = None
+        self._journal_lines = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def seen(self, keys, now=None):
+        """
+        True, если любой из ключей уже встречался в окне (повтор).
+        Иначе запоминает ключи и возвращает False.
+        """
+        now = time.time() if now is None else now
+        self._expire(now, room=len(keys))
+        if any(key in self._seen for key in keys):
+            self.suppressed += 1
+            return True
+        for key in keys:
+            self._seen[key] = now
+            self._write(key, now)
+        return False
+
+    def _expire(self, now, room=0):
+        """Вытесняет ключи старше окна и самые старые сверх max_entries - room"""
+        seen = self._seen
+        deadline = now - self.window
+        while seen:
+            key, added = next(iter(seen.items()))
+            if added >= deadline and len(seen) + room <= self.max_entries:
+                break
+            seen.popitem(last=False)
+
+    # ----- журнал -----
+    def open(self):
+        """Читает журнал прошлых запусков и открывает его на дозапись"""
+        if not self.path or self._journal is not None:
+            return
+        now = time.time()
+        self._seen.clear()
+        self._journal_lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._journal_lines += 1
+                    kind, _, rest = line.rstrip('\n').partition(' ')
+                    key, _, added = rest.rpartition(' ')
+                    try:
+                        key, added = (int(key) if kind == 'u' else key), float(added)
+                    except ValueError:
+                        continue
+                    if kind in ('u', 'c') and now - added <= self.window:
+                        self._seen[key] = added
+        except FileNotFoundError:
+            pass
+        self._expire(now)
+        if self._journal_lines > 2 * len(self._seen):
+            self._compact()
+        self._journal = open(self.path, 'a', encoding='utf-8', buffering=1)
+        logger.info(f"Защита от повторов: {len(self._seen)} ключей из {self.path}")
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _write(self, key, added):
+        if self._journal is None:
+            return
+        kind = 'u' if isinstance(key, int) else 'c'
+        self._journal.write(f"{kind} {key} {added:.0f}\n")
+        self._journal_lines += 1
+        if self._journal_lines > 2 * self.max_entries:
+            self._journal.close()
+            self._compact()
+            self._journal = open(self.path, 'a', encoding='utf-8', buffering=1)
+
+    def _compact(self):
+        """Переписывает журнал только ключами окна (атомарно, через временный файл)"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(self.path)}.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.writelines(f"{'u' if isinstance(key, int) else 'c'} {key} {added:.0f}\n"
+                             for key, added in self._seen.items())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._journal_lines = len(self._seen)
+
+    def stats(self):
+        """Счетчики для /healthz"""
+        return {'window_keys': len(self._seen), 'suppressed': self.suppressed}
+
+
+async def drop_duplicates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Останавливает обработку апдейта, который уже был обработан"""
+    if context.application.dedupe.seen(update_keys(update)):
+        logger.warning(f"Повторный апдейт {update.update_id} отброшен")
+        raise ApplicationHandlerStop
+
+
+def dedupe_handler():
+    """Обработчик проверки для группы DEDUPE_GROUP"""
+    return TypeHandler(Update, drop_duplicates)
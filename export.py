@@ -0,0 +1,203 @@
+"""
+Выгрузка заявок и отзывов в сжатый CSV или JSONL.
+
+Записи идут потоком: из сегментов архива строка за строкой, затем из
+рабочей базы, через фильтры по дате создания и статусу прямо в gzip файл.
+Целиком выгрузка в памяти не собирается.
+
+В Telegram (только администратор):
+    /export заявки csv from=2025-01-01 to=2025-03-31 status=completed
+    /export отзывы jsonl
+Из командной строки:
+    python export.py requests --format csv --from 2025-01-01 --status completed,cancelled -o requests.csv.gz
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import itertools
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import database
+from archive import iter_archived
+from config import get_settings
+from records import as_dict, from_epoch, time_of
+
+COLUMNS = {
+    'request': ['id', 'created_at', 'updated_at', 'status', 'user_id', 'username', 'product', 'city', 'contact',
+                'known_price', 'found_price', 'economy', 'commission', 'notes', 'operator_id', 'assigned_at'],
+    'review': ['id', 'created_at', 'published_at', 'status', 'user_id', 'username', 'rating', 'review_text',
+               'published_message_id', 'admin_notes', 'operator_id', 'assigned_at'],
+}
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl')
+
+_KIND_ALIASES = {
+    'заявки': 'request', 'requests': 'request', 'request': 'request',
+    'отзывы': 'review', 'reviews': 'review', 'review': 'review',
+}
+
+
+# ========== КОНВЕЙЕР ==========
+def iter_export(kind, date_from=None, date_to=None, statuses=None):
+    """
+    Записи kind из архива и рабочей базы с фильтрами. Даты - строки
+    ГГГГ-ММ-ДД (включительно), statuses - набор статусов или None.
+    Запись без распознанной даты создания выгружается, только если период
+    не задан: отнести ее к периоду нельзя.
+    """
+    def partition_wanted(partition):
+        return (date_from is None or partition >= date_from[:7]) and (date_to is None or partition <= date_to[:7])
+
+    def month_wanted(month):
+        # В части месяца M лежат записи, созданные не позже M (импорт может добавить более старые)
+        return date_from is None or month >= date_from[:7]
+
+    records = itertools.chain(iter_archived(kind, partition_wanted), database.iter_records(kind, month_wanted))
+
+    undated = 0
+    for record in records:
+        if statuses and record['status'] not in statuses:
+            continue
+        if date_from is not None or date_to is not None:
+            created = time_of(record, 'created_at')
+            if created is None:
+                undated += 1
+                continue
+            created = from_epoch(created)[:10]
+            if date_from is not None and created < date_from:
+                continue
+            if date_to is not None and created > date_to:
+                continue
+        yield record
+    if undated:
+        logger.warning(f"Выгрузка {kind}: пропущено записей без распознанной даты создания: {undated}")
+
+
+def write_export(fileobj, kind, records, fmt='csv'):
+    """Пишет записи в бинарный файл fileobj в виде gzip; возвращает число записей"""
+    count = 0
+    # CSV с BOM, чтобы Excel правильно показал кириллицу
+    encoding = 'utf-8-sig' if fmt == 'csv' else 'utf-8'
+    with gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=6) as raw, \
+            io.TextIOWrapper(raw, encoding=encoding, newline='') as f:
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, fieldnames=COLUMNS[kind], extrasaction='ignore')
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+                count += 1
+        else:
+            for record in records:
+                f.write(json.dumps(as_dict(record), ensure_ascii=False))
+                f.write('\n')
+                count += 1
+    return count
+
+
+def export_to_tempfile(kind, fmt='csv', date_from=None, date_to=None, statuses=None):
+    """Выгружает записи во временный файл; возвращает (путь, число записей)"""
+    fd, path = tempfile.mkstemp(prefix=f'export_{kind}s_', suffix=f'.{fmt}.gz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            count = write_export(f, kind, iter_export(kind, date_from, date_to, statuses), fmt)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, count
+
+
+def _parse_date(value):
+    """Проверяет дату ГГГГ-ММ-ДД и возвращает ее строкой"""
+    return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+
+# ========== КОМАНДА /export ==========
+EXPORT_USAGE = (
+    "📤 Использование:\n"
+    "/export заявки|отзывы [csv|jsonl] [from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД] [status=статус1,статус2]\n\n"
+    "Например: /export заявки csv from=2025-01-01 to=2025-03-31 status=completed"
+)
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выгрузка заявок или отзывов файлом (команда /export)"""
+    if update.effective_user.id != get_settings().admin_id:
+        await update.message.reply_text("❌ Эта команда только для администратора")
+        return
+
+    args = [arg.lower() for arg in context.args]
+    kind = _KIND_ALIASES.get(args[0]) if args else None
+    if kind is None:
+        await update.message.reply_text(EXPORT_USAGE)
+        return
+
+    fmt, date_from, date_to, statuses = 'csv', None, None, None
+    try:
+        for arg in args[1:]:
+            if arg in FORMATS:
+                fmt = arg
+            elif arg.startswith('from='):
+                date_from = _parse_date(arg[5:])
+            elif arg.startswith('to='):
+                date_to = _parse_date(arg[3:])
+            elif arg.startswith('status='):
+                statuses = set(filter(None, arg[7:].split(',')))
+            else:
+                raise ValueError(arg)
+    except ValueError:
+        await update.message.reply_text(f"❌ Не понял параметры.\n\n{EXPORT_USAGE}")
+        return
+
+    await update.message.reply_text("⏳ Готовлю выгрузку...")
+
+    # Запись файла не блокирует обработку остальных апдейтов
+    path, count = await asyncio.to_thread(export_to_tempfile, kind, fmt, date_from, date_to, statuses)
+    try:
+        title = "Заявки" if kind == 'request' else "Отзывы"
+        period = f" с {date_from or 'начала'} по {date_to or 'сегодня'}"
+        with open(path, 'rb') as f:
+            await update.message.reply_document(
+                document=f,
+                filename=f"{kind}s_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}.gz",
+                caption=f"📤 {title}{period}: {count} записей"
+                        + (f" (статусы: {', '.join(sorted(statuses))})" if statuses else ""),
+                read_timeout=120,
+                write_timeout=120,
+            )
+    finally:
+        os.unlink(path)
+
+
+# ========== ЗАПУСК ИЗ КОМАНДНОЙ СТРОКИ ==========
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выгрузка заявок или отзывов в CSV/JSONL (gzip)")
+    parser.add_argument('kind', choices=sorted(_KIND_ALIASES), help="что выгружать")
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--from', dest='date_from', type=_parse_date, help="с даты создания ГГГГ-ММ-ДД")
+    parser.add_argument('--to', dest='date_to', type=_parse_date, help="по дату создания ГГГГ-ММ-ДД")
+    parser.add_argument('--status', help="статусы через запятую")
+    parser.add_argument('-o', '--output', help="файл результата (по умолчанию <тип>s.<формат>.gz)")
+    args = parser.parse_args(argv)
+
+    kind = _KIND_ALIASES[args.kind]
+    statuses = set(filter(None, args.status.split(','))) if args.status else None
+    output = args.output or f"{kind}s.{args.format}.gz"
+
+    with open(output, 'wb') as f:
+        count = write_export(f, kind, iter_export(kind, args.date_from, args.date_to, statuses), args.format)
+    print(f"📤 Выгружено {count} записей в {output}")
+
+
+if __name__ == '__main__':
+    main()
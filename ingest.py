@@ -0,0 +1,370 @@
+"""
+Прием апдейтов с приоритетами и ограниченной очередью.
+
+Application берет апдейты из update_queue строго по очереди, поэтому во
+время наплыва клиентов нажатие администратора "Опубликовать" или /stats
+ждет за всеми их сообщениями. UpdateIngest заменяет этот цикл
+(BotApplication._update_fetcher): апдейты из update_queue сразу
+раскладываются по классам приоритета, а на обработку (не больше
+concurrent_updates одновременно) уходит первый апдейт самого срочного
+класса:
+
+    ADMIN         - администратор и операторы (модерация, /stats, op_take_)
+    CONVERSATION  - пользователи посреди диалога /order или /review
+    NEW           - все остальное: /start, новые диалоги, инлайн-запросы
+
+Апдейты одного пользователя не обгоняют друг друга: пока у него есть
+апдейты в очереди, новый ставится в класс не срочнее последнего из них.
+Следующий апдейт пользователя уходит на обработку только после того, как
+закончен предыдущий; до тех пор место обработки получают другие, так что
+серия сообщений одного пользователя не занимает все места, ожидая его замка
+(BotApplication._serialized_update).
+
+Очередь ограничена INGEST_QUEUE_SIZE апдейтами. Когда она полна, новый
+апдейт вытесняет самый свежий апдейт менее срочного класса; апдейт класса
+NEW, которому вытеснять некого, отбрасывается сам. Отброшенный апдейт
+получает ответ "попробуйте позже" (не чаще раза в BUSY_REPLY_INTERVAL на
+чат). Срочным апдейтам, которым некого вытеснить, очередь не отказывает:
+прием ждет места, а update_queue ограничена тем же размером, так что
+Updater перестает забирать апдейты у Telegram (обратное давление), и они
+ждут на стороне Telegram.
+
+Ошибка при разборе апдейта (класс, пользователь) не останавливает прием:
+она пишется в лог, а апдейт идет классом NEW. Если цикл приема все же
+упал, принятые апдейты дорабатываются, а ошибка поднимается из run()
+(BotApplication тогда читает update_queue по порядку, без приоритетов).
+
+Глубина очереди по классам, число отброшенных апдейтов, ошибок разбора и
+время ожидания в очереди отдает stats() (раздел ingest в /healthz).
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from telegram import Update
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета: меньше - срочнее
+ADMIN = 0
+CONVERSATION = 1
+NEW = 2
+CLASS_NAMES = ('admin', 'conversation', 'new')
+
+BUSY_TEXT = "⏳ Сейчас очень много обращений. Пожалуйста, повторите через минуту."
+# Не чаще раза в столько секунд на чат отвечаем, что бот занят
+BUSY_REPLY_INTERVAL = 60
+
+# Сколько последних замеров ожидания в очереди хранить по каждому классу
+WAIT_SAMPLES = 500
+
+
+class PriorityQueue:
+    """
+    Ограниченная очередь апдейтов по классам приоритета с порядком внутри
+    пользователя. Ключи апдейтов, выданных pop() и еще не отмеченных done(),
+    считаются в обработке: их следующие апдейты pop() пропускает.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # По очереди на класс: (апдейт, ключ, время постановки)
+        self._queues = tuple(deque() for _ in CLASS_NAMES)
+        # ключ -> [число апдейтов в очереди, класс последнего из них]
+        self._pending = {}
+        # Ключи апдейтов в обработке
+        self._busy = set()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def full(self):
+        return self._size >= self.capacity
+
+    def depth(self):
+        return {name: len(queue) for name, queue in zip(CLASS_NAMES, self._queues)}
+
+    def priority_for(self, key, priority):
+        """Класс нового апдейта: не срочнее уже ждущих апдейтов того же пользователя"""
+        pending = self._pending.get(key)
+        return max(priority, pending[1]) if pending is not None else priority
+
+    def put(self, update, key, priority):
+        self._queues[priority].append((update, key, time.monotonic()))
+        self._size += 1
+        if key is not None:
+            pending = self._pending.setdefault(key, [0, priority])
+            pending[0] += 1
+            pending[1] = priority
+
+    def pop(self):
+        """
+        Первый апдейт самого срочного класса, пользователь которого не ждет
+        обработки предыдущего апдейта: (апдейт, ключ, класс, ожидание в
+        очереди, с). None - таких апдейтов нет. Ключ апдейта считается в
+        обработке до done(ключ).
+        """
+        busy = self._busy
+        for priority, queue in enumerate(self._queues):
+            for position, (update, key, queued_at) in enumerate(queue):
+                if key is not None and key in busy:
+                    continue
+                del queue[position]
+                self._forget(key)
+                if key is not None:
+                    busy.add(key)
+                return update, key, priority, time.monotonic() - queued_at
+        return None
+
+    def done(self, key):
+        """Апдейт с ключом key обработан: следующий апдейт пользователя можно выдавать"""
+        self._busy.discard(key)
+
+    def evict_below(self, priority):
+        """Вытесняет самый свежий апдейт класса менее срочного, чем priority; (апдейт, класс) или None"""
+        for lower in range(len(self._queues) - 1, priority, -1):
+            queue = self._queues[lower]
+            if queue:
+                # Самый свежий апдейт класса - последний у своего пользователя:
+                # более поздние его апдейты стоят в этом же или менее срочном классе
+                update, key, _ = queue.pop()
+                self._forget(key)
+                return update, lower
+        return None
+
+    def _forget(self, key):
+        self._size -= 1
+        if key is None:
+            return
+        pending = self._pending[key]
+        pending[0] -= 1
+        if not pending[0]:
+            del self._pending[key]
+
+
+class UpdateIngest:
+    """Цикл приема и раздачи апдейтов приложения по приоритетам"""
+
+    def __init__(self, application, capacity=None):
+        # runtime импортирует этот модуль, поэтому ключ берется при создании
+        from runtime import serialization_key
+
+        self.application = application
+        self._key = serialization_key
+        self.queue = PriorityQueue(get_settings().ingest_queue_size if capacity is None else capacity)
+        self.received = [0] * len(CLASS_NAMES)
+        self.shed = [0] * len(CLASS_NAMES)
+        self.backpressure = 0
+        self.classify_errors = 0
+        self.max_depth = 0
+        self.waits = tuple(deque(maxlen=WAIT_SAMPLES) for _ in CLASS_NAMES)
+        self._busy_replied = {}
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._closing = False
+        # Задачи обработки и ответов: Application.create_task после начала
+        # остановки их уже не отслеживает, а очередь дорабатывается и тогда
+        self._tasks = set()
+        self._staff = (None, frozenset())
+
+    # ----- классификация -----
+    def _staff_ids(self):
+        settings = get_settings()
+        if self._staff[0] is not settings:
+            ids = {settings.admin_id} | {operator_id for operator_id, _ in settings.operators}
+            self._staff = (settings, frozenset(ids))
+        return self._staff[1]
+
+    def classify(self, update):
+        """Класс приоритета апдейта"""
+        if isinstance(update, Update):
+            user = update.effective_user
+            if user is not None and user.id in self._staff_ids():
+                return ADMIN
+            if self.application.sessions.active(update):
+                return CONVERSATION
+        return NEW
+
+    def _classify(self, update):
+        """Класс и ключ порядка апдейта; при ошибке разбора - NEW"""
+        key = None
+        try:
+            key = self._key(update)
+            priority = self.classify(update)
+        except Exception as e:
+            self.classify_errors += 1
+            logger.error(f"Не удалось разобрать апдейт, он обрабатывается как обычный: {e!r}")
+            priority = NEW
+        return self.queue.priority_for(key, priority), key
+
+    # ----- циклы -----
+    async def run(self, stop_signal):
+        """
+        Принимает апдейты из update_queue и раздает их на обработку, пока не
+        придет stop_signal (Application.stop). Принятые до него апдейты
+        дорабатываются.
+        """
+        self._closing = False
+        loop = asyncio.get_running_loop()
+        intake = loop.create_task(self._intake(stop_signal))
+        dispatch = loop.create_task(self._dispatch())
+        try:
+            await asyncio.wait((intake, dispatch), return_when=asyncio.FIRST_EXCEPTION)
+            if intake.done() and not intake.cancelled() and intake.exception() is not None:
+                error = intake.exception()
+                logger.error(f"Прием апдейтов остановлен ошибкой: {error!r}", exc_info=error)
+                # Принятое дорабатываем, новые апдейты больше не принимаются
+                self._closing = True
+                self._not_empty.set()
+                await dispatch
+                raise error
+            await dispatch
+        finally:
+            for task in (intake, dispatch):
+                if not task.done():
+                    task.cancel()
+
+    async def _intake(self, stop_signal):
+        update_queue = self.application.update_queue
+        queue = self.queue
+        while True:
+            update = await update_queue.get()
+            if update is stop_signal:
+                update_queue.task_done()
+                self._closing = True
+                self._not_empty.set()
+                return
+
+            # Учтен ли апдейт: поставлен в очередь или отброшен (task_done сделан)
+            accounted = False
+            try:
+                priority, key = self._classify(update)
+                self.received[priority] += 1
+
+                while queue.full():
+                    victim = queue.evict_below(priority)
+                    if victim is not None:
+                        self._shed(*victim)
+                        break
+                    if priority == NEW:
+                        accounted = True
+                        self._shed(update, priority)
+                        break
+                    # Срочный апдейт ждет места, а update_queue тем временем заполняется
+                    self.backpressure += 1
+                    self._not_full.clear()
+                    await self._not_full.wait()
+                if accounted:
+                    continue
+
+                queue.put(update, key, priority)
+                accounted = True
+                self.max_depth = max(self.max_depth, len(queue))
+                self._not_empty.set()
+            except BaseException:
+                # Иначе Application.stop() ждал бы этот апдейт в update_queue.join()
+                if not accounted:
+                    update_queue.task_done()
+                raise
+
+    async def _dispatch(self):
+        application = self.application
+        limit = application.concurrent_updates
+        slots = asyncio.Semaphore(limit) if limit else None
+        while True:
+            if slots is not None:
+                await slots.acquire()
+            while True:
+                item = self.queue.pop()
+                if item is not None:
+                    break
+                if self._closing and not self.queue:
+                    return
+                # Очередь пуста или ее апдейты ждут конца обработки предыдущих
+                self._not_empty.clear()
+                await self._not_empty.wait()
+
+            update, key, priority, waited = item
+            self.waits[priority].append(waited)
+            # Освободилось место: прием мог ждать его
+            self._not_full.set()
+            if slots is None:
+                await self._process(update, key)
+            else:
+                self._spawn(self._process(update, key, slots))
+
+    async def _process(self, update, key, slots=None):
+        try:
+            await self.application.process_update(update)
+        finally:
+            if key is not None:
+                self.queue.done(key)
+                # Следующий апдейт этого пользователя мог ждать в очереди
+                self._not_empty.set()
+            if slots is not None:
+                slots.release()
+            self.application.update_queue.task_done()
+
+    # ----- отбрасывание -----
+    def _shed(self, update, priority):
+        self.shed[priority] += 1
+        self.application.update_queue.task_done()
+        total = sum(self.shed)
+        if total == 1 or total % 100 == 0:
+            logger.warning(f"Очередь апдейтов полна ({len(self.queue)}): отброшено {total}, "
+                           f"по классам {dict(zip(CLASS_NAMES, self.shed))}")
+        if isinstance(update, Update):
+            reply = self._busy_reply(update)
+            if reply is not None:
+                self._spawn(reply)
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _busy_reply(self, update):
+        """Корутина ответа "попробуйте позже" или None, если отвечать не нужно"""
+        chat = update.effective_chat
+        if chat is None:
+            # Инлайн-запросы и прочее без чата: Telegram сам покажет пустой ответ
+            return None
+
+        now = time.monotonic()
+        if now - self._busy_replied.get(chat.id, -BUSY_REPLY_INTERVAL) < BUSY_REPLY_INTERVAL:
+            return None
+        if len(self._busy_replied) > 10000:
+            self._busy_replied = {chat_id: at for chat_id, at in self._busy_replied.items()
+                                  if now - at < BUSY_REPLY_INTERVAL}
+        self._busy_replied[chat.id] = now
+
+        if update.callback_query is not None:
+            return self._reply(update.callback_query.answer(BUSY_TEXT))
+        return self._reply(self.application.bot.send_message(chat.id, BUSY_TEXT))
+
+    @staticmethod
+    async def _reply(coroutine):
+        try:
+            await coroutine
+        except Exception as e:
+            logger.debug(f"Не удалось ответить, что бот занят: {e}")
+
+    def stats(self, percentiles=None):
+        """Глубина очереди, отброшенные апдейты и ожидание по классам (для /healthz)"""
+        result = {
+            'depth': len(self.queue),
+            'capacity': self.queue.capacity,
+            'max_depth': self.max_depth,
+            'by_class': self.queue.depth(),
+            'received': dict(zip(CLASS_NAMES, self.received)),
+            'shed': dict(zip(CLASS_NAMES, self.shed)),
+            'backpressure_waits': self.backpressure,
+            'classify_errors': self.classify_errors,
+        }
+        if percentiles is not None:
+            result['wait_ms'] = {name: percentiles(list(waits)) for name, waits in zip(CLASS_NAMES, self.waits)}
+        return result
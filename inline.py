@@ -0,0 +1,218 @@
+"""
+Инлайн-режим: ответы бота в любом чате через "@бот <запрос>".
+
+    @бот            - последние заявки пользователя
+    @бот 123        - статус заявки #123 (только своей)
+    @бот отзывы     - лучшие из последних опубликованных отзывов
+
+Ответы строятся из индексов хранилища - заявок пользователя
+(database.get_user_requests) и ленты опубликованных отзывов
+(database.get_approved_reviews) - и целиком, готовыми статьями, держатся в
+кэше ResultCache по ключу (запрос, пользователь). Запись кэша сверяется
+с отпечатком данных: для отзывов это версия ленты, для заявок - версия
+данных хранилища и счетчик изменений заявок этого пользователя. Поэтому
+повторный запрос отвечается без обращения к записям и без сборки
+InlineQueryResultArticle.
+
+Telegram тоже кэширует ответы: отзывы одинаковы для всех и кэшируются
+надолго (REVIEWS_CACHE_TIME), а заявки - личные (is_personal) и только на
+STATUS_CACHE_TIME секунд, чтобы смена статуса была видна сразу.
+
+Инлайн-режим нужно включить у бота в @BotFather (/setinline).
+"""
+import html
+import logging
+import re
+from collections import OrderedDict
+
+from telegram import InlineQueryResultArticle, InlineQueryResultsButton, InputTextMessageContent, Update
+from telegram.ext import ContextTypes
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних заявок показывать на пустой запрос
+MY_REQUESTS_SHOWN = 10
+# Сколько отзывов показывать: лучшие по оценке среди последних FEED_SIZE опубликованных
+REVIEWS_SHOWN = 10
+
+# Сколько секунд Telegram может отдавать наш ответ из своего кэша
+REVIEWS_CACHE_TIME = 300
+STATUS_CACHE_TIME = 5
+
+# Ответов в кэше процесса (личные ответы - по записи на пользователя и запрос)
+CACHE_SIZE = 4096
+
+STATUS_LABELS = {
+    'new': '🆕 Новая',
+    'in_progress': '🔍 В работе',
+    'completed': '✅ Выполнена',
+    'cancelled': '❌ Отменена',
+    'rejected': '❌ Отклонена',
+}
+
+_REQUEST_RE = re.compile(r'(?:#|№)?\s*(\d{1,12})')
+_REVIEW_WORDS = ('отзыв', 'review')
+
+
+def parse_query(text):
+    """Нормализованный запрос: ('mine',), ('request', id), ('reviews',) или None"""
+    text = text.strip().lower()
+    if not text:
+        return ('mine',)
+    match = _REQUEST_RE.fullmatch(text)
+    if match:
+        return ('request', int(match.group(1)))
+    if text.startswith(_REVIEW_WORDS):
+        return ('reviews',)
+    return None
+
+
+# ========== КЭШ ОТВЕТОВ ==========
+class ResultCache:
+    """LRU готовых ответов: ключ -> (отпечаток данных, результаты)"""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, stamp):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != stamp:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, stamp, results):
+        self._entries[key] = (stamp, results)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+cache = ResultCache(CACHE_SIZE)
+
+# user_id -> счетчик изменений его заявок этим процессом
+_user_versions = {}
+
+
+def _on_change(kind, record, deleted):
+    if kind == 'request':
+        user_id = record['user_id']
+        _user_versions[user_id] = _user_versions.get(user_id, 0) + 1
+
+
+database.add_change_listener(_on_change)
+
+
+# ========== СТАТЬИ ==========
+def _price(value):
+    return f"{value:,}".replace(',', ' ')
+
+
+def request_article(request):
+    """Статья со статусом заявки"""
+    status = STATUS_LABELS.get(request['status'], request['status'])
+    product = html.escape(request['product'])
+    text = (
+        f"📋 <b>Заявка #{request['id']}</b>\n"
+        f"📦 {product}\n"
+        f"📊 <b>Статус:</b> {status}\n"
+        f"💰 <b>Цена:</b> {_price(request['known_price'])} ₽\n"
+    )
+    if request['found_price']:
+        text += f"🎯 <b>Найдена цена:</b> {_price(request['found_price'])} ₽\n"
+        if request['economy'] and request['economy'] > 0:
+            text += f"💸 <b>Экономия:</b> {_price(request['economy'])} ₽\n"
+    text += f"📅 <b>Обновлена:</b> {request['updated_at'] or request['created_at']}"
+
+    return InlineQueryResultArticle(
+        id=f"request_{request['id']}",
+        title=f"Заявка #{request['id']}: {status}",
+        description=request['product'][:100],
+        input_message_content=InputTextMessageContent(text, parse_mode='HTML'),
+    )
+
+
+def review_article(review):
+    """Статья с опубликованным отзывом для пересылки в другой чат"""
+    stars = "⭐" * review['rating']
+    text = (
+        f"{stars}\n"
+        f"{html.escape(review['review_text'])}\n\n"
+        f"<i>Отзыв клиента ГиперВыгоды</i>"
+    )
+    return InlineQueryResultArticle(
+        id=f"review_{review['id']}",
+        title=stars,
+        description=review['review_text'][:100],
+        input_message_content=InputTextMessageContent(text, parse_mode='HTML'),
+    )
+
+
+# ========== ОТВЕТЫ ==========
+def _build(query, user_id):
+    """Результаты и параметры ответа на нормализованный запрос"""
+    if query[0] == 'reviews':
+        reviews = sorted(database.get_approved_reviews(limit=database.FEED_SIZE),
+                         key=lambda review: review['rating'], reverse=True)
+        return [review_article(review) for review in reviews[:REVIEWS_SHOWN]]
+
+    if query[0] == 'request':
+        request = database.get_request(query[1])
+        # Чужие заявки не показываем, как и несуществующие
+        if request is None or request['user_id'] != user_id:
+            return []
+        return [request_article(request)]
+
+    requests = database.get_user_requests(user_id)[-MY_REQUESTS_SHOWN:]
+    return [request_article(request) for request in reversed(requests)]
+
+
+def _stamp(query, user_id):
+    if query[0] == 'reviews':
+        return database.get_approved_feed_version()
+    return database.get_data_version('request'), _user_versions.get(user_id, 0)
+
+
+def inline_results(text, user_id):
+    """(результаты, личный ли ответ) для текста инлайн-запроса"""
+    query = parse_query(text)
+    if query is None:
+        return [], False
+
+    personal = query[0] != 'reviews'
+    key = query + (user_id,) if personal else query
+    stamp = _stamp(query, user_id)
+    results = cache.get(key, stamp)
+    if results is None:
+        results = _build(query, user_id)
+        cache.put(key, stamp, results)
+    return results, personal
+
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ответ на инлайн-запрос "@бот ..." """
+    query = update.inline_query
+    results, personal = inline_results(query.query, query.from_user.id)
+
+    button = None
+    if not results:
+        button = InlineQueryResultsButton(text="Открыть бота: заявки и отзывы", start_parameter='inline')
+    await query.answer(
+        results,
+        cache_time=STATUS_CACHE_TIME if personal else REVIEWS_CACHE_TIME,
+        is_personal=personal,
+        button=button,
+    )
@@ -0,0 +1,102 @@
+"""
+Файлы JSON, общие для нескольких процессов: чтение, атомарная запись,
+блокировка между процессами и отпечатки для проверки изменений.
+Используются рабочей базой (database.py) и архивом (archive.py).
+"""
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from records import as_dict
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка между процессами недоступна
+    fcntl = None
+
+
+def read_json(filename):
+    """Читает JSON файл"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Кодировщик создается один раз: json.dumps с нестандартными параметрами
+# создает новый JSONEncoder на каждый вызов
+_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+
+def dumps(data):
+    """
+    JSON с одной записью на строку. Отступы (indent) переключают json на
+    медленный кодировщик на чистом Python, а так каждая запись кодируется
+    быстрым C-кодировщиком, и файл по-прежнему удобно читать и grep-ать.
+    """
+    if not isinstance(data, dict):
+        return _encode(data)
+
+    parts = []
+    for key, value in data.items():
+        if isinstance(value, list) and value:
+            items = ',\n'.join([_encode(as_dict(item)) for item in value])
+            parts.append(f'{_encode(key)}: [\n{items}\n]')
+        else:
+            parts.append(f'{_encode(key)}: {_encode(value)}')
+    return '{\n' + ',\n'.join(parts) + '\n}\n'
+
+
+def write_json(filename, data):
+    """
+    Атомарно записывает данные в JSON файл: сначала во временный файл рядом,
+    затем os.replace. Читатели в других процессах видят либо старую, либо новую
+    версию целиком, а обрыв записи не портит файл.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(filename)}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(dumps(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+@contextmanager
+def file_lock(filename):
+    """Эксклюзивная блокировка файла между процессами (flock на соседнем .lock файле)"""
+    if fcntl is None:
+        yield
+        return
+
+    with open(filename + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def touch(filename):
+    """Ставит файлу время изменения "сейчас" с точностью до наносекунд (создает, если его нет)"""
+    now = time.time_ns()
+    try:
+        os.utime(filename, ns=(now, now))
+    except FileNotFoundError:
+        with open(filename, 'a'):
+            pass
+        os.utime(filename, ns=(now, now))
+
+
+def file_stamp(filename):
+    """Отпечаток файла: меняется при любой записи в него"""
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,228 @@
+"""
+Неблокирующее структурированное логирование.
+
+Обработчики апдейтов только кладут запись лога в очередь (QueueHandler), а
+форматирование и вывод в stderr выполняет фоновый поток QueueListener, так
+что запись лога не конкурирует с обработкой апдейтов за event loop.
+
+К каждой записи, сделанной во время обработки апдейта, добавляются update_id,
+user_id, имя обработчика и время с начала обработки (latency_ms); их
+BotApplication хранит в contextvars, поэтому параллельные апдейты не
+путаются. По умолчанию строки выводятся в JSON (LOG_FORMAT=json|text).
+
+Частые INFO события (итог обработки каждого апдейта, HTTP запросы httpx)
+пропускаются с вероятностью LOG_SAMPLE_RATE; предупреждения и ошибки,
+а также медленные апдейты пишутся всегда.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from config import get_settings
+
+# Итог обработки каждого апдейта
+update_logger = logging.getLogger('updates')
+
+# Логгеры частых INFO событий, которые сэмплируются
+SAMPLED_LOGGERS = frozenset(('updates', 'httpx'))
+
+# Апдейт дольше этого (с) попадает в лог всегда, как предупреждение
+SLOW_UPDATE = 1.0
+
+_TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+_queue_handler = None
+
+
+# ========== КОНТЕКСТ АПДЕЙТА ==========
+class _UpdateInfo:
+    __slots__ = ('update_id', 'user_id', 'handler', 'started')
+
+    def __init__(self, update_id, user_id):
+        self.update_id = update_id
+        self.user_id = user_id
+        self.handler = None
+        self.started = time.perf_counter()
+
+
+_current_update = ContextVar('current_update', default=None)
+
+
+def begin_update(update):
+    """Начало обработки апдейта; возвращает токен для end_update"""
+    user = getattr(update, 'effective_user', None)
+    return _current_update.set(_UpdateInfo(getattr(update, 'update_id', None), user.id if user else None))
+
+
+def set_handler(name):
+    """Отмечает обработчик, выбранный для текущего апдейта"""
+    info = _current_update.get()
+    if info is not None:
+        info.handler = name
+
+
+def end_update(token):
+    """Пишет итог обработки апдейта (с задержкой) и сбрасывает контекст"""
+    info = _current_update.get()
+    try:
+        if info is not None:
+            latency = time.perf_counter() - info.started
+            if latency >= SLOW_UPDATE:
+                update_logger.warning(f"Медленный апдейт: {latency * 1000:.0f} мс")
+            elif update_logger.isEnabledFor(logging.INFO):
+                update_logger.info(f"Апдейт обработан за {latency * 1000:.1f} мс")
+    finally:
+        _current_update.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи поля текущего апдейта (выполняется в потоке, сделавшем запись)"""
+
+    def filter(self, record):
+        info = _current_update.get()
+        if info is None:
+            record.update_id = record.user_id = record.handler = record.latency_ms = None
+        else:
+            record.update_id = info.update_id
+            record.user_id = info.user_id
+            record.handler = info.handler
+            record.latency_ms = round((time.perf_counter() - info.started) * 1000, 1)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает долю rate INFO/DEBUG записей от SAMPLED_LOGGERS (и записей с
+    extra={'sampled': True}); остальные записи не трогает.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or self.rate >= 1:
+            return True
+        if record.name not in SAMPLED_LOGGERS and not getattr(record, 'sampled', False):
+            return True
+        if random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+# ========== ФОРМАТИРОВАНИЕ ==========
+class JsonFormatter(logging.Formatter):
+    """Одна JSON строка на запись"""
+
+    def __init__(self, process=None):
+        super().__init__()
+        self.process = process
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(sep=' ', timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if self.process:
+            entry['process'] = self.process
+        for field in ('update_id', 'user_id', 'handler', 'latency_ms'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Привычный текстовый формат с полями апдейта в конце строки"""
+
+    def __init__(self, process=None):
+        fmt = _TEXT_FORMAT if not process else _TEXT_FORMAT.replace('%(name)s', f'{process} - %(name)s')
+        super().__init__(fmt)
+
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, 'update_id', None) is not None:
+            text += (f" [update={record.update_id} user={record.user_id} "
+                     f"handler={record.handler} {record.latency_ms} мс]")
+        return text
+
+
+class _EnqueueHandler(QueueHandler):
+    """QueueHandler, который в потоке вызова только подставляет аргументы в сообщение"""
+
+    def prepare(self, record):
+        # Стандартный prepare форматирует запись целиком (включая трассировку)
+        # в вызывающем потоке; здесь это остается фоновому потоку
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+# ========== НАСТРОЙКА ==========
+def setup_logging(process=None, level=None, fmt=None, sample_rate=None, stream=None):
+    """
+    Направляет корневой логгер через очередь в фоновый поток вывода.
+    process - имя процесса в строках лога (например, worker-1).
+    Повторный вызов заменяет предыдущую настройку.
+    """
+    global _listener, _queue_handler
+
+    settings = get_settings()
+    level = level or settings.log_level
+    fmt = fmt or settings.log_format
+    sample_rate = settings.log_sample_rate if sample_rate is None else sample_rate
+
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter(process) if fmt == 'json' else TextFormatter(process))
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _EnqueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(sample_rate))
+    _queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Дописывает очередь и останавливает фоновый поток"""
+    global _listener, _queue_handler
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+def dropped_records():
+    """Сколько записей отброшено сэмплированием"""
+    if _queue_handler is None:
+        return 0
+    return sum(f.dropped for f in _queue_handler.filters if isinstance(f, SamplingFilter))
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,380 @@
+"""
+Импорт заявок и отзывов из файлов других развертываний и старых форматов.
+
+Источник читается потоком, без json.load всего файла. Поддерживаются:
+    {"requests": [...], ...}  - формат requests.json/reviews.json
+    [...]                     - массив записей
+    одна запись на строку     - JSONL (в том числе сегменты архива .jsonl.gz)
+Файлы .gz распаковываются на лету.
+
+Каждая запись проверяется и приводится к схеме database.py, получает новый ID
+из рабочей базы (старый ID можно сохранить в файл соответствий --id-map) и
+записывается пачками по --batch штук одной записью на диск. Закрытые записи
+старше ARCHIVE_AFTER_DAYS сразу уходят в сегменты архива (--target auto).
+Прогресс хранится в рабочей базе вместе с пачкой: прерванный импорт того же
+файла продолжается с места остановки. Отклоненные записи с причиной пишутся
+в <источник>.rejects.jsonl.
+
+Запуск:
+    python migrate.py requests old/requests.json
+    python migrate.py reviews backup/reviews.jsonl.gz --batch 100000 --id-map reviews_ids.csv
+"""
+import argparse
+import gzip
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+
+import archive
+import database
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+CHUNK_SIZE = 1 << 20
+# Запись длиннее этого считается повреждением файла (иначе буфер рос бы до конца файла)
+MAX_RECORD_SIZE = 16 << 20
+
+REQUEST_STATUSES = ('new', 'in_progress', 'completed', 'cancelled', 'rejected')
+REVIEW_STATUSES = ('pending', 'approved', 'rejected')
+
+_KINDS = {'requests': 'request', 'reviews': 'review'}
+
+
+class InvalidRecord(ValueError):
+    """Запись источника не удалось привести к схеме"""
+
+
+# ========== ПОТОКОВОЕ ЧТЕНИЕ ==========
+def _open_source(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def iter_source(path, key):
+    """Записи источника по одной; формат определяется по началу файла"""
+    with _open_source(path) as f:
+        head = f.read(CHUNK_SIZE)
+        if _is_jsonl(head, key):
+            yield from _iter_jsonl(f, head)
+        else:
+            yield from _iter_json_array(f, head, key)
+
+
+def _is_jsonl(head, key):
+    """JSONL, если первая строка - целая запись (а не начало массива или объекта с ключом key)"""
+    try:
+        first = json.loads(head.split('\n', 1)[0])
+    except ValueError:
+        return False
+    return isinstance(first, dict) and key not in first
+
+
+def _iter_jsonl(f, head):
+    lines = head.split('\n')
+    # Последняя строка куска может быть оборвана - дочитываем ее
+    lines[-1] += f.readline()
+    for line in itertools.chain(lines, f):
+        if line.strip():
+            yield json.loads(line)
+
+
+def _iter_json_array(f, buffer, key):
+    """
+    Достает объекты из массива JSON (верхнего уровня или под ключом key)
+    через JSONDecoder.raw_decode, подчитывая файл кусками по CHUNK_SIZE.
+    """
+    decoder = json.JSONDecoder()
+    eof = False
+
+    def more(data):
+        nonlocal eof
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        return data + chunk
+
+    # Ищем начало массива записей
+    marker = f'"{key}"'
+    while True:
+        stripped = buffer.lstrip()
+        if stripped.startswith('['):
+            pos = len(buffer) - len(stripped) + 1
+            break
+        position = buffer.find(marker)
+        if position >= 0:
+            bracket = buffer.find('[', position)
+            if bracket >= 0:
+                pos = bracket + 1
+                break
+        if eof:
+            raise InvalidRecord(f"в файле нет массива записей '{key}'")
+        buffer = more(buffer)
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise InvalidRecord("файл оборвался внутри массива записей")
+            buffer, pos = more(buffer[pos:]), 0
+            continue
+
+        if buffer[pos] == ']':
+            return
+
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            if len(buffer) - pos > MAX_RECORD_SIZE:
+                raise InvalidRecord(f"запись длиннее {MAX_RECORD_SIZE} байт - файл поврежден?")
+            buffer, pos = more(buffer[pos:]), 0
+            continue
+
+        yield record
+        pos = end
+
+
+# ========== ПРОВЕРКА И НОРМАЛИЗАЦИЯ ==========
+def _int(value, field, required=True):
+    if value is None or value == '':
+        if required:
+            raise InvalidRecord(f"нет поля {field}")
+        return None
+    if isinstance(value, bool):
+        raise InvalidRecord(f"{field}: ожидалось число")
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = ''.join(char for char in str(value) if char.isdigit() or char == '-')
+    try:
+        return int(digits)
+    except ValueError:
+        raise InvalidRecord(f"{field}: ожидалось число, получено {value!r}")
+
+
+def _number(value, field):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    try:
+        return float(str(value).replace(' ', '').replace(',', '.'))
+    except ValueError:
+        raise InvalidRecord(f"{field}: ожидалось число, получено {value!r}")
+
+
+def _text(value, limit=None):
+    text = '' if value is None else str(value).strip()
+    return text[:limit] if limit else text
+
+
+def _time(value, field, default=None):
+    """Приводит дату к формату TIME_FORMAT (понимает ISO, дату без времени и unix-время)"""
+    if value is None or value == '':
+        return default
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value).strftime(TIME_FORMAT)
+    text = str(value).strip().replace('T', ' ').rstrip('Z')
+    for fmt in (TIME_FORMAT, '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%d.%m.%Y %H:%M:%S', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(text[:26], fmt).strftime(TIME_FORMAT)
+        except ValueError:
+            continue
+    raise InvalidRecord(f"{field}: не удалось разобрать дату {value!r}")
+
+
+def _status(value, allowed, default):
+    status = _text(value).lower() or default
+    if status not in allowed:
+        raise InvalidRecord(f"неизвестный статус {value!r}")
+    return status
+
+
+def normalize_request(source, now):
+    """Приводит заявку к схеме database.save_request"""
+    product = _text(source.get('product'), 500)
+    if not product:
+        raise InvalidRecord("нет поля product")
+
+    created_at = _time(source.get('created_at'), 'created_at', now)
+    known_price = _int(source.get('known_price'), 'known_price')
+    found_price = _int(source.get('found_price'), 'found_price', required=False)
+    economy = _number(source.get('economy'), 'economy')
+    commission = _number(source.get('commission'), 'commission')
+    if economy is None and found_price and known_price:
+        economy = known_price - found_price
+
+    return {
+        'id': None,
+        'user_id': _int(source.get('user_id'), 'user_id'),
+        'username': _text(source.get('username')).lstrip('@'),
+        'product': product,
+        'known_price': known_price,
+        'city': _text(source.get('city'), 100),
+        'contact': _text(source.get('contact'), 100),
+        'status': _status(source.get('status'), REQUEST_STATUSES, 'new'),
+        'created_at': created_at,
+        'updated_at': _time(source.get('updated_at'), 'updated_at', created_at),
+        'found_price': found_price,
+        'economy': economy,
+        'commission': commission,
+        'notes': _text(source.get('notes')),
+    }
+
+
+def normalize_review(source, now):
+    """Приводит отзыв к схеме database.save_review"""
+    review_text = _text(source.get('review_text'))
+    if not review_text:
+        raise InvalidRecord("нет поля review_text")
+
+    rating = _int(source.get('rating'), 'rating')
+    if not 1 <= rating <= 5:
+        raise InvalidRecord(f"оценка {rating} вне диапазона 1-5")
+
+    status = _status(source.get('status'), REVIEW_STATUSES, 'pending')
+    return {
+        'id': None,
+        'user_id': _int(source.get('user_id'), 'user_id'),
+        'username': _text(source.get('username')).lstrip('@'),
+        'review_text': review_text,
+        'rating': rating,
+        'status': status,
+        'created_at': _time(source.get('created_at'), 'created_at', now),
+        'published_at': _time(source.get('published_at'), 'published_at') if status == 'approved' else None,
+        'published_message_id': _int(source.get('published_message_id'), 'published_message_id', required=False),
+        'admin_notes': _text(source.get('admin_notes')),
+    }
+
+
+NORMALIZERS = {'request': normalize_request, 'review': normalize_review}
+
+
+# ========== ИМПОРТ ==========
+class Migration:
+    """Импорт одного файла-источника пачками с продолжением после сбоя"""
+
+    def __init__(self, kind, source, batch_size=50000, target='auto', id_map=None, dry_run=False):
+        self.kind = kind
+        self.source = source
+        self.batch_size = batch_size
+        self.target = target
+        self.id_map = id_map
+        self.dry_run = dry_run
+        # Ключ прогресса: имя и размер файла (тот же файл из другого каталога продолжит импорт)
+        self.source_key = f"{os.path.basename(source)}:{os.path.getsize(source)}"
+        self.cutoff = archive.cutoff_for()
+        self.read = 0
+        self.imported = 0
+        self.archived = 0
+        self.rejected = 0
+        self._rejects = None
+
+    def run(self, restart=False, progress=print):
+        skip = 0 if restart else database.get_migration_position(self.kind, self.source_key)
+        if skip:
+            progress(f"↪️ Продолжаем импорт {self.source}: пропускаем {skip} уже импортированных записей")
+
+        now = datetime.now().strftime(TIME_FORMAT)
+        normalize = NORMALIZERS[self.kind]
+        started = time.monotonic()
+        batch, old_ids = [], []
+
+        try:
+            for position, source_record in enumerate(iter_source(self.source, self.kind + 's'), 1):
+                self.read = position
+                if position <= skip:
+                    continue
+                try:
+                    if not isinstance(source_record, dict):
+                        raise InvalidRecord("запись не является объектом")
+                    batch.append(normalize(source_record, now))
+                    old_ids.append(source_record.get('id'))
+                except InvalidRecord as e:
+                    self._reject(position, source_record, str(e))
+
+                if len(batch) >= self.batch_size:
+                    self._flush(batch, old_ids, position)
+                    batch, old_ids = [], []
+                    self._report(progress, started)
+
+            if batch or self.read > skip:
+                self._flush(batch, old_ids, self.read)
+        finally:
+            if self._rejects is not None:
+                self._rejects.close()
+
+        self._report(progress, started)
+        return self
+
+    def _flush(self, batch, old_ids, position):
+        if self.dry_run:
+            self.imported += len(batch)
+            return
+
+        if self.target == 'hot':
+            hot = database.import_records(self.kind, batch, self.source_key, position)
+        else:
+            with archive.archive_transaction(self.kind) as index:
+                segments = []
+
+                def split(records):
+                    cold = [record for record in records if archive.is_archivable(self.kind, record, self.cutoff)]
+                    if cold:
+                        segments.extend(archive.add_segments(self.kind, cold, index))
+                    return [record for record in records
+                            if not archive.is_archivable(self.kind, record, self.cutoff)]
+
+                hot = database.import_records(self.kind, batch, self.source_key, position, before_save=split)
+                archive.commit_segments(segments, index)
+
+        self.imported += len(hot)
+        self.archived += len(batch) - len(hot)
+
+        if self.id_map:
+            with open(self.id_map, 'a', encoding='utf-8') as f:
+                for old_id, record in zip(old_ids, batch):
+                    f.write(f"{old_id},{record['id']}\n")
+
+    def _reject(self, position, source_record, reason):
+        self.rejected += 1
+        if self.dry_run:
+            return
+        if self._rejects is None:
+            self._rejects = open(f"{os.path.basename(self.source)}.rejects.jsonl", 'a', encoding='utf-8')
+        self._rejects.write(json.dumps({'position': position, 'reason': reason, 'record': source_record},
+                                       ensure_ascii=False) + '\n')
+
+    def _report(self, progress, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        progress(f"   прочитано {self.read}, в рабочую базу {self.imported}, в архив {self.archived}, "
+                 f"отклонено {self.rejected} ({self.read / elapsed:,.0f} записей/с)")
+
+
+# ========== ЗАПУСК ИЗ КОМАНДНОЙ СТРОКИ ==========
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Потоковый импорт заявок или отзывов в хранилище бота")
+    parser.add_argument('kind', choices=sorted(_KINDS), help="что импортировать")
+    parser.add_argument('source', help="файл JSON/JSONL (можно .gz)")
+    parser.add_argument('--batch', type=int, default=50000, help="записей в одной транзакции")
+    parser.add_argument('--target', choices=('auto', 'hot'), default='auto',
+                        help="auto - старые закрытые записи сразу в архив, hot - все в рабочую базу")
+    parser.add_argument('--id-map', help="CSV-файл соответствия старых и новых ID")
+    parser.add_argument('--dry-run', action='store_true', help="только проверить записи, ничего не записывая")
+    parser.add_argument('--restart', action='store_true', help="начать заново, не продолжая прерванный импорт")
+    args = parser.parse_args(argv)
+
+    print(f"📥 Импорт {args.source} ({args.kind})")
+    migration = Migration(_KINDS[args.kind], args.source, max(args.batch, 1), args.target,
+                          args.id_map, args.dry_run).run(restart=args.restart)
+    verb = "проверено" if args.dry_run else "импортировано"
+    print(f"✅ Готово: {verb} {migration.imported + migration.archived}, отклонено {migration.rejected}")
+    if migration.rejected and not args.dry_run:
+        print(f"   Отклоненные записи: {os.path.basename(args.source)}.rejects.jsonl")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import html
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+
+from config import get_settings
+from database import get_pending_reviews, update_reviews_status
+
+# Отзывов на странице /moderate
+PAGE_SIZE = 8
+
+# Длина превью отзыва в списке
+PREVIEW_LENGTH = 200
+
+
+def _page_reviews(page):
+    """Возвращает (отзывы страницы, номер страницы, всего страниц, всего отзывов)"""
+    pending = get_pending_reviews()
+    pages = max((len(pending) + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+    page = min(max(page, 0), pages - 1)
+    return pending[page * PAGE_SIZE:(page + 1) * PAGE_SIZE], page, pages, len(pending)
+
+
+def _render(page, selected, notice=None):
+    """Собирает текст и клавиатуру страницы модерации"""
+    reviews, page, pages, total = _page_reviews(page)
+
+    lines = []
+    if notice:
+        lines.append(notice)
+        lines.append("")
+
+    if not reviews:
+        lines.append("✅ Нет отзывов на модерации")
+        return '\n'.join(lines), None
+
+    lines.append(f"🛡 <b>Модерация отзывов</b>: {total} на модерации, страница {page + 1} из {pages}")
+    lines.append("")
+
+    for review in reviews:
+        text = review['review_text']
+        if len(text) > PREVIEW_LENGTH:
+            text = text[:PREVIEW_LENGTH] + "..."
+        mark = "☑️" if review['id'] in selected else "▫️"
+        lines.append(
+            f"{mark} <b>#{review['id']}</b> {'⭐' * review['rating']} "
+            f"@{html.escape(review['username'] or 'без username')}\n{html.escape(text)}\n"
+        )
+
+    toggles = [
+        InlineKeyboardButton(
+            f"{'☑️' if review['id'] in selected else '▫️'} #{review['id']}",
+            callback_data=f"mod_toggle_{page}_{review['id']}"
+        )
+        for review in reviews
+    ]
+    keyboard = [toggles[i:i + 4] for i in range(0, len(toggles), 4)]
+
+    keyboard.append([
+        InlineKeyboardButton(f"✅ Одобрить страницу ({len(reviews)})", callback_data=f"mod_approve_{page}"),
+        InlineKeyboardButton(f"❌ Отклонить выбранные ({len(selected)})", callback_data=f"mod_reject_{page}"),
+    ])
+
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=f"mod_page_{page - 1}"))
+    navigation.append(InlineKeyboardButton("🔄", callback_data=f"mod_page_{page}"))
+    if page + 1 < pages:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=f"mod_page_{page + 1}"))
+    keyboard.append(navigation)
+
+    return '\n'.join(lines), InlineKeyboardMarkup(keyboard)
+
+
+async def moderate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Массовая модерация отзывов (команда /moderate)"""
+    if update.effective_user.id != get_settings().admin_id:
+        await update.message.reply_text("❌ Эта команда только для администратора")
+        return
+
+    selected = context.user_data['moderate_selected'] = set()
+    text, keyboard = _render(0, selected)
+    await update.message.reply_html(text, reply_markup=keyboard)
+
+
+async def moderate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопки режима /moderate: выбор, листание, одобрение страницы и отклонение выбранных"""
+    query = update.callback_query
+
+    if update.effective_user.id != get_settings().admin_id:
+        await query.answer("❌ Только для администратора")
+        return
+
+    selected = context.user_data.setdefault('moderate_selected', set())
+    parts = query.data.split('_')
+    action, page = parts[1], int(parts[2])
+    notice = None
+
+    if action == 'toggle':
+        review_id = int(parts[3])
+        selected.symmetric_difference_update({review_id})
+        await query.answer()
+
+    elif action == 'approve':
+        reviews, page, _, _ = _page_reviews(page)
+        approved = update_reviews_status([review['id'] for review in reviews], 'approved',
+                                         expected_status='pending')
+        selected.difference_update(review['id'] for review in approved)
+        publisher = context.application.publisher
+        publisher.submit(approved)
+        notice = (f"✅ Одобрено {len(approved)}. В очереди на публикацию: {len(publisher)} "
+                  f"(не чаще {publisher.posts_per_minute} в минуту)")
+        await query.answer(f"Одобрено: {len(approved)}")
+
+    elif action == 'reject':
+        if not selected:
+            await query.answer("Сначала отметьте отзывы")
+            return
+        rejected = update_reviews_status(sorted(selected), 'rejected', expected_status='pending')
+        selected.clear()
+        notice = f"❌ Отклонено {len(rejected)}"
+        await query.answer(f"Отклонено: {len(rejected)}")
+
+    else:
+        await query.answer()
+
+    text, keyboard = _render(page, selected, notice)
+    try:
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=keyboard)
+    except BadRequest as e:
+        # "Message is not modified" при повторном нажатии 🔄 без изменений
+        if 'not modified' not in str(e):
+            raise
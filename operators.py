@@ -0,0 +1,450 @@
+"""
+Пул операторов: распределение новых заявок и отзывов между несколькими людьми.
+
+Раньше каждое уведомление о заявке и каждая карточка модерации уходили
+одному ADMIN_ID. Теперь запись назначается оператору из OPERATOR_IDS
+(администратор - оператор по умолчанию), и назначение хранится в самой
+записи (operator_id, assigned_at), поэтому переживает перезапуск и видно
+всем процессам supervisor.py.
+
+Выбор оператора:
+- заявки и отзывы клиента, у которого уже есть открытая запись, идут тому же
+  оператору (закрепление за клиентом);
+- least_loaded - оператору с наименьшим числом открытых записей на единицу
+  веса (открытые - заявки new/in_progress и отзывы pending);
+- round_robin - взвешенная очередь (smooth weighted round-robin, как в nginx).
+
+Загрузка операторов и закрепление клиентов не пересчитываются по всем
+открытым записям при каждом выборе: их ведет индекс _Assignments, который
+обновляется обработчиком изменений database.py и строится заново, только
+если данные изменил другой процесс (database.get_data_version).
+
+Заявка, которую оператор не взял в работу (статус остался new), и отзыв, не
+проверенный (pending), через OPERATOR_TIMEOUT_MINUTES переходят к другому
+оператору. Заявку в статусе in_progress оператор ведет сам - она не
+переназначается. Очереди и счетчики операторов показывает /operators.
+
+Записи читаются только как словари (record['поле']): сюда приходят и
+объекты records.py, и словари из архива.
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import ContextTypes
+
+from config import get_settings
+from database import OPEN_STATUSES, add_change_listener, assign_operator, get_data_version, get_open_records, \
+    get_request, get_requests_by_status, get_review, get_reviews_by_status, remove_change_listener, update_request
+from records import TIME_FORMAT, time_of, to_epoch
+
+logger = logging.getLogger(__name__)
+
+# Статус, в котором запись ждет оператора и переназначается по таймауту
+WAITING_STATUS = {'request': 'new', 'review': 'pending'}
+
+# Как часто проверяются просроченные назначения, с
+SWEEP_INTERVAL = 60
+
+_FETCH = {'request': get_request, 'review': get_review}
+_BY_STATUS = {'request': get_requests_by_status, 'review': get_reviews_by_status}
+
+
+def _now_epoch():
+    """Текущее время в той же шкале, что и assigned_at записей"""
+    return to_epoch(datetime.now().strftime(TIME_FORMAT))
+
+
+class _Assignments:
+    """Открытые записи с оператором: загрузка по операторам и записи по клиентам"""
+
+    def __init__(self, versions):
+        # Версии данных (заявки, отзывы), по которым построен индекс
+        self.versions = versions
+        self.load = Counter()
+        # (kind, id) -> (operator_id, user_id)
+        self._records = {}
+        # user_id -> {(kind, id): (created_at, operator_id)}
+        self._clients = {}
+
+    @classmethod
+    def build(cls, versions):
+        index = cls(versions)
+        for kind in OPEN_STATUSES:
+            for record in get_open_records(kind):
+                index.update(kind, record)
+        return index
+
+    def update(self, kind, record, deleted=False):
+        """Учитывает новое состояние записи"""
+        key = (kind, record['id'])
+        previous = self._records.pop(key, None)
+        if previous is not None:
+            operator_id, user_id = previous
+            self.load[operator_id] -= 1
+            if not self.load[operator_id]:
+                del self.load[operator_id]
+            client = self._clients[user_id]
+            del client[key]
+            if not client:
+                del self._clients[user_id]
+
+        operator_id = record['operator_id']
+        if deleted or operator_id is None or record['status'] not in OPEN_STATUSES[kind]:
+            return
+        user_id = record['user_id']
+        self._records[key] = (operator_id, user_id)
+        self.load[operator_id] += 1
+        self._clients.setdefault(user_id, {})[key] = (record['created_at'] or '', operator_id)
+
+    def owner(self, user_id, operators, skip=None):
+        """Оператор из operators, ведущий самую свежую открытую запись клиента (кроме skip)"""
+        newest = None
+        for key, (created_at, operator_id) in self._clients.get(user_id, {}).items():
+            if key != skip and operator_id in operators and (newest is None or created_at > newest[0]):
+                newest = (created_at, operator_id)
+        return newest[1] if newest is not None else None
+
+
+def take_button(request_id):
+    """Клавиатура уведомления о заявке"""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🙋 Взять в работу", callback_data=f"op_take_{request_id}")]])
+
+
+class OperatorPool:
+    """Назначение заявок и отзывов операторам и переназначение по таймауту"""
+
+    def __init__(self, bot, operators=None, strategy=None, timeout_minutes=None):
+        settings = get_settings()
+        if operators is None:
+            operators = settings.operators or (((settings.admin_id, 1),) if settings.admin_id else ())
+        self.bot = bot
+        self.weights = dict(operators)
+        self.strategy = strategy or settings.operator_strategy
+        if timeout_minutes is None:
+            timeout_minutes = settings.operator_timeout_minutes
+        self.timeout = timeout_minutes * 60
+        # kind -> render(record, details) -> (текст HTML, клавиатура)
+        self._alerts = {}
+        # Текущие веса взвешенной очереди round_robin
+        self._current = {operator_id: 0 for operator_id in self.weights}
+        # Сдвиг порядка операторов при равной загрузке
+        self._rotation = 0
+        # Счетчики с запуска процесса
+        self.assigned = Counter()
+        self.reassigned = Counter()
+        self.handled = Counter()
+        self._response_seconds = Counter()
+        self._task = None
+        self._stopping = asyncio.Event()
+        self._assignments = None
+        self._listening = False
+
+    def __contains__(self, user_id):
+        return user_id in self.weights
+
+    def configure(self, settings):
+        """Применяет перечитанные настройки (SIGHUP): состав и веса операторов, стратегию, таймаут"""
+        operators = settings.operators or (((settings.admin_id, 1),) if settings.admin_id else ())
+        self.weights = dict(operators)
+        self.strategy = settings.operator_strategy
+        self.timeout = settings.operator_timeout_minutes * 60
+        self._current = {operator_id: self._current.get(operator_id, 0) for operator_id in self.weights}
+        # Проверка просроченных назначений нужна, если операторов стало больше одного
+        self.start()
+
+    def register_alert(self, kind, render):
+        """Задает функцию, которая готовит уведомление оператору о записи kind"""
+        self._alerts[kind] = render
+
+    def can_handle(self, user_id, record):
+        """
+        Может ли user_id принимать решение по записи: администратор - всегда,
+        оператор - если запись назначена ему, никому или выбывшему из пула.
+        """
+        if user_id == get_settings().admin_id:
+            return True
+        if user_id not in self.weights:
+            return False
+        owner = record.get('operator_id')
+        return owner is None or owner == user_id or owner not in self.weights
+
+    # ----- выбор оператора -----
+    def _index(self):
+        """Индекс назначений; строится заново, если данные перечитаны с диска"""
+        versions = (get_data_version('request'), get_data_version('review'))
+        if self._assignments is None or self._assignments.versions != versions:
+            if not self._listening:
+                add_change_listener(self._on_change)
+                self._listening = True
+            self._assignments = _Assignments.build(versions)
+        return self._assignments
+
+    def _on_change(self, kind, record, deleted):
+        if self._assignments is not None and kind in OPEN_STATUSES:
+            self._assignments.update(kind, record, deleted)
+
+    def pick(self, user_id):
+        """Оператор для новой записи клиента (администратор, если пул пуст; None - назначать некому)"""
+        return self.choose(user_id) or get_settings().admin_id
+
+    def choose(self, user_id, exclude=(), key=None):
+        """
+        Оператор для записи клиента user_id (None, если подходящих нет).
+        key - (kind, id) самой записи: при переназначении она не закрепляет
+        клиента за прежним оператором.
+        """
+        candidates = [operator_id for operator_id in self.weights if operator_id not in exclude]
+        if not candidates:
+            return None
+
+        index = self._index()
+        owner = index.owner(user_id, self.weights, skip=key)
+        if owner is not None and owner not in exclude:
+            return owner
+
+        if self.strategy == 'round_robin':
+            return self._next_weighted(candidates)
+
+        self._rotation += 1
+        shift = self._rotation % len(candidates)
+        ordered = candidates[shift:] + candidates[:shift]
+        load = index.load
+        return min(ordered, key=lambda operator_id: load[operator_id] / self.weights[operator_id])
+
+    def _next_weighted(self, candidates):
+        total = 0
+        best = None
+        for operator_id in candidates:
+            weight = self.weights[operator_id]
+            self._current[operator_id] += weight
+            total += weight
+            if best is None or self._current[operator_id] > self._current[best]:
+                best = operator_id
+        self._current[best] -= total
+        return best
+
+    # ----- назначение и уведомление -----
+    async def dispatch(self, kind, record_id, details=None):
+        """
+        Отправляет уведомление оператору новой записи. Запись, сохраненная с
+        оператором из pick(), повторно не записывается; без оператора - она
+        назначается здесь. details - данные для уведомления, которых нет в
+        записи (например, ссылка на товар). Возвращает ID оператора или None.
+        """
+        record = _FETCH[kind](record_id)
+        if record is None:
+            logger.error(f"Запись {kind} #{record_id} не найдена для назначения оператору")
+            return None
+
+        operator_id = record.get('operator_id')
+        if operator_id is None:
+            operator_id = self.pick(record['user_id'])
+            if operator_id is None:
+                logger.error(f"Нет операторов для {kind} #{record_id}: задайте ADMIN_ID или OPERATOR_IDS")
+                return None
+            record = assign_operator(kind, record_id, operator_id)
+            if record is None:
+                return None
+        self.assigned[operator_id] += 1
+        await self._notify(kind, record, operator_id, details)
+        return operator_id
+
+    async def _notify(self, kind, record, operator_id, details=None, note=None):
+        render = self._alerts.get(kind)
+        if render is None:
+            logger.error(f"Не задано уведомление оператору для {kind}")
+            return False
+        text, reply_markup = render(record, details)
+        if note:
+            text = f"{note}\n\n{text}"
+        try:
+            await self.bot.send_message(
+                chat_id=operator_id,
+                text=text,
+                parse_mode='HTML',
+                reply_markup=reply_markup,
+                disable_web_page_preview=True
+            )
+        except Exception as e:
+            # Запись остается за оператором и уйдет другому по таймауту
+            logger.error(f"Не удалось уведомить оператора {operator_id} о {kind} #{record['id']}: {e}")
+            return False
+        return True
+
+    def record_handled(self, operator_id, record):
+        """Учитывает решение оператора по записи (время от назначения до решения)"""
+        self.handled[operator_id] += 1
+        assigned_at = time_of(record, 'assigned_at')
+        if assigned_at is not None:
+            self._response_seconds[operator_id] += max(_now_epoch() - assigned_at, 0)
+
+    # ----- переназначение по таймауту -----
+    def start(self):
+        """Запускает периодическую проверку просроченных назначений (вызывать из event loop)"""
+        if self._task is not None or not self.timeout or len(self.weights) < 2:
+            return
+        self._stopping.clear()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout=None):
+        """Останавливает проверку; начатый проход дорабатывает, но не дольше timeout секунд"""
+        if self._listening:
+            remove_change_listener(self._on_change)
+            self._listening = False
+            self._assignments = None
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Переназначение операторов прервано при остановке через {timeout:.0f} с")
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), SWEEP_INTERVAL)
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.reassign_overdue()
+            except Exception as e:
+                logger.error(f"Ошибка переназначения операторов: {e}")
+
+    async def reassign_overdue(self):
+        """Передает другому оператору записи, ждущие дольше таймаута; возвращает их число"""
+        deadline = _now_epoch() - self.timeout
+        moved = 0
+        for kind, status in WAITING_STATUS.items():
+            for record in _BY_STATUS[kind](status):
+                # Записи без назначения (созданные до пула операторов) не трогаем
+                assigned_at = time_of(record, 'assigned_at')
+                if assigned_at is None or assigned_at > deadline:
+                    continue
+                previous = record['operator_id']
+                operator_id = self.choose(record['user_id'], exclude=(previous,), key=(kind, record['id']))
+                if operator_id is None:
+                    continue
+                # Условное назначение: другой процесс мог успеть раньше
+                assigned = assign_operator(kind, record['id'], operator_id, expected_status=status,
+                                           expected_assigned_at=record['assigned_at'])
+                if assigned is None:
+                    continue
+                moved += 1
+                self.assigned[operator_id] += 1
+                self.reassigned[previous] += 1
+                logger.info(f"{kind} #{record['id']} переназначена: {previous} -> {operator_id}")
+                minutes = self.timeout // 60
+                await self._notify(kind, assigned, operator_id,
+                                   note=f"🔁 <b>Переназначено вам</b>: не обработано за {minutes} мин")
+        return moved
+
+    # ----- метрики -----
+    def metrics(self):
+        """Очереди и счетчики по операторам"""
+        queues = {operator_id: Counter() for operator_id in self.weights}
+        unassigned = 0
+        oldest = {}
+        for kind in OPEN_STATUSES:
+            for record in get_open_records(kind):
+                operator_id = record['operator_id']
+                if operator_id is None:
+                    unassigned += 1
+                    continue
+                queues.setdefault(operator_id, Counter())[f"{kind}_{record['status']}"] += 1
+                assigned_at = time_of(record, 'assigned_at')
+                if record['status'] == WAITING_STATUS[kind] and assigned_at is not None:
+                    oldest[operator_id] = min(oldest.get(operator_id, assigned_at), assigned_at)
+
+        now = _now_epoch()
+        operators = []
+        for operator_id, queue in queues.items():
+            handled = self.handled[operator_id]
+            operators.append({
+                'operator_id': operator_id,
+                'weight': self.weights.get(operator_id),
+                'new_requests': queue['request_new'],
+                'in_progress': queue['request_in_progress'],
+                'pending_reviews': queue['review_pending'],
+                'oldest_waiting_minutes': (now - oldest[operator_id]) // 60 if operator_id in oldest else None,
+                'assigned': self.assigned[operator_id],
+                'reassigned_away': self.reassigned[operator_id],
+                'handled': handled,
+                'avg_response_minutes': (round(self._response_seconds[operator_id] / handled / 60, 1)
+                                         if handled else None),
+            })
+        return {'operators': operators, 'unassigned': unassigned}
+
+
+# ========== ОБРАБОТЧИКИ ==========
+async def take_request_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка «Взять в работу» в уведомлении о заявке"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    request_id = int(query.data.split('_')[2])
+    pool = context.application.operators
+
+    request = get_request(request_id)
+    if request is None:
+        await query.answer("❌ Заявка не найдена")
+        return
+    if not pool.can_handle(user_id, request):
+        await query.answer(f"Заявка #{request_id} назначена другому оператору", show_alert=True)
+        return
+    if not update_request(request_id, expected_status='new', status='in_progress', operator_id=user_id):
+        await query.answer(f"ℹ️ Заявка #{request_id} уже в статусе {get_request(request_id)['status']}")
+        return
+
+    pool.record_handled(user_id, request)
+    await query.answer("Заявка ваша")
+    who = f"@{update.effective_user.username}" if update.effective_user.username else str(user_id)
+    await query.edit_message_text(
+        f"{query.message.text_html}\n\n🙋 <b>В работе у {who}</b>",
+        parse_mode='HTML',
+        disable_web_page_preview=True
+    )
+
+    try:
+        await context.bot.send_message(
+            chat_id=request['user_id'],
+            text=f"🔍 <b>Заявка #{request_id} взята в работу.</b>\nСтатус: /myrequest",
+            parse_mode='HTML'
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось уведомить пользователя о заявке #{request_id}: {e}")
+
+
+async def operators_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Очереди операторов (команда /operators)"""
+    if update.effective_user.id != get_settings().admin_id:
+        await update.message.reply_text("❌ Эта команда только для администратора")
+        return
+
+    pool = context.application.operators
+    metrics = pool.metrics()
+    timeout = f"{pool.timeout // 60} мин" if pool.timeout else "выключено"
+    lines = [
+        f"👥 <b>ОПЕРАТОРЫ</b> ({pool.strategy}, переназначение: {timeout})",
+        "",
+    ]
+    for item in metrics['operators']:
+        weight = f"вес {item['weight']}" if item['weight'] else "не в пуле"
+        lines.append(f"<b>{item['operator_id']}</b> ({weight})")
+        lines.append(f"   📥 Новые заявки: {item['new_requests']}, в работе: {item['in_progress']}, "
+                     f"отзывы: {item['pending_reviews']}")
+        if item['oldest_waiting_minutes'] is not None:
+            lines.append(f"   ⏳ Самая старая без ответа: {item['oldest_waiting_minutes']} мин")
+        average = f", в среднем {item['avg_response_minutes']} мин" if item['avg_response_minutes'] is not None else ""
+        lines.append(f"   📊 Назначено: {item['assigned']}, обработано: {item['handled']}{average}, "
+                     f"ушло по таймауту: {item['reassigned_away']}")
+    if metrics['unassigned']:
+        lines.append(f"\n📭 Открытых без оператора: {metrics['unassigned']}")
+    lines.append("\n<i>Назначено/обработано - с запуска процесса</i>")
+    await update.message.reply_html('\n'.join(lines))
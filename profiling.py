@@ -0,0 +1,285 @@
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк попадает в отчеты
+TOP_LIMIT = 40
+
+# Текущие профилировщики. Пока они None, горячий путь обработки апдейтов
+# делает одну проверку атрибута и больше ничего не тратит.
+sampler = None
+update_capture = None
+memory_baseline = None
+
+
+# ========== СЭМПЛИРУЮЩИЙ ПРОФИЛИРОВЩИК ==========
+class SamplingProfiler:
+    """Периодически снимает стек потока event loop из фонового потока"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = 0
+        self.self_counts = Counter()
+        self.total_counts = Counter()
+        self.stacks = Counter()
+        self.started_at = time.monotonic()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.reverse()
+
+            self.samples += 1
+            self.self_counts[stack[-1]] += 1
+            self.total_counts.update(set(stack))
+            self.stacks[';'.join(stack)] += 1
+
+    def stop(self):
+        """Останавливает сбор и возвращает текстовый отчет"""
+        self._stop_event.set()
+        self._thread.join()
+        duration = time.monotonic() - self.started_at
+
+        lines = [
+            f"Сэмплирующий профиль: {self.samples} сэмплов за {duration:.1f} с "
+            f"(интервал {self.interval * 1000:.1f} мс)",
+            "",
+            "=== Топ функций по собственному времени ===",
+        ]
+        lines += _format_counts(self.self_counts, self.samples)
+        lines += ["", "=== Топ функций по суммарному времени ==="]
+        lines += _format_counts(self.total_counts, self.samples)
+        lines += ["", "=== Свернутые стеки (формат flamegraph) ==="]
+        lines += [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return '\n'.join(lines)
+
+
+def _format_counts(counter, total):
+    """Форматирует счетчик сэмплов в строки с процентами"""
+    if not total:
+        return ["(нет данных)"]
+    return [f"{count * 100 / total:6.2f}%  {count:7d}  {name}"
+            for name, count in counter.most_common(TOP_LIMIT)]
+
+
+# ========== cProfile ДЛЯ N АПДЕЙТОВ ==========
+class UpdateCapture:
+    """Профилирует обработку следующих N апдейтов через cProfile"""
+
+    def __init__(self, updates, chat_id):
+        self.remaining = updates
+        self.total = updates
+        self.chat_id = chat_id
+        self.profile = cProfile.Profile()
+        self._active = 0
+
+    async def run(self, coroutine, bot):
+        """Выполняет обработку апдейта под профилировщиком"""
+        global update_capture
+
+        if self._active == 0:
+            self.profile.enable()
+        self._active += 1
+        try:
+            await coroutine
+        finally:
+            self._active -= 1
+            if self._active == 0:
+                self.profile.disable()
+
+        self.remaining -= 1
+        if self.remaining > 0 or update_capture is not self:
+            return
+
+        update_capture = None
+        try:
+            await bot.send_document(
+                chat_id=self.chat_id,
+                document=_as_file(self.report()),
+                filename=_report_name('cprofile'),
+                caption=f"📈 cProfile по {self.total} апдейтам"
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при отправке отчета cProfile: {e}")
+
+    def report(self):
+        """Возвращает отчет pstats по суммарному и собственному времени"""
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stream.write(f"cProfile по {self.total} апдейтам\n\n=== Сортировка по cumulative ===\n")
+        stats.sort_stats('cumulative').print_stats(TOP_LIMIT)
+        stream.write("\n=== Сортировка по tottime ===\n")
+        stats.sort_stats('tottime').print_stats(TOP_LIMIT)
+        return stream.getvalue()
+
+
+# ========== УТИЛИТЫ ==========
+def _as_file(text):
+    return io.BytesIO(text.encode('utf-8'))
+
+
+def _report_name(kind):
+    return f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+
+
+async def _check_admin(update: Update):
+    if update.effective_user.id != get_settings().admin_id:
+        await update.message.reply_text("❌ Эта команда только для администратора")
+        return False
+    return True
+
+
+# ========== АДМИН КОМАНДЫ ==========
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Запуск/остановка сэмплирующего профилировщика: /profile start [мс] | stop"""
+    global sampler
+
+    if not await _check_admin(update):
+        return
+
+    action = context.args[0].lower() if context.args else 'status'
+
+    if action == 'start':
+        if sampler is not None:
+            await update.message.reply_text("⚠️ Профилировщик уже запущен. Остановите: /profile stop")
+            return
+        try:
+            interval_ms = float(context.args[1]) if len(context.args) > 1 else 5.0
+        except ValueError:
+            await update.message.reply_text("❌ Интервал должен быть числом (мс)")
+            return
+        sampler = SamplingProfiler(interval=max(interval_ms, 0.5) / 1000)
+        sampler.start()
+        await update.message.reply_text(
+            f"▶️ Сэмплирующий профилировщик запущен (интервал {interval_ms:g} мс).\n"
+            f"Остановить и получить отчет: /profile stop"
+        )
+
+    elif action == 'stop':
+        if sampler is None:
+            await update.message.reply_text("⚠️ Профилировщик не запущен")
+            return
+        current, sampler = sampler, None
+        report = current.stop()
+        await update.message.reply_document(
+            document=_as_file(report),
+            filename=_report_name('sampling'),
+            caption=f"📈 Сэмплирующий профиль: {current.samples} сэмплов"
+        )
+
+    else:
+        state = "запущен" if sampler is not None else "остановлен"
+        await update.message.reply_text(
+            f"📈 Сэмплирующий профилировщик {state}.\n"
+            f"Использование: /profile start [интервал_мс] | /profile stop"
+        )
+
+
+async def cprofile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Профилирование следующих N апдейтов через cProfile: /cprofile N | stop"""
+    global update_capture
+
+    if not await _check_admin(update):
+        return
+
+    if context.args and context.args[0].lower() == 'stop':
+        if update_capture is None:
+            await update.message.reply_text("⚠️ Захват cProfile не запущен")
+            return
+        current, update_capture = update_capture, None
+        await update.message.reply_document(
+            document=_as_file(current.report()),
+            filename=_report_name('cprofile'),
+            caption=f"📈 cProfile по {current.total - current.remaining} апдейтам (остановлен)"
+        )
+        return
+
+    try:
+        updates = int(context.args[0]) if context.args else 100
+        if updates < 1:
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text("❌ Использование: /cprofile N (N - число апдейтов) | /cprofile stop")
+        return
+
+    update_capture = UpdateCapture(updates, update.effective_chat.id)
+    await update.message.reply_text(
+        f"▶️ cProfile включен для следующих {updates} апдейтов.\n"
+        f"Отчет придет файлом автоматически. Прервать: /cprofile stop"
+    )
+
+
+async def memsnap_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Снимки tracemalloc и их сравнение: /memsnap | /memsnap stop"""
+    global memory_baseline
+
+    if not await _check_admin(update):
+        return
+
+    if context.args and context.args[0].lower() == 'stop':
+        memory_baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        await update.message.reply_text("⏹ tracemalloc остановлен")
+        return
+
+    if not tracemalloc.is_tracing() or memory_baseline is None:
+        tracemalloc.start(25)
+        memory_baseline = tracemalloc.take_snapshot()
+        await update.message.reply_text(
+            "▶️ tracemalloc запущен, базовый снимок сохранен.\n"
+            "Повторите /memsnap, чтобы получить разницу. Остановить: /memsnap stop"
+        )
+        return
+
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+
+    lines = [
+        f"tracemalloc: сейчас {current / 1024:.1f} КБ, пик {peak / 1024:.1f} КБ",
+        "",
+        "=== Разница с предыдущим снимком (по строкам) ===",
+    ]
+    lines += [str(stat) for stat in snapshot.compare_to(memory_baseline, 'lineno')[:TOP_LIMIT]]
+    lines += ["", "=== Крупнейшие места выделения памяти ==="]
+    lines += [str(stat) for stat in snapshot.statistics('lineno')[:TOP_LIMIT]]
+    lines += ["", "=== Трассировки крупнейших выделений ==="]
+    for stat in snapshot.statistics('traceback')[:5]:
+        lines.append(f"{stat.count} блоков, {stat.size / 1024:.1f} КБ")
+        lines += [f"    {line}" for line in stat.traceback.format()]
+
+    memory_baseline = snapshot
+
+    await update.message.reply_document(
+        document=_as_file('\n'.join(lines)),
+        filename=_report_name('memsnap'),
+        caption="🧠 Разница снимков памяти"
+    )
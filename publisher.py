@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter
+
+from config import get_settings
+from database import get_review, update_review, update_review_status
+from jsonfiles import read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+# ID отзывов в очереди публикации: после сбоя процесса (SIGKILL, OOM) они
+# остались бы одобренными без поста, поэтому resume() при запуске ставит их снова
+QUEUE_FILE = 'publish_queue.json'
+
+
+def channel_review_text(review):
+    """Текст поста с отзывом для канала"""
+    stars = "⭐" * review['rating']
+    return (
+        f"📢 <b>НОВЫЙ ОТЗЫВ</b>\n\n"
+        f"⭐ <b>Оценка:</b> {stars}\n"
+        f"📝 <b>Отзыв:</b>\n{review['review_text']}\n\n"
+        f"<i>Спасибо за доверие! ❤️</i>"
+    )
+
+
+class ChannelPublisher:
+    """
+    Очередь публикации одобренных отзывов в канал с ограничением частоты.
+
+    Отзывы попадают сюда уже в статусе approved. После поста в отзыв
+    записывается published_message_id и автору уходит уведомление; если пост
+    не удался, отзыв возвращается на модерацию. Когда очередь пустеет,
+    администратор получает итог.
+
+    ID отзывов в очереди хранятся в файле path до поста или возврата на
+    модерацию. Если процесс упал, не дойдя до stop(), resume() при следующем
+    запуске снова ставит в очередь одобренные отзывы из файла, у которых
+    еще нет поста. Пост, вышедший прямо перед сбоем (до сохранения
+    published_message_id), при этом может выйти повторно.
+    """
+
+    def __init__(self, bot, posts_per_minute=None):
+        self.bot = bot
+        self.posts_per_minute = posts_per_minute or get_settings().channel_posts_per_minute
+        self.queue = asyncio.Queue()
+        self.published = 0
+        self.failed = 0
+        self._batch_published = 0
+        self._batch_failed = 0
+        self._next_post_at = 0.0
+        self._current = None
+        self._task = None
+        self.path = QUEUE_FILE
+        self._pending = set()
+
+    def __len__(self):
+        return self.queue.qsize()
+
+    def submit(self, reviews):
+        """Ставит отзывы в очередь публикации и запускает ее обработку"""
+        for review in reviews:
+            self.queue.put_nowait(review)
+            self._pending.add(review['id'])
+        self._save_pending()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def resume(self):
+        """При запуске ставит в очередь отзывы, не опубликованные до сбоя процесса"""
+        try:
+            review_ids = read_json(self.path)['reviews']
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Не удалось прочитать очередь публикации {self.path}: {e}")
+            return
+
+        reviews = []
+        for review_id in review_ids:
+            review = get_review(review_id)
+            if review is not None and review['status'] == 'approved' and not review['published_message_id']:
+                reviews.append(review)
+        self._pending = set()
+        if reviews:
+            logger.warning(f"Публикация прервана сбоем: {len(reviews)} одобренных отзывов снова в очереди")
+            self.submit(reviews)
+        else:
+            self._save_pending()
+
+    def _save_pending(self):
+        try:
+            write_json(self.path, {'reviews': sorted(self._pending)})
+        except OSError as e:
+            logger.error(f"Не удалось сохранить очередь публикации {self.path}: {e}")
+
+    def _done(self, review):
+        """Отзыв опубликован или возвращен на модерацию: из файла очереди он уходит"""
+        if review['id'] in self._pending:
+            self._pending.discard(review['id'])
+            self._save_pending()
+
+    async def _run(self):
+        while True:
+            try:
+                review = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                await self._report()
+                return
+            self._current = review
+            await self._publish(review)
+            self._current = None
+
+    async def _wait_turn(self):
+        interval = 60 / self.posts_per_minute
+        now = time.monotonic()
+        if self._next_post_at > now:
+            await asyncio.sleep(self._next_post_at - now)
+        self._next_post_at = max(now, self._next_post_at) + interval
+
+    async def _publish(self, review):
+        channel_id = get_settings().channel_id
+        while True:
+            await self._wait_turn()
+            try:
+                message = await self.bot.send_message(
+                    chat_id=channel_id,
+                    text=channel_review_text(review),
+                    parse_mode='HTML'
+                )
+                break
+            except RetryAfter as e:
+                logger.warning(f"Канал ограничил частоту постов, ждем {e.retry_after} с")
+                self._next_post_at = time.monotonic() + float(e.retry_after)
+            except Exception as e:
+                logger.error(f"Ошибка при публикации отзыва #{review['id']}: {e}")
+                update_review_status(review['id'], 'pending', expected_status='approved')
+                self._done(review)
+                self.failed += 1
+                self._batch_failed += 1
+                return
+
+        update_review(review['id'], published_message_id=message.message_id)
+        self._done(review)
+        self._current = None
+        self.published += 1
+        self._batch_published += 1
+
+        try:
+            await self.bot.send_message(
+                chat_id=review['user_id'],
+                text=(
+                    f"🎉 <b>Ваш отзыв опубликован в нашем канале!</b>\n\n"
+                    f"Спасибо за обратную связь! ❤️\n"
+                    f"Ваш отзыв помогает другим пользователям доверять нашему сервису."
+                ),
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось уведомить пользователя о публикации отзыва: {e}")
+
+    async def _report(self):
+        published, failed = self._batch_published, self._batch_failed
+        self._batch_published = self._batch_failed = 0
+        if not published and not failed:
+            return
+
+        text = f"📢 Публикация завершена: опубликовано {published}"
+        if failed:
+            text += f", ошибок {failed} (отзывы возвращены на модерацию: /moderate)"
+        try:
+            await self.bot.send_message(chat_id=get_settings().admin_id, text=text)
+        except Exception as e:
+            logger.warning(f"Не удалось отправить администратору итог публикации: {e}")
+
+    async def drain(self, timeout):
+        """Дает очереди опубликоваться, но не дольше timeout секунд (перед stop)"""
+        if self._task is None or self._task.done():
+            return
+        logger.info(f"Дорабатываем очередь публикации: {self.queue.qsize() + (self._current is not None)} отзывов")
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), max(timeout, 0))
+        except asyncio.TimeoutError:
+            logger.warning(f"Очередь публикации не опустела за {timeout:.0f} с")
+
+    async def stop(self):
+        """Останавливает публикацию; неопубликованные отзывы возвращаются на модерацию"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+        # _current сбрасывается сразу после поста, поэтому здесь только неопубликованные
+        unpublished = [self._current] if self._current is not None else []
+        self._current = None
+        while not self.queue.empty():
+            unpublished.append(self.queue.get_nowait())
+
+        returned = 0
+        for review in unpublished:
+            if update_review_status(review['id'], 'pending', expected_status='approved'):
+                returned += 1
+        if self._pending:
+            self._pending.clear()
+            self._save_pending()
+        if returned:
+            logger.warning(f"Публикация остановлена, {returned} отзывов возвращены на модерацию")
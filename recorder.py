@@ -0,0 +1,175 @@
+"""
+Запись входящих апдейтов для воспроизведения (benchmarks/replay.py).
+
+Синтетическая нагрузка (benchmarks/bench_flows.py) не повторяет настоящую
+смесь диалогов: брошенные /order, опечатки в цене, повторные нажатия кнопок.
+UpdateRecorder пишет каждый входящий апдейт строкой JSON в сжатый журнал
+RECORD_UPDATES_DIR/updates-<время>.jsonl.gz. Запись выключена, пока
+RECORD_UPDATES_DIR не задан.
+
+Перед записью апдейт обезличивается:
+- ID пользователей и чатов заменяются псевдонимами (HMAC с солью
+  RECORD_SALT): один и тот же пользователь получает один псевдоним, поэтому
+  его диалог воспроизводится целиком. Администратор записывается как 1,
+  операторы - как 2, 3, ... в порядке OPERATOR_IDS;
+- имена, username и телефоны заменяются, а в тексте сообщений маскируются
+  телефоны, email и @упоминания (с сохранением длины, чтобы не сдвинуть
+  entities).
+
+Файл закрывается и начинается новый, когда в него записано
+RECORD_MAX_MB мегабайт несжатого JSON; хранятся последние RECORD_KEEP_FILES
+файлов. Сжатый поток сбрасывается на диск каждые FLUSH_EVERY апдейтов.
+"""
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import time
+
+from telegram import Update
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Через сколько записанных апдейтов сжатый поток сбрасывается на диск
+FLUSH_EVERY = 64
+
+# Объекты с ID пользователя или чата, которые заменяются псевдонимом
+_IDENTITY_KEYS = {'from', 'chat', 'user', 'sender_chat', 'forward_from', 'forward_from_chat', 'via_bot'}
+_ID_KEYS = {'user_id', 'chat_id'}
+_NAME_KEYS = {'first_name', 'last_name'}
+_TEXT_KEYS = {'text', 'caption', 'query'}
+
+_PHONE_RE = re.compile(r'\+?\d[\d\s()-]{8,}\d')
+_EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+_MENTION_RE = re.compile(r'@\w{3,}')
+
+
+def _mask(match, keep=''):
+    return ''.join(char if char in keep else ('5' if char.isdigit() else 'x') for char in match.group())
+
+
+def mask_text(text):
+    """Маскирует телефоны, email и @упоминания в тексте, сохраняя длину"""
+    text = _EMAIL_RE.sub(lambda m: _mask(m, '@.'), text)
+    text = _MENTION_RE.sub(lambda m: _mask(m, '@'), text)
+    return _PHONE_RE.sub(lambda m: _mask(m, '+ ()-'), text)
+
+
+class Anonymizer:
+    """Заменяет личные данные в JSON апдейта (словарь меняется на месте)"""
+
+    def __init__(self, salt, staff=()):
+        self.salt = salt.encode('utf-8')
+        # Сотрудники получают постоянные маленькие ID, чтобы replay мог выдать им права
+        self.staff = {user_id: index for index, user_id in enumerate(staff, start=1) if user_id}
+
+    def _digest(self, value):
+        return hmac.new(self.salt, str(value).encode('utf-8'), hashlib.sha256).digest()
+
+    def pseudonym(self, value):
+        if value in self.staff:
+            return self.staff[value]
+        # Псевдонимы не пересекаются с ID сотрудников
+        alias = int.from_bytes(self._digest(abs(value))[:6], 'big') % 10 ** 12 + 10 ** 6
+        return -alias if value < 0 else alias
+
+    def apply(self, data, identity=False):
+        if isinstance(data, list):
+            for item in data:
+                self.apply(item)
+            return data
+        if not isinstance(data, dict):
+            return data
+
+        for key, value in data.items():
+            if isinstance(value, (dict, list)):
+                self.apply(value, identity=key in _IDENTITY_KEYS)
+            elif isinstance(value, int) and not isinstance(value, bool) and (
+                    key in _ID_KEYS or (identity and key == 'id')):
+                data[key] = self.pseudonym(value)
+            elif not isinstance(value, str):
+                continue
+            elif key in _NAME_KEYS:
+                data[key] = 'User'
+            elif key == 'username' and identity:
+                data[key] = f"user{self._digest(value.lower()).hex()[:10]}"
+            elif key == 'phone_number':
+                data[key] = _PHONE_RE.sub(lambda m: _mask(m, '+ ()-'), value)
+            elif key in _TEXT_KEYS:
+                data[key] = mask_text(value)
+        return data
+
+
+class UpdateRecorder:
+    """Обезличенный журнал входящих апдейтов с ротацией сжатых файлов"""
+
+    def __init__(self, directory=None, max_bytes=None, keep_files=None, salt=None, prefix='updates'):
+        settings = get_settings()
+        self.directory = settings.record_updates_dir if directory is None else directory
+        self.max_bytes = settings.record_max_mb * 1024 * 1024 if max_bytes is None else max_bytes
+        self.keep_files = settings.record_keep_files if keep_files is None else keep_files
+        if salt is None:
+            # Без RECORD_SALT соль выводится из токена: псевдонимы постоянны между перезапусками
+            salt = settings.record_salt or hashlib.sha256(f"record:{settings.bot_token}".encode('utf-8')).hexdigest()
+        staff = (settings.admin_id,) + tuple(operator_id for operator_id, _ in settings.operators)
+        self.anonymizer = Anonymizer(salt, staff)
+        self.prefix = prefix
+        self.recorded = 0
+        self._file = None
+        self._written = 0
+        self._unflushed = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def record(self, update):
+        """Дописывает апдейт в журнал (ничего не делает, если запись выключена)"""
+        if not self.enabled or not isinstance(update, Update):
+            return
+        try:
+            data = self.anonymizer.apply(update.to_dict())
+            line = json.dumps({'ts': round(time.time(), 3), 'update': data}, ensure_ascii=False) + '\n'
+            if self._file is None or self._written >= self.max_bytes:
+                self._rotate()
+            encoded = line.encode('utf-8')
+            self._file.write(encoded)
+        except Exception as e:
+            logger.error(f"Не удалось записать апдейт {update.update_id}: {e}")
+            return
+        self._written += len(encoded)
+        self.recorded += 1
+        self._unflushed += 1
+        if self._unflushed >= FLUSH_EVERY:
+            self._file.flush()
+            self._unflushed = 0
+
+    def _rotate(self):
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}"
+        path = os.path.join(self.directory, f"{self.prefix}-{stamp}.jsonl.gz")
+        self._file = gzip.open(path, 'wb')
+        self._written = 0
+        logger.info(f"Запись апдейтов в {path}")
+
+        # Имена с временем сортируются по порядку создания; файлы других воркеров не трогаем
+        own = re.compile(rf'{re.escape(self.prefix)}-\d{{8}}-\d{{6}}-\d{{3}}\.jsonl\.gz')
+        files = sorted(name for name in os.listdir(self.directory) if own.fullmatch(name))
+        for name in files[:max(len(files) - self.keep_files, 0)]:
+            os.unlink(os.path.join(self.directory, name))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._unflushed = 0
+
+    def stats(self):
+        return {'enabled': self.enabled, 'recorded': self.recorded}
@@ -0,0 +1,282 @@
+"""
+Компактные записи заявок и отзывов для хранения в памяти.
+
+Вместо dict с 16 строковыми ключами на каждую запись - объект со __slots__,
+время хранится целым числом секунд, а повторяющиеся строки (статус, город,
+username) интернированы - одна строка на все записи с этим значением.
+Для совместимости запись ведет себя как словарь:
+record['status'], record.get('city'), 'notes' in record, record[key] = value,
+а даты при чтении через [] возвращаются строками '%Y-%m-%d %H:%M:%S', как и
+раньше. На диск записи уходят через to_dict() в прежнем формате JSON.
+
+from_dict/to_dict вызываются для каждой записи при каждом чтении и записи
+файла, поэтому расписаны по полям вручную, без циклов и __setitem__.
+"""
+import sys
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Время хранится как секунды от 1970-01-01 по тем же "настенным" часам, что и
+# строка: без часового пояса, поэтому перевод туда и обратно не теряет данных
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch(value):
+    """'ГГГГ-ММ-ДД ЧЧ:ММ:СС' -> целое число секунд (None и нераспознанная строка - как есть)"""
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int((datetime.fromisoformat(value) - _EPOCH).total_seconds())
+    except (TypeError, ValueError):
+        return value
+
+
+def from_epoch(value):
+    """Целое число секунд -> 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' (None остается None)"""
+    if value is None:
+        return None
+    return time.strftime(TIME_FORMAT, time.gmtime(value))
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class Record(ABC):
+    """
+    Запись с фиксированным набором полей и интерфейсом словаря. Подкласс
+    задает поля и реализует from_dict/to_dict (см. описание модуля).
+    """
+
+    __slots__ = ('extra',)
+
+    # Задаются в подклассах: поля в порядке JSON файла, поля-даты и
+    # поля с часто повторяющимися значениями
+    FIELDS = ()
+    TIME_FIELDS = frozenset()
+    INTERNED_FIELDS = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELD_SET = frozenset(cls.FIELDS)
+
+    def __init__(self, **values):
+        self.extra = None
+        for field in self.FIELDS:
+            self[field] = values.pop(field, None)
+        for key, value in values.items():
+            self[key] = value
+
+    @classmethod
+    @abstractmethod
+    def from_dict(cls, data):
+        """Создает запись из словаря формата JSON файла"""
+
+    @abstractmethod
+    def to_dict(self):
+        """Словарь в формате JSON файла"""
+
+    def _load_extra(self, data):
+        # Поля, которых нет в FIELDS (например, добавленные вручную), не теряются
+        self.extra = None
+        if not data.keys() <= self.FIELD_SET:
+            self.extra = {key: value for key, value in data.items() if key not in self.FIELD_SET}
+        # Нераспознанная дата тоже сохраняется как есть, а в поле остается None:
+        # поля-даты сравниваются как числа
+        for field in self.TIME_FIELDS:
+            value = getattr(self, field)
+            if value is not None and type(value) is not int:
+                self._keep_raw_time(field, value)
+
+    def _keep_raw_time(self, field, value):
+        setattr(self, field, None)
+        if self.extra is None:
+            self.extra = {}
+        self.extra[field] = value
+
+    # ----- интерфейс словаря -----
+    def __getitem__(self, key):
+        if key in self.FIELD_SET:
+            value = getattr(self, key)
+            if key in self.TIME_FIELDS:
+                if value is not None:
+                    return from_epoch(value)
+                if self.extra is not None:
+                    return self.extra.get(key)
+            return value
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELD_SET:
+            if key in self.TIME_FIELDS:
+                value = to_epoch(value)
+                if self.extra is not None:
+                    self.extra.pop(key, None)
+                if value is not None and type(value) is not int:
+                    self._keep_raw_time(key, value)
+                    return
+            elif key in self.INTERNED_FIELDS:
+                value = _intern(value)
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.FIELD_SET or (self.extra is not None and key in self.extra)
+
+    def _extra_keys(self):
+        # Нераспознанные даты лежат в extra, но это поля из FIELDS
+        return [key for key in self.extra or () if key not in self.FIELD_SET]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self.FIELDS) + self._extra_keys()
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.FIELDS) + len(self._extra_keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Request(Record):
+    """Заявка на поиск товара (поля как в database.save_request)"""
+
+    FIELDS = ('id', 'user_id', 'username', 'product', 'known_price', 'city', 'contact', 'status',
+              'created_at', 'updated_at', 'found_price', 'economy', 'commission', 'notes',
+              'operator_id', 'assigned_at')
+    TIME_FIELDS = frozenset(('created_at', 'updated_at', 'assigned_at'))
+    INTERNED_FIELDS = frozenset(('username', 'city', 'status'))
+
+    __slots__ = FIELDS
+
+    @classmethod
+    def from_dict(cls, data):
+        get = data.get
+        record = cls.__new__(cls)
+        record.id = get('id')
+        record.user_id = get('user_id')
+        record.username = _intern(get('username'))
+        record.product = get('product')
+        record.known_price = get('known_price')
+        record.city = _intern(get('city'))
+        record.contact = get('contact')
+        record.status = _intern(get('status'))
+        record.created_at = to_epoch(get('created_at'))
+        record.updated_at = to_epoch(get('updated_at'))
+        record.found_price = get('found_price')
+        record.economy = get('economy')
+        record.commission = get('commission')
+        record.notes = get('notes')
+        record.operator_id = get('operator_id')
+        record.assigned_at = to_epoch(get('assigned_at'))
+        record._load_extra(data)
+        return record
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'user_id': self.user_id,
+            'username': self.username,
+            'product': self.product,
+            'known_price': self.known_price,
+            'city': self.city,
+            'contact': self.contact,
+            'status': self.status,
+            'created_at': from_epoch(self.created_at),
+            'updated_at': from_epoch(self.updated_at),
+            'found_price': self.found_price,
+            'economy': self.economy,
+            'commission': self.commission,
+            'notes': self.notes,
+            'operator_id': self.operator_id,
+            'assigned_at': from_epoch(self.assigned_at),
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class Review(Record):
+    """Отзыв (поля как в database.save_review)"""
+
+    FIELDS = ('id', 'user_id', 'username', 'review_text', 'rating', 'status', 'created_at',
+              'published_at', 'published_message_id', 'admin_notes', 'operator_id', 'assigned_at')
+    TIME_FIELDS = frozenset(('created_at', 'published_at', 'assigned_at'))
+    INTERNED_FIELDS = frozenset(('username', 'status'))
+
+    __slots__ = FIELDS
+
+    @classmethod
+    def from_dict(cls, data):
+        get = data.get
+        record = cls.__new__(cls)
+        record.id = get('id')
+        record.user_id = get('user_id')
+        record.username = _intern(get('username'))
+        record.review_text = get('review_text')
+        record.rating = get('rating')
+        record.status = _intern(get('status'))
+        record.created_at = to_epoch(get('created_at'))
+        record.published_at = to_epoch(get('published_at'))
+        record.published_message_id = get('published_message_id')
+        record.admin_notes = get('admin_notes')
+        record.operator_id = get('operator_id')
+        record.assigned_at = to_epoch(get('assigned_at'))
+        record._load_extra(data)
+        return record
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'user_id': self.user_id,
+            'username': self.username,
+            'review_text': self.review_text,
+            'rating': self.rating,
+            'status': self.status,
+            'created_at': from_epoch(self.created_at),
+            'published_at': from_epoch(self.published_at),
+            'published_message_id': self.published_message_id,
+            'admin_notes': self.admin_notes,
+            'operator_id': self.operator_id,
+            'assigned_at': from_epoch(self.assigned_at),
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+def time_of(record, field):
+    """Поле-дата записи или словаря в секундах; None, если даты нет или она не распознана"""
+    value = getattr(record, field) if isinstance(record, Record) else to_epoch(record.get(field))
+    return value if type(value) is int else None
+
+
+def as_dict(record):
+    """Словарь для JSON из записи или словаря"""
+    return record.to_dict() if isinstance(record, Record) else record
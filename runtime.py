@@ -0,0 +1,279 @@
+import asyncio
+import functools
+import logging
+import signal
+import time
+
+from telegram import Update
+from telegram.ext import Application, ConversationHandler
+# Внутреннее устройство PTB (сигнал остановки, _update_fetcher): версия закреплена в requirements.txt
+from telegram.ext._application import _STOP_SIGNAL
+
+import database
+import logsetup
+import profiling
+from config import get_settings, reload_settings
+from dedupe import UpdateDeduplicator
+from ingest import UpdateIngest
+from operators import OperatorPool
+from publisher import ChannelPublisher
+from recorder import UpdateRecorder
+from sessions import ConversationSessions
+from watchdog import LoopWatchdog
+
+logger = logging.getLogger(__name__)
+
+
+def serialization_key(update):
+    """Ключ, апдейты с которым обрабатываются строго по очереди (пользователь, иначе чат)"""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+
+class KeyedLocks:
+    """Набор asyncio.Lock по ключу; замок удаляется, когда его никто не ждет"""
+
+    def __init__(self):
+        self._locks = {}
+
+    def __len__(self):
+        return len(self._locks)
+
+    async def acquire(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._forget(key, entry)
+            raise
+
+    def release(self, key):
+        entry = self._locks[key]
+        entry[0].release()
+        self._forget(key, entry)
+
+    def _forget(self, key, entry):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+
+def _named_callback(callback):
+    """Обертка callback, отмечающая обработчик в контексте логирования"""
+    name = callback.__qualname__
+
+    @functools.wraps(callback)
+    async def named(update, context):
+        logsetup.set_handler(name)
+        return await callback(update, context)
+
+    named.labels_handler = True
+    return named
+
+
+def _label_handler(handler):
+    """Оборачивает callback обработчика (и вложенных в ConversationHandler)"""
+    if isinstance(handler, ConversationHandler):
+        nested = handler.entry_points + handler.fallbacks
+        for state_handlers in handler.states.values():
+            nested += state_handlers
+        for inner in nested:
+            _label_handler(inner)
+        return
+
+    callback = handler.callback
+    if asyncio.iscoroutinefunction(callback) and not getattr(callback, 'labels_handler', False):
+        handler.callback = _named_callback(callback)
+
+
+class BotApplication(Application):
+    """
+    Application с точками расширения вокруг обработки каждого апдейта.
+
+    При concurrent_updates апдейты разных пользователей обрабатываются
+    параллельно, а апдейты одного пользователя - в порядке поступления:
+    замок берется до первого await, поэтому очередь на него повторяет порядок,
+    в котором Application создает задачи обработки.
+
+    Апдейты из update_queue раздаются на обработку не по порядку поступления,
+    а по приоритету (ingest.UpdateIngest): сначала администратор и операторы,
+    затем пользователи посреди диалога, затем все остальные; при переполнении
+    очереди наименее срочные апдейты отбрасываются с ответом "попробуйте позже".
+
+    Остановка (SIGTERM через run_polling или воркер супервизора) дорабатывает
+    принятые апдейты, затем фоновые проверки и очередь публикации - все вместе
+    не дольше SHUTDOWN_TIMEOUT секунд; что не успело, прерывается, а
+    неопубликованные отзывы возвращаются на модерацию. SIGHUP перечитывает
+    .env без остановки (config.reload_settings).
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.update_locks = KeyedLocks()
+        self.publisher = ChannelPublisher(self.bot)
+        self.operators = OperatorPool(self.bot)
+        self.dedupe = UpdateDeduplicator()
+        self.recorder = UpdateRecorder()
+        self.sessions = ConversationSessions(self)
+        self.watchdog = LoopWatchdog(self)
+        self.ingest = UpdateIngest(self)
+        # Задачи обработки апдейтов, которые еще идут (для прерывания по дедлайну)
+        self._in_flight = set()
+        # После дедлайна остановки апдейты из очереди пропускаются
+        self._abandon = False
+        self.abandoned_updates = 0
+
+    def add_handler(self, handler, group=0):
+        _label_handler(handler)
+        super().add_handler(handler, group)
+
+    async def start(self) -> None:
+        # Окно уже обработанных апдейтов читается до приема новых
+        self.dedupe.open()
+        await super().start()
+        # Отзывы, одобренные до сбоя прошлого запуска, но так и не опубликованные
+        self.publisher.resume()
+        self.watchdog.start()
+        self.operators.start()
+        self.sessions.start()
+        self._abandon = False
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self.reload_settings)
+        except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+            # Нет SIGHUP (Windows) или цикл событий не в главном потоке
+            pass
+
+    async def stop(self) -> None:
+        loop = asyncio.get_running_loop()
+        timeout = get_settings().shutdown_timeout
+        deadline = loop.time() + timeout
+
+        def remaining():
+            return max(deadline - loop.time(), 0)
+
+        try:
+            loop.remove_signal_handler(signal.SIGHUP)
+        except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+            pass
+        await self.watchdog.stop()
+
+        # Сначала обработчики: они еще ставят посты в канал и шлют уведомления
+        logger.info(f"Остановка: дорабатываем принятые апдейты (до {timeout} с)")
+        stopping = loop.create_task(super().stop())
+        done, _ = await asyncio.wait({stopping}, timeout=remaining())
+        if not done:
+            self._abandon = True
+            logger.warning(f"Апдейты не доработаны за {timeout} с: прерываем {len(self._in_flight)}, "
+                           f"оставшиеся в очереди пропускаем")
+            for task in list(self._in_flight):
+                task.cancel()
+        await stopping
+
+        await self.operators.stop(remaining())
+        await self.sessions.stop(remaining())
+        await self.publisher.drain(remaining())
+        await self.publisher.stop()
+
+        self.dedupe.close()
+        self.recorder.close()
+        database.sync()
+        if self.abandoned_updates:
+            logger.warning(f"Пропущено апдейтов при остановке: {self.abandoned_updates}")
+        logger.info("Остановка завершена")
+
+    async def _update_fetcher(self) -> None:
+        # Вместо чтения update_queue по порядку - прием с приоритетами
+        try:
+            await self.ingest.run(_STOP_SIGNAL)
+        except Exception:
+            # Ошибка уже в логе. Без приема Application.stop() вечно ждал бы
+            # update_queue.join(), поэтому дальше апдейты читаются по порядку
+            logger.error("Прием с приоритетами остановлен: апдейты обрабатываются по порядку поступления")
+            await super()._update_fetcher()
+
+    def reload_settings(self):
+        """Перечитывает .env (SIGHUP) и применяет настройки к уже созданным службам"""
+        if reload_settings() is None:
+            return
+        settings = get_settings()
+        self.publisher.posts_per_minute = settings.channel_posts_per_minute
+        self.operators.configure(settings)
+        logging.getLogger().setLevel(settings.log_level)
+
+    async def process_update(self, update: object) -> None:
+        if self._abandon:
+            self.abandoned_updates += 1
+            return
+        # При последовательной обработке это задача чтения очереди: ее не прерываем
+        task = asyncio.current_task() if self.concurrent_updates else None
+        if task is not None:
+            self._in_flight.add(task)
+        # Контекст логирования: update_id, user_id и задержка с учетом ожидания замка
+        token = logsetup.begin_update(update)
+        # Записывается весь входящий поток, включая повторы, которые отбросит dedupe
+        self.recorder.record(update)
+        try:
+            await self._serialized_update(update)
+        except asyncio.CancelledError:
+            if not self._abandon:
+                raise
+            # Прервано дедлайном остановки: Application должен отметить апдейт
+            # обработанным (task_done), иначе stop() ждет очередь вечно
+            logger.warning(f"Апдейт {getattr(update, 'update_id', None)} прерван при остановке")
+        finally:
+            logsetup.end_update(token)
+            self._in_flight.discard(task)
+
+    async def _serialized_update(self, update):
+        # Замок берется и без concurrent_updates: под ним же sessions.expire
+        # завершает истекшие диалоги, не вклиниваясь в обработку апдейта
+        key = serialization_key(update)
+        if key is None:
+            return await self._process_update(update)
+
+        await self.update_locks.acquire(key)
+        try:
+            await self._process_update(update)
+        finally:
+            self.update_locks.release(key)
+
+    async def _process_update(self, update):
+        capture = profiling.update_capture
+        if capture is None:
+            await super().process_update(update)
+        else:
+            await capture.run(super().process_update(update), self.bot)
+        # Срок диалога отсчитывается от последнего апдейта пользователя
+        self.sessions.observe(update)
+
+
+class StartupProfile:
+    """Замеряет длительность фаз запуска для отчета --startup-report"""
+
+    def __init__(self, started_at):
+        self.started_at = started_at
+        self.phases = []
+        self._last = started_at
+
+    def mark(self, phase):
+        """Завершает текущую фазу под именем phase"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        total = self._last - self.started_at
+        lines = ["=" * 50, "⏱ ПРОФИЛЬ ЗАПУСКА", "=" * 50]
+        for phase, duration in self.phases:
+            share = duration * 100 / total if total else 0
+            lines.append(f"{duration * 1000:9.1f} мс  {share:5.1f}%  {phase}")
+        lines.append(f"{total * 1000:9.1f} мс  100.0%  всего")
+        lines.append("=" * 50)
+        return '\n'.join(lines)
@@ -0,0 +1,334 @@
+import heapq
+import html
+import logging
+import re
+from bisect import bisect_left
+from functools import lru_cache
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+
+import database
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Поля, по которым ищем
+SEARCH_FIELDS = {
+    'request': ('product', 'city', 'contact'),
+    'review': ('review_text',),
+}
+
+# Результатов на странице /search
+PAGE_SIZE = 10
+
+_WORD_RE = re.compile(r'[0-9a-zа-я]+')
+_QUERY_RE = re.compile(r'[0-9a-zа-я]+\*?')
+
+# Окончания для упрощенного стемминга русских слов, от длинных к коротким
+_ENDINGS = tuple(sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ую', 'юю', 'ом', 'ем',
+    'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ые', 'ие', 'ых', 'их', 'ия',
+    'ы', 'и', 'а', 'я', 'о', 'е', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True))
+
+# Минимальная длина основы после отсечения окончания
+_MIN_STEM = 3
+
+
+# ========== НОРМАЛИЗАЦИЯ ==========
+def stem(word):
+    """Отсекает падежное окончание русского слова (латиница и числа не меняются)"""
+    if not 'а' <= word[-1] <= 'я':
+        return word
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def tokenize(text):
+    """Разбивает текст на нормализованные термы: нижний регистр, ё -> е, основы слов"""
+    # Товары и города повторяются, поэтому разбор кешируется
+    text = str(text).lower().replace('ё', 'е')
+    return tuple(stem(token) for token in _WORD_RE.findall(text))
+
+
+def parse_query(text):
+    """
+    Разбирает запрос в список (терм, префиксный ли). Слово со звездочкой
+    на конце ищется по префиксу: "айфо*" найдет "айфон", "айфона" и т.д.
+    """
+    terms = []
+    for token in _QUERY_RE.findall(str(text).lower().replace('ё', 'е')):
+        if token.endswith('*'):
+            terms.append((token[:-1], True))
+        else:
+            terms.append((stem(token), False))
+    return terms
+
+
+# ========== ИНДЕКС ==========
+class SearchIndex:
+    """
+    Инвертированный индекс записей одного типа: терм -> множество ID.
+    Отсортированный словарь термов нужен для префиксных запросов.
+
+    Индексируется только рабочая база: записи, перенесенные в архив
+    (archive.py), поиск не находит.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.fields = SEARCH_FIELDS[kind]
+        self.version = None
+        self._postings = {}
+        self._terms = []
+        self._doc_terms = {}
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def rebuild(self):
+        """Строит индекс заново по всем записям хранилища"""
+        self.version = database.get_data_version(self.kind)
+        records = database.get_all_requests() if self.kind == 'request' else database.get_all_reviews()
+
+        postings = {}
+        doc_terms = {}
+        for record in records:
+            terms = self._record_terms(record)
+            doc_terms[record['id']] = terms
+            for term in terms:
+                ids = postings.get(term)
+                if ids is None:
+                    ids = postings[term] = set()
+                ids.add(record['id'])
+
+        self._postings = postings
+        self._doc_terms = doc_terms
+        self._terms = sorted(postings)
+        logger.info(f"Поисковый индекс ({self.kind}): {len(doc_terms)} записей, {len(postings)} термов")
+
+    def _record_terms(self, record):
+        terms = set()
+        for field in self.fields:
+            value = record.get(field)
+            if value:
+                terms.update(tokenize(str(value)))
+        return frozenset(terms)
+
+    def update(self, record, deleted=False):
+        """Обновляет индекс для одной записи после ее изменения этим процессом"""
+        if self.version != database.get_data_version(self.kind):
+            # Индекс еще не строился или данные перечитаны с диска -
+            # он будет обновлен при следующем поиске
+            return
+        self._set_terms(record['id'], None if deleted else self._record_terms(record))
+
+    def _set_terms(self, doc_id, new_terms):
+        """Заменяет термы записи doc_id (None - убрать запись из индекса)"""
+        old_terms = self._doc_terms.pop(doc_id, frozenset())
+        terms = new_terms or frozenset()
+
+        for term in old_terms - terms:
+            ids = self._postings[term]
+            ids.discard(doc_id)
+            if not ids:
+                del self._postings[term]
+                position = bisect_left(self._terms, term)
+                del self._terms[position]
+
+        for term in terms - old_terms:
+            ids = self._postings.get(term)
+            if ids is None:
+                ids = self._postings[term] = set()
+                position = bisect_left(self._terms, term)
+                self._terms.insert(position, term)
+            ids.add(doc_id)
+
+        if new_terms is not None:
+            self._doc_terms[doc_id] = new_terms
+
+    def _reindex_range(self, min_id, max_id):
+        """Индексирует заново записи с ID из диапазона (max_id None - до конца)"""
+        fresh = {record['id']: self._record_terms(record)
+                 for record in database.iter_range(self.kind, min_id, max_id)}
+        stale = [doc_id for doc_id in self._doc_terms
+                 if min_id <= doc_id and (max_id is None or doc_id <= max_id) and doc_id not in fresh]
+        for doc_id in stale:
+            self._set_terms(doc_id, None)
+        for doc_id, terms in fresh.items():
+            if self._doc_terms.get(doc_id) != terms:
+                self._set_terms(doc_id, terms)
+
+    def ensure_fresh(self):
+        """
+        Подтягивает изменения хранилища, сделанные другим процессом: заново
+        индексируются только перечитанные с диска части (обычно текущий
+        месяц). Целиком индекс строится при первом поиске и если журнал
+        перечитываний хранилища уже не покрывает версию индекса.
+        """
+        version = database.get_data_version(self.kind)
+        if version == self.version:
+            return
+        ranges = database.get_reloaded_ranges(self.kind, self.version)
+        if ranges is None:
+            self.rebuild()
+            return
+        for min_id, max_id in ranges:
+            self._reindex_range(min_id, max_id)
+        self.version = version
+
+    def _matches(self, term, prefix):
+        if not prefix:
+            return self._postings.get(term, set())
+
+        ids = set()
+        position = bisect_left(self._terms, term)
+        while position < len(self._terms) and self._terms[position].startswith(term):
+            ids |= self._postings[self._terms[position]]
+            position += 1
+        return ids
+
+    def search(self, query, offset=0, limit=PAGE_SIZE):
+        """
+        Ищет записи, содержащие все термы запроса.
+        Возвращает (всего найдено, ID страницы от новых к старым).
+        """
+        self.ensure_fresh()
+
+        terms = parse_query(query)
+        if not terms:
+            return 0, []
+
+        matches = sorted((self._matches(term, prefix) for term, prefix in terms), key=len)
+        result = matches[0]
+        for ids in matches[1:]:
+            if not result:
+                break
+            result = result & ids
+
+        return len(result), heapq.nlargest(offset + limit, result)[offset:]
+
+
+_indexes = {kind: SearchIndex(kind) for kind in SEARCH_FIELDS}
+
+
+def get_index(kind):
+    return _indexes[kind]
+
+
+def _on_change(kind, record, deleted):
+    _indexes[kind].update(record, deleted)
+
+
+database.add_change_listener(_on_change)
+
+
+# ========== КОМАНДА /search ==========
+def _format_request(request):
+    return (
+        f"#{request['id']} 📦 {html.escape(str(request['product']))}\n"
+        f"   🏙️ {html.escape(str(request['city']))} | 📞 {html.escape(str(request['contact']))} | "
+        f"{request['status']} | {request['created_at']}"
+    )
+
+
+def _format_review(review):
+    text = str(review['review_text'])
+    if len(text) > 100:
+        text = text[:100] + '...'
+    return (
+        f"#{review['id']} {'⭐' * review['rating']} | {review['status']} | {review['created_at']}\n"
+        f"   {html.escape(text)}"
+    )
+
+
+def _archive_note(kind):
+    """Напоминание, что архив в поиск не входит (см. SearchIndex)"""
+    closed = "закрытые заявки" if kind == 'request' else "отклоненные отзывы"
+    return (f"<i>Ищется только в рабочей базе: {closed} старше {get_settings().archive_after_days} дн. "
+            f"перенесены в архив и здесь не находятся.</i>")
+
+
+def _search_page(kind, query, page):
+    """Собирает текст и клавиатуру страницы результатов"""
+    index = _indexes[kind]
+    total, ids = index.search(query, offset=page * PAGE_SIZE, limit=PAGE_SIZE)
+
+    title = "заявки" if kind == 'request' else "отзывы"
+    if not total:
+        return (f"🔍 {title.capitalize()} по запросу «{html.escape(query)}» не найдены\n\n"
+                f"{_archive_note(kind)}"), None
+
+    if kind == 'request':
+        records, formatter = map(database.get_request, ids), _format_request
+    else:
+        records, formatter = map(database.get_review, ids), _format_review
+    lines = [formatter(record) for record in records if record is not None]
+
+    pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    text = (
+        f"🔍 <b>{title.capitalize()} по запросу «{html.escape(query)}»</b>\n"
+        f"Найдено: {total}, страница {page + 1} из {pages}\n\n" + '\n\n'.join(lines)
+        + f"\n\n{_archive_note(kind)}"
+    )
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"search_{kind}_{page - 1}"))
+    if page + 1 < pages:
+        buttons.append(InlineKeyboardButton("Вперед ▶️", callback_data=f"search_{kind}_{page + 1}"))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск по заявкам и отзывам (команда /search [отзывы] запрос)"""
+    if update.effective_user.id != get_settings().admin_id:
+        await update.message.reply_text("❌ Эта команда только для администратора")
+        return
+
+    args = list(context.args)
+    kind = 'request'
+    if args and args[0].lower() in ('отзывы', 'reviews'):
+        kind = 'review'
+        args = args[1:]
+    elif args and args[0].lower() in ('заявки', 'requests'):
+        args = args[1:]
+
+    query = ' '.join(args)
+    if not parse_query(query):
+        await update.message.reply_text(
+            "🔍 Использование:\n"
+            "/search iPhone 15 казань - поиск по заявкам (товар, город, контакт)\n"
+            "/search отзывы доставка - поиск по отзывам\n"
+            "Слово со * на конце ищется по началу: /search айфо*\n"
+            "Записи, перенесенные в архив, не ищутся"
+        )
+        return
+
+    # Запрос хранится у администратора, в callback_data только тип и страница
+    context.user_data['search_query'] = query
+    text, keyboard = _search_page(kind, query, 0)
+    await update.message.reply_html(text, reply_markup=keyboard)
+
+
+async def search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание результатов /search"""
+    query = update.callback_query
+    await query.answer()
+
+    if update.effective_user.id != get_settings().admin_id:
+        return
+
+    search_query = context.user_data.get('search_query')
+    if not search_query:
+        await query.edit_message_text("⚠️ Запрос устарел, повторите /search")
+        return
+
+    _, kind, page = query.data.split('_')
+    text, keyboard = _search_page(kind, search_query, int(page))
+    await query.edit_message_text(text, parse_mode='HTML', reply_markup=keyboard)
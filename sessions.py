@@ -0,0 +1,275 @@
+"""
+Истечение брошенных диалогов /order и /review.
+
+Пользователь, начавший диалог и ушедший, навсегда оставлял в памяти свое
+состояние в ConversationHandler и context.user_data. Встроенный
+conversation_timeout требует JobQueue (отдельная зависимость) и заводит по
+задаче на каждого пользователя, поэтому здесь сроки ведет одно колесо таймеров
+(TimingWheel): продление диалога после каждого апдейта - O(1), а раз в
+тик фоновая задача забирает из одной ячейки колеса истекшие диалоги.
+
+Истекший диалог завершается (ConversationHandler.END), данные пользователя
+удаляются из application.user_data, а пользователь получает сообщение, что
+сессия истекла. Таймаут - CONVERSATION_TIMEOUT_MINUTES (0 - выключено).
+Пустой user_data пользователя вне диалога (диалог закончен, данные
+очищены обработчиком) удаляется сразу, иначе он остался бы навсегда.
+Сколько диалогов и данных сейчас в памяти, показывает /stats: размеры
+user_data пересчитываются после апдейтов пользователя, а не обходом всех
+пользователей при каждом запросе.
+
+У ConversationHandler нет открытого API для ключа и состояния диалога,
+поэтому его внутреннее устройство используется только в _Conversation.
+"""
+import asyncio
+import logging
+import math
+import sys
+import time
+
+from telegram import ReplyKeyboardRemove, Update
+from telegram.ext import ConversationHandler
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Точность сроков, с: диалог истекает не позже чем через TICK после таймаута
+TICK = 10
+
+
+class TimingWheel:
+    """
+    Колесо таймеров: ячейка на каждый тик в пределах одного оборота.
+    Ключ со сроком дальше оборота лежит в своей ячейке и пропускается,
+    пока до срока не дойдет (проверка по номеру тика).
+    """
+
+    def __init__(self, tick, horizon, now=None):
+        self.tick = tick
+        self.slots = [set() for _ in range(max(math.ceil(horizon / tick), 1) + 1)]
+        self._deadlines = {}
+        now = time.monotonic() if now is None else now
+        self._current = int(now // tick)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, delay, now=None):
+        """Ставит (или переносит) срок ключа через delay секунд"""
+        now = time.monotonic() if now is None else now
+        tick = max(math.ceil((now + delay) / self.tick), self._current + 1)
+        old = self._deadlines.get(key)
+        if old == tick:
+            return
+        if old is not None:
+            self.slots[old % len(self.slots)].discard(key)
+        self._deadlines[key] = tick
+        self.slots[tick % len(self.slots)].add(key)
+
+    def cancel(self, key):
+        tick = self._deadlines.pop(key, None)
+        if tick is not None:
+            self.slots[tick % len(self.slots)].discard(key)
+
+    def advance(self, now=None):
+        """Прокручивает колесо до now; возвращает ключи с наступившим сроком"""
+        now = time.monotonic() if now is None else now
+        target = int(now // self.tick)
+        if target <= self._current:
+            return []
+
+        expired = []
+        # За один оборот просматривается каждая ячейка, дальше крутить незачем
+        steps = min(target - self._current, len(self.slots))
+        for tick in range(self._current + 1, self._current + steps + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            due = [key for key in bucket if self._deadlines[key] <= target]
+            for key in due:
+                bucket.discard(key)
+                del self._deadlines[key]
+            expired.extend(due)
+        self._current = target
+        return expired
+
+
+def _approx_size(value, depth=2):
+    """Примерный размер объекта с содержимым контейнеров (байты)"""
+    size = sys.getsizeof(value)
+    if depth and isinstance(value, dict):
+        size += sum(_approx_size(key, depth - 1) + _approx_size(item, depth - 1) for key, item in value.items())
+    elif depth and isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_approx_size(item, depth - 1) for item in value)
+    return size
+
+
+class _Conversation:
+    """
+    Доступ к диалогам ConversationHandler. Единственное место, где
+    используются внутренние _get_key, _conversations и _update_state
+    (python-telegram-bot 20.3, версия закреплена в requirements.txt;
+    tests/test_sessions.py проверяет их наличие).
+    """
+
+    __slots__ = ('handler',)
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def key(self, update):
+        """Ключ диалога апдейта (None, если апдейт не относится к диалогам)"""
+        try:
+            return self.handler._get_key(update)
+        except RuntimeError:
+            # Нет чата или пользователя, которых требует handler
+            return None
+
+    def is_active(self, key):
+        return key in self.handler._conversations
+
+    def end(self, key):
+        self.handler._update_state(ConversationHandler.END, key)
+
+    def __len__(self):
+        return len(self.handler._conversations)
+
+
+class ConversationSessions:
+    """Сроки диалогов ConversationHandler приложения"""
+
+    def __init__(self, application, timeout_minutes=None):
+        if timeout_minutes is None:
+            timeout_minutes = get_settings().conversation_timeout_minutes
+        self.application = application
+        self.timeout = timeout_minutes * 60
+        self.wheel = TimingWheel(TICK, self.timeout)
+        # имя -> (_Conversation, текст сообщения об истечении)
+        self._handlers = {}
+        self.expired = 0
+        # user_id -> примерный размер непустого user_data после последнего апдейта
+        self._data_sizes = {}
+        self.data_bytes = 0
+        self._task = None
+        self._stopping = asyncio.Event()
+
+    def track(self, name, handler, message):
+        """Следит за диалогами handler; message получает пользователь, чей диалог истек"""
+        self._handlers[name] = (_Conversation(handler), message)
+
+    def observe(self, update):
+        """
+        После обработки апдейта: продлевает или снимает срок диалогов
+        пользователя и пересчитывает размер его user_data.
+        """
+        if not isinstance(update, Update) or update.effective_chat is None or update.effective_user is None:
+            return
+        in_dialog = False
+        for name, (conversation, _) in self._handlers.items():
+            key = conversation.key(update)
+            if key is None:
+                continue
+            if conversation.is_active(key):
+                in_dialog = True
+                if self.timeout:
+                    self.wheel.schedule((name, key), self.timeout)
+            elif self.timeout:
+                self.wheel.cancel((name, key))
+        self._observe_data(update.effective_user.id, in_dialog)
+
+    def _observe_data(self, user_id, in_dialog):
+        data = self.application.user_data.get(user_id)
+        if data is not None and not data and not in_dialog:
+            self.application.drop_user_data(user_id)
+        self._set_data_size(user_id, _approx_size(data) if data else 0)
+
+    def _set_data_size(self, user_id, size):
+        self.data_bytes += size - self._data_sizes.pop(user_id, 0)
+        if size:
+            self._data_sizes[user_id] = size
+
+    def active(self, update):
+        """Идет ли у автора апдейта один из отслеживаемых диалогов"""
+        if not isinstance(update, Update) or update.effective_chat is None or update.effective_user is None:
+            return False
+        for conversation, _ in self._handlers.values():
+            key = conversation.key(update)
+            if key is not None and conversation.is_active(key):
+                return True
+        return False
+
+    # ----- фоновая задача -----
+    def start(self):
+        """Запускает проверку истекших диалогов (вызывать из event loop)"""
+        if self._task is None and self.timeout and self._handlers:
+            self._stopping.clear()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout=None):
+        """Останавливает проверку; начатый проход дорабатывает, но не дольше timeout секунд"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Завершение истекших диалогов прервано при остановке через {timeout:.0f} с")
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), TICK)
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.expire()
+            except Exception as e:
+                logger.error(f"Ошибка завершения истекших диалогов: {e}")
+
+    async def expire(self, now=None):
+        """Завершает диалоги с наступившим сроком; возвращает их число"""
+        count = 0
+        for name, key in self.wheel.advance(now):
+            conversation, message = self._handlers[name]
+            chat_id, user_id = key[0], key[-1]
+
+            # Под замком пользователя: его апдейт не обрабатывается параллельно
+            locks = self.application.update_locks
+            await locks.acquire(user_id)
+            try:
+                # Пока ждали замок, пользователь мог продолжить диалог
+                if (name, key) in self.wheel or not conversation.is_active(key):
+                    continue
+                conversation.end(key)
+                self.application.drop_user_data(user_id)
+                self._set_data_size(user_id, 0)
+            finally:
+                locks.release(user_id)
+
+            count += 1
+            self.expired += 1
+            try:
+                await self.application.bot.send_message(
+                    chat_id=chat_id, text=message, parse_mode='HTML', reply_markup=ReplyKeyboardRemove()
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось сообщить пользователю {user_id} об истечении диалога: {e}")
+        if count:
+            logger.info(f"Завершено истекших диалогов: {count}")
+        return count
+
+    # ----- память -----
+    def memory(self):
+        """Сколько диалогов и данных пользователей держится в памяти"""
+        return {
+            'conversations': {name: len(conversation) for name, (conversation, _) in self._handlers.items()},
+            'timers': len(self.wheel),
+            'user_data_users': len(self._data_sizes),
+            'user_data_bytes': self.data_bytes,
+            'expired': self.expired,
+        }
@@ -0,0 +1,432 @@
+"""
+Запуск бота несколькими процессами за приемом вебхуков.
+
+Супервизор принимает апдейты Telegram по HTTP и раздает их N процессам-воркерам
+по хешу user_id: все апдейты одного пользователя попадают в один процесс,
+поэтому диалоги ConversationHandler не разваливаются. Воркеры работают с общим
+хранилищем database.py, которое блокирует файлы между процессами.
+
+Если воркер умирает, его пользователи сразу переходят к живым воркерам
+(rendezvous-хеширование меняет владельца только для ключей умершего), а сам
+воркер перезапускается с нарастающей паузой и забирает свои ключи обратно.
+Переезжают только апдейты, но не состояние: диалоги ConversationHandler и
+окно повторов dedupe.py живут в памяти и файлах воркера. Поэтому при
+переходе пользователя к другому воркеру (и при возврате к перезапущенному)
+начатый /order или /review обрывается - следующий шаг бот примет за
+сообщение вне диалога, и пользователю придется начать заново, - а повторно
+доставленный апдейт, который успел обработать упавший воркер, может быть
+обработан еще раз.
+
+Без WEBHOOK_SECRET любой, кто достучится до порта, мог бы прислать
+поддельный апдейт от имени администратора, поэтому без секрета супервизор
+слушает только loopback (WEBHOOK_LISTEN=127.0.0.1) и принимает запросы
+только оттуда. Статус воркеров (GET) отдается с тем же секретом в
+X-Telegram-Bot-Api-Secret-Token или по запросу с loopback.
+
+SIGTERM: супервизор перестает принимать вебхуки, воркеры дорабатывают свои
+очереди (не дольше SHUTDOWN_TIMEOUT). SIGHUP: супервизор и воркеры
+перечитывают .env без остановки.
+
+Запуск:
+    python supervisor.py --workers 4 --port 8443
+Локальная проверка без Telegram (WEBHOOK_URL не задан - setWebhook не вызывается):
+    WEBHOOK_LISTEN=127.0.0.1 python supervisor.py
+    curl -X POST localhost:8443/webhook -d @update.json
+Для Heroku строку worker в Procfile можно заменить на:
+    web: python supervisor.py
+"""
+import argparse
+import asyncio
+import hashlib
+import ipaddress
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+from config import get_settings, reload_settings
+from logsetup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Максимальная пауза перед перезапуском упавшего воркера, с
+MAX_RESTART_DELAY = 30
+
+# Ограничения запроса к вебхуку: апдейт Telegram - несколько килобайт
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADERS = 100
+
+
+def is_loopback(host):
+    """Адрес (или имя localhost) только локальной машины"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+# ========== МАРШРУТИЗАЦИЯ ==========
+def routing_key(update_data):
+    """Ключ маршрутизации апдейта: ID пользователя, иначе ID чата, иначе update_id"""
+    for value in update_data.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get('from') or value.get('user')
+        if user:
+            return user['id']
+        chat = value.get('chat')
+        if chat:
+            return chat['id']
+    return update_data.get('update_id', 0)
+
+
+def _score(key, index):
+    digest = hashlib.blake2b(f"{key}:{index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+# ========== ВОРКЕРЫ ==========
+def run_worker(index, updates):
+    """Точка входа процесса-воркера: обрабатывает апдейты из очереди updates"""
+    # Ctrl+C обрабатывает супервизор и останавливает воркеров сам;
+    # SIGHUP до запуска приложения не должен убить процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    setup_logging(process=f'worker-{index}')
+    asyncio.run(_worker_loop(index, updates))
+
+
+async def _worker_loop(index, updates):
+    from telegram import Update
+
+    from bot import application_builder, build_application
+
+    settings = get_settings()
+    application = build_application(application_builder().updater(None))
+    # У каждого воркера свой журнал повторов: его пользователи приходят к нему же
+    if settings.dedupe_file:
+        application.dedupe.path = f"{settings.dedupe_file}.worker-{index}"
+    application.recorder.prefix = f"updates-worker-{index}"
+    # Очередь публикации тоже своя: после перезапуска воркер доводит до канала свои отзывы
+    application.publisher.path = f"{application.publisher.path}.worker-{index}"
+    loop = asyncio.get_running_loop()
+
+    async with application:
+        await application.start()
+        # SIGTERM напрямую (например, всей группе процессов): дорабатываем уже полученное и выходим
+        loop.add_signal_handler(signal.SIGTERM, updates.put, None)
+        logger.info(f"Воркер {index} запущен")
+
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            try:
+                await application.update_queue.put(Update.de_json(data, application.bot))
+            except Exception as e:
+                logger.error(f"Не удалось разобрать апдейт {data.get('update_id')}: {e}")
+
+        await application.stop()
+        logger.info(f"Воркер {index} остановлен")
+
+
+class WorkerSlot:
+    """Место в пуле: процесс воркера и его очередь апдейтов"""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.updates = None
+        self.alive = False
+        self.restarts = 0
+        self.restart_at = 0.0
+        self.routed = 0
+
+
+class WorkerPool:
+    """Пул процессов-воркеров с липкой маршрутизацией апдейтов"""
+
+    def __init__(self, workers, target=run_worker):
+        self._context = multiprocessing.get_context('spawn')
+        self._target = target
+        self.slots = [WorkerSlot(index) for index in range(workers)]
+
+    def start(self):
+        for slot in self.slots:
+            self._spawn(slot)
+
+    def _spawn(self, slot):
+        slot.updates = self._context.Queue()
+        slot.process = self._context.Process(
+            target=self._target, args=(slot.index, slot.updates), name=f'worker-{slot.index}', daemon=True
+        )
+        slot.process.start()
+        slot.alive = True
+        logger.info(f"Воркер {slot.index} запущен (pid {slot.process.pid})")
+
+    def route(self, key):
+        """Выбирает живой воркер для ключа (rendezvous-хеширование)"""
+        alive = [slot for slot in self.slots if slot.alive]
+        if not alive:
+            return None
+        return max(alive, key=lambda slot: _score(key, slot.index))
+
+    def submit(self, update_data):
+        """Отправляет апдейт воркеру; возвращает False, если живых воркеров нет"""
+        slot = self.route(routing_key(update_data))
+        if slot is None:
+            return False
+        slot.updates.put(update_data)
+        slot.routed += 1
+        return True
+
+    def check(self):
+        """Находит упавших воркеров, перераспределяет их очереди и перезапускает их"""
+        now = time.monotonic()
+        for slot in self.slots:
+            if slot.alive and not slot.process.is_alive():
+                slot.alive = False
+                delay = min(2 ** slot.restarts, MAX_RESTART_DELAY)
+                slot.restart_at = now + delay
+                slot.restarts += 1
+                logger.error(f"Воркер {slot.index} завершился с кодом {slot.process.exitcode}, "
+                             f"перезапуск через {delay} с; начатые диалоги его пользователей потеряны")
+                self._rebalance(slot)
+
+            elif not slot.alive and slot.process is not None and now >= slot.restart_at:
+                # Пользователи возвращаются к воркеру без диалогов, начатых у временного владельца
+                self._spawn(slot)
+
+    def _rebalance(self, slot):
+        """Переносит необработанные апдейты упавшего воркера на живых"""
+        moved = 0
+        while True:
+            try:
+                update_data = slot.updates.get_nowait()
+            except (queue.Empty, OSError, ValueError):
+                break
+            if update_data is not None and self.submit(update_data):
+                moved += 1
+        if moved:
+            logger.info(f"Перенесено {moved} апдейтов воркера {slot.index}")
+
+    def status(self):
+        return [
+            {'index': slot.index, 'alive': slot.alive, 'pid': slot.process.pid if slot.process else None,
+             'restarts': slot.restarts, 'routed': slot.routed}
+            for slot in self.slots
+        ]
+
+    def broadcast(self, signum):
+        """Отправляет сигнал живым воркерам"""
+        for slot in self.slots:
+            if slot.alive and slot.process is not None and slot.process.is_alive():
+                os.kill(slot.process.pid, signum)
+
+    def stop(self, timeout=10):
+        """Просит воркеров доработать очередь и завершиться"""
+        for slot in self.slots:
+            if slot.alive:
+                slot.updates.put(None)
+        deadline = time.monotonic() + timeout
+        for slot in self.slots:
+            if slot.process is None:
+                continue
+            slot.process.join(max(deadline - time.monotonic(), 0))
+            if slot.process.is_alive():
+                logger.warning(f"Воркер {slot.index} не остановился за {timeout} с, завершаем принудительно")
+                slot.process.terminate()
+            slot.alive = False
+
+
+# ========== ПРИЕМ ВЕБХУКОВ ==========
+class WebhookServer:
+    """Минимальный HTTP/1.1 сервер: POST на webhook_path передает апдейт в пул"""
+
+    def __init__(self, pool, path, secret=None):
+        self.pool = pool
+        self.path = path
+        self.secret = secret
+        self.received = 0
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        peer = peer[0] if peer else None
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    if len(headers) >= MAX_HEADERS:
+                        await self._respond(writer, '431 Request Header Fields Too Large', b'{}', close=True)
+                        return
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                # Заголовки проверяются до чтения тела: сервер слушает 0.0.0.0,
+                # и тело чужого или слишком большого запроса не читаем
+                rejected = self.check(method, path, headers, peer)
+                if rejected is not None:
+                    # Тело не прочитано - соединение дальше не годится
+                    await self._respond(writer, *rejected, close=True)
+                    break
+
+                body = await reader.readexactly(_content_length(headers))
+                status, payload = self.dispatch(method, path, headers, body)
+                close = headers.get('connection', '').lower() == 'close'
+                await self._respond(writer, status, payload, close=close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            # ValueError - строка запроса или заголовка длиннее лимита StreamReader
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload, close=False):
+        head = f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+        if close:
+            head += "Connection: close\r\n"
+        writer.write((head + "\r\n").encode('latin-1') + payload)
+        await writer.drain()
+
+    def check(self, method, path, headers, peer=None):
+        """
+        Отказ по строке запроса и заголовкам (до чтения тела): (статус, ответ)
+        или None. Апдейт принимается только с секретом, а без секрета - только
+        с loopback; статус воркеров - с секретом или с loopback.
+        """
+        if path.split('?', 1)[0] != self.path:
+            return '404 Not Found', b'{}'
+        if method not in ('GET', 'POST'):
+            return '405 Method Not Allowed', b'{}'
+        if self.secret:
+            allowed = headers.get('x-telegram-bot-api-secret-token') == self.secret
+            if not allowed and method == 'GET':
+                allowed = peer is not None and is_loopback(peer)
+        else:
+            allowed = peer is not None and is_loopback(peer)
+        if not allowed:
+            return '403 Forbidden', b'{}'
+        try:
+            length = _content_length(headers)
+        except ValueError:
+            return '400 Bad Request', b'{}'
+        if length > MAX_BODY_BYTES:
+            return '413 Payload Too Large', b'{}'
+        return None
+
+    def dispatch(self, method, path, headers, body):
+        """Ответ на запрос, прошедший check()"""
+        if method == 'GET':
+            return '200 OK', json.dumps({'received': self.received, 'workers': self.pool.status()}).encode()
+
+        try:
+            update_data = json.loads(body)
+        except ValueError:
+            return '400 Bad Request', b'{}'
+        if not isinstance(update_data, dict):
+            return '400 Bad Request', b'{}'
+
+        if not self.pool.submit(update_data):
+            # Telegram повторит доставку позже
+            return '503 Service Unavailable', b'{}'
+        self.received += 1
+        return '200 OK', b'{}'
+
+
+def _content_length(headers):
+    """Content-Length запроса; ValueError, если заголовок не целое неотрицательное число"""
+    value = headers.get('content-length', '') or '0'
+    if not (value.isascii() and value.isdigit()):
+        raise ValueError(f"bad Content-Length: {value!r}")
+    return int(value)
+
+
+async def _set_webhook(settings):
+    from telegram import Bot, Update
+
+    url = settings.webhook_url.rstrip('/') + settings.webhook_path
+    async with Bot(settings.bot_token, **settings.bot_api_urls()) as bot:
+        await bot.set_webhook(url=url, secret_token=settings.webhook_secret, allowed_updates=Update.ALL_TYPES)
+    logger.info(f"Вебхук установлен: {url}")
+
+
+async def serve(workers, host, port):
+    settings = get_settings()
+    pool = WorkerPool(workers)
+    pool.start()
+
+    server = WebhookServer(pool, settings.webhook_path, settings.webhook_secret)
+    http_server = await asyncio.start_server(server.handle, host, port)
+    logger.info(f"Прием вебхуков на {host}:{port}{settings.webhook_path}, воркеров: {workers}")
+
+    if settings.webhook_url:
+        await _set_webhook(settings)
+    else:
+        logger.warning("WEBHOOK_URL не задан: setWebhook не вызывается, апдейты принимаются только локально")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    def reload():
+        reload_settings()
+        pool.broadcast(signal.SIGHUP)
+
+    loop.add_signal_handler(signal.SIGHUP, reload)
+
+    while not stop_event.is_set():
+        pool.check()
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=1)
+        except asyncio.TimeoutError:
+            pass
+
+    logger.info("Остановка: прекращаем прием апдейтов и ждем воркеров")
+    http_server.close()
+    await http_server.wait_closed()
+    # Воркеры сами ограничены SHUTDOWN_TIMEOUT, супервизор ждет их с запасом
+    await loop.run_in_executor(None, pool.stop, get_settings().shutdown_timeout + 5)
+
+
+def main(argv=None):
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Многопроцессный запуск бота за вебхуком")
+    parser.add_argument('--workers', type=int, default=settings.workers, help="число процессов-воркеров")
+    parser.add_argument('--host', default=settings.webhook_listen)
+    parser.add_argument('--port', type=int, default=settings.webhook_port)
+    args = parser.parse_args(argv)
+
+    setup_logging(process='supervisor')
+
+    if not settings.bot_token or not settings.admin_id:
+        logger.error("❌ КРИТИЧЕСКАЯ ОШИБКА: BOT_TOKEN или ADMIN_ID не установлены!")
+        return
+    if not settings.webhook_secret and not is_loopback(args.host):
+        logger.error(f"❌ WEBHOOK_SECRET не задан: прием вебхуков на {args.host} открыл бы бот для поддельных "
+                     f"апдейтов. Задайте WEBHOOK_SECRET или слушайте 127.0.0.1 (WEBHOOK_LISTEN)")
+        return
+
+    asyncio.run(serve(args.workers, args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
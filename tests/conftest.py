@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# Настройки должны быть заданы до импорта config
+os.environ.setdefault('BOT_TOKEN', '123456:TEST')
+os.environ.setdefault('ADMIN_ID', '1')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Пустой рабочий каталог: файлы базы, dedupe.log и пр. создаются в нем"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def db(workdir, monkeypatch):
+    """Модуль database с пустыми файлами заявок и отзывов в рабочем каталоге"""
+    import database
+
+    monkeypatch.setattr(database, 'DB_FILE', str(workdir / 'requests.json'))
+    monkeypatch.setattr(database, 'REVIEWS_FILE', str(workdir / 'reviews.json'))
+    database.init_databases()
+    return database
@@ -0,0 +1,89 @@
+import json
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+import archive
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def store(db):
+    # 12 заявок за три месяца, закрыты нечетные дни: по две на месяц
+    requests = []
+    for month in ('2024-01', '2024-02', '2024-03'):
+        for day in range(1, 5):
+            requests.append({
+                'id': len(requests) + 1, 'user_id': 2000 + day, 'username': 'u', 'product': 'Пылесос',
+                'known_price': 20000, 'city': 'Москва', 'contact': '+79990000000',
+                'status': 'completed' if day % 2 else 'new', 'created_at': f'{month}-{day:02d} 10:00:00',
+                'updated_at': f'{month}-{day:02d} 10:00:00', 'found_price': 15000, 'economy': 5000,
+                'commission': 2000, 'notes': '', 'operator_id': None, 'assigned_at': None,
+            })
+    Path(db.DB_FILE).write_text(json.dumps({'requests': requests}), encoding='utf-8')
+    archive._segment_records.cache_clear()
+    return db
+
+
+def _crash_archiving(db, remove):
+    """Архивация, прерванная после записи сегментов; remove(ids) - что успело удалиться"""
+    with pytest.raises(Crash):
+        with archive.archive_transaction('request') as index:
+            candidates = [record for record in db.get_all_requests() if record['status'] == 'completed']
+            archive.add_segments('request', candidates, index)
+            remove([record['id'] for record in candidates])
+            raise Crash()
+
+
+def _archived_ids():
+    ids = [record['id'] for record in archive.iter_archived('request')]
+    assert len(ids) == len(set(ids))
+    return set(ids)
+
+
+def test_crash_before_removal_rolls_segments_back(store):
+    _crash_archiving(store, lambda ids: None)
+
+    with archive.archive_transaction('request'):
+        pass
+    assert archive.load_index()['segments'] == []
+    assert _archived_ids() == set()
+    assert store.get_statistics()['total_requests'] == 12
+
+
+def test_crash_mid_removal_finishes_removal(store):
+    # Удалилась только январская часть, февраль и март остались в рабочей базе
+    _crash_archiving(store, lambda ids: store.remove_records('request', [i for i in ids if i <= 4]))
+
+    with archive.archive_transaction('request'):
+        pass
+    assert all(segment['committed'] for segment in archive.load_index()['segments'])
+    assert _archived_ids() == {1, 3, 5, 7, 9, 11}
+    assert store.get_present_ids('request', range(1, 13)) == {2, 4, 6, 8, 10, 12}
+
+    stats = store.get_statistics()
+    assert stats['total_requests'] == 12
+    assert stats['archived_requests'] == 6
+    assert stats['completed_requests'] == 6
+
+
+def test_records_without_created_at_stay_in_working_store(store):
+    from export import iter_export
+
+    store.update_request(1, created_at=None)
+    store.update_request(3, created_at='15.01.2024 10:00:00')
+
+    # Остальные закрытые заявки уходят в архив, пропущенные не ломают проход
+    result = archive.archive_closed('request', now=datetime(2100, 1, 1))
+    assert sum(result.values()) == 4
+    assert set(result) == {'requests-2024-02-0001.jsonl.gz', 'requests-2024-03-0001.jsonl.gz'}
+    assert store.get_present_ids('request', [1, 3]) == {1, 3}
+
+    # Без периода выгружается все, с периодом - только записи с датой
+    assert {record['id'] for record in iter_export('request')} == set(range(1, 13))
+    dated = {record['id'] for record in iter_export('request', date_from='2024-01-01')}
+    assert dated == set(range(1, 13)) - {1, 3}
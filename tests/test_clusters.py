@@ -0,0 +1,35 @@
+import json
+from pathlib import Path
+
+from clusters import ProductIndex
+from records import Request
+
+
+def test_index_applies_other_process_changes_without_rebuild(db, monkeypatch):
+    requests = []
+    for month, product in (('2024-01', 'Пылесос Dyson V15'), ('2024-02', 'Телевизор Samsung QE55Q70B')):
+        for day in range(1, 4):
+            requests.append({
+                'id': len(requests) + 1, 'user_id': 2000 + day, 'username': 'u', 'product': product,
+                'known_price': 20000, 'city': 'Москва', 'contact': '+79990000000', 'status': 'new',
+                'created_at': f'{month}-{day:02d} 10:00:00', 'updated_at': f'{month}-{day:02d} 10:00:00',
+                'found_price': None, 'economy': None, 'commission': None, 'notes': '',
+                'operator_id': None, 'assigned_at': None,
+            })
+    Path(db.DB_FILE).write_text(json.dumps({'requests': requests}), encoding='utf-8')
+    index = ProductIndex()
+    assert index.clusters() == [[1, 2, 3], [4, 5, 6]]
+
+    # Другой процесс закрывает заявку и добавляет похожую в текущей части
+    other = db._Table(lambda: db.DB_FILE, 'request', 'requests', Request)
+    with other.transaction():
+        other.set_status(other.find(5), 'completed')
+        other.append(dict(other.find(6).items(), id=other.next_id(), product='телевизор SAMSUNG qe55q70b'))
+        other.save()
+
+    def rebuild():
+        raise AssertionError('индекс перестроен целиком')
+
+    monkeypatch.setattr(index, 'rebuild', rebuild)
+    assert index.clusters() == [[1, 2, 3], [4, 6, 7]]
+    assert index.similar('Телевизор Samsung QE55Q70B', exclude=7) == [6, 4]
@@ -0,0 +1,128 @@
+import json
+from dataclasses import replace
+from pathlib import Path
+
+from records import Review
+
+
+def _legacy_reviews(path, months, per_month=3):
+    reviews = []
+    for month in months:
+        for day in range(1, per_month + 1):
+            reviews.append({
+                'id': len(reviews) + 1, 'user_id': 1000 + len(reviews) % 4, 'username': 'u',
+                'review_text': 'Отлично', 'rating': 5, 'status': 'approved',
+                'created_at': f'{month}-{day:02d} 10:00:00', 'published_at': f'{month}-{day:02d} 11:00:00',
+                'published_message_id': None, 'admin_notes': '',
+            })
+    path.write_text(json.dumps({'reviews': reviews}), encoding='utf-8')
+    return reviews
+
+
+def test_feed_version_sees_other_process_in_constant_time(db, monkeypatch):
+    _legacy_reviews(Path(db.REVIEWS_FILE), ['2024-01', '2024-02', '2024-03'])
+    db._reviews.load()
+    version = db.get_approved_feed_version()
+    assert [review['id'] for review in db.get_approved_reviews(limit=2)] == [9, 8]
+
+    # Без изменений проверка версии не перебирает загруженные части
+    stamps = []
+    real_stamp = db.file_stamp
+    monkeypatch.setattr(db, 'file_stamp', lambda name: stamps.append(name) or real_stamp(name))
+    assert db.get_approved_feed_version() == version
+    assert len(stamps) <= 2
+    monkeypatch.setattr(db, 'file_stamp', real_stamp)
+
+    # Собственное изменение приходит в ленту через обработчик изменений
+    review_id = db.save_review(1005, 'u', 'Хорошо', 4)
+    assert db.get_approved_feed_version() == version
+    db.update_review_status(review_id, 'approved')
+    version = db.get_approved_feed_version()
+    assert db.get_approved_reviews(limit=1)[0]['id'] == review_id
+
+    # Другой процесс (своя таблица над теми же файлами) снимает отзыв из закрытой части
+    other = db._Table(lambda: db.REVIEWS_FILE, 'review', 'reviews', Review)
+    with other.transaction():
+        other.set_status(other.find(8), 'rejected')
+        other.save()
+    assert db.get_approved_feed_version() != version
+    assert 8 not in [review['id'] for review in db.get_approved_reviews(limit=50)]
+
+
+def _legacy_requests(path, months, per_month=4):
+    requests = []
+    for month in months:
+        for day in range(1, per_month + 1):
+            request_id = len(requests) + 1
+            requests.append({
+                'id': request_id, 'user_id': (2100 if month == '2024-02' else 2000) + day, 'username': 'u', 'product': 'Пылесос',
+                'known_price': 20000, 'city': 'Москва', 'contact': '+79990000000',
+                'status': 'completed' if day % 2 else 'new', 'created_at': f'{month}-{day:02d} 10:00:00',
+                'updated_at': f'{month}-{day:02d} 10:00:00', 'found_price': 15000, 'economy': 5000,
+                'commission': 2000, 'notes': '', 'operator_id': None, 'assigned_at': None,
+            })
+    path.write_text(json.dumps({'requests': requests}), encoding='utf-8')
+    return requests
+
+
+def test_user_requests_and_statistics_use_manifest(db, monkeypatch):
+    _legacy_requests(Path(db.DB_FILE), ['2024-01', '2024-02', '2024-03'])
+    # Манифест прежнего формата: без пользователей и сводок закрытых частей
+    db._requests.head()
+    manifest = json.loads(Path(db.DB_FILE).read_text(encoding='utf-8'))
+    for entry in manifest['partitions']:
+        entry.pop('users', None)
+        entry.pop('summary', None)
+    Path(db.DB_FILE).write_text(json.dumps(manifest), encoding='utf-8')
+    db._requests._filename = None
+    db._requests._set_partitions([])
+
+    # При открытии сводки дописываются, а прочитанные ради них части не остаются в памяти
+    db._requests.head()
+    sealed = db._requests._partitions[:-1]
+    assert all(partition.users and partition.summary for partition in sealed)
+    assert all(partition.data is None for partition in sealed)
+
+    reads = []
+    real_read = db.read_json
+    monkeypatch.setattr(db, 'read_json', lambda name: reads.append(Path(name).name) or real_read(name))
+
+    # Пользователя 2001 нет в феврале: эта часть не читается
+    assert [request['id'] for request in db.get_user_requests(2001)] == [1, 9]
+    assert reads == ['requests-2024-01.json']
+    assert db._requests._partitions[1].data is None
+
+    reads.clear()
+    stats = db.get_statistics()
+    assert reads == []
+    assert db._requests._partitions[1].data is None
+    assert stats['total_requests'] == 12
+    assert stats['new_requests'] == 6 and stats['completed_requests'] == 6
+    assert stats['total_economy'] == 60000 and stats['total_commission'] == 24000
+
+    # Изменение записи закрытой части обновляет ее сводку в манифесте
+    settings = db.get_settings()
+    monkeypatch.setattr(db, 'get_settings', lambda: replace(settings, commission_rate=0.25))
+    db.update_request(2, status='completed', found_price=10000)
+    assert db.get_request(2)['commission'] == 2500
+    stats = db.get_statistics()
+    assert stats['new_requests'] == 5 and stats['completed_requests'] == 7
+    assert stats['total_economy'] == 65000 and stats['total_commission'] == 24500
+    manifest = json.loads(Path(db.DB_FILE).read_text(encoding='utf-8'))
+    assert manifest['partitions'][0]['summary']['statuses'] == {'completed': 3, 'new': 1}
+
+
+def test_legacy_split_with_malformed_dates(db):
+    requests = _legacy_requests(Path(db.DB_FILE), ['2024-01', '2024-02', '2024-03'])
+    requests[0]['created_at'] = '01.01.2024 10:00:00'
+    requests[5]['created_at'] = '15.02.2024 10:00:00'
+    requests[9]['created_at'] = None
+    Path(db.DB_FILE).write_text(json.dumps({'requests': requests}), encoding='utf-8')
+
+    db._requests.head()
+    partitions = db._requests._partitions
+    # Записи с нераспознанной датой остались в части соседних записей
+    assert [partition.month for partition in partitions] == ['2024-01', '2024-02', '2024-03']
+    assert [(partition.min_id, partition.max_id) for partition in partitions] == [(1, 4), (5, 8), (9, None)]
+    assert [request['id'] for request in db.get_all_requests()] == list(range(1, 13))
+    assert db.get_request(6)['created_at'] == '15.02.2024 10:00:00'
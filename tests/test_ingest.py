@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+from telegram import Update
+from telegram.ext import Application
+
+from benchmarks.bench_flows import UpdateFactory
+from benchmarks.stubbot import build_stub_application
+from ingest import BUSY_TEXT, NEW, PriorityQueue, UpdateIngest
+
+
+def test_ptb_internals_used_by_runtime_exist():
+    # Версия PTB закреплена в requirements.txt; при обновлении тест покажет, что сломалось
+    from telegram.ext._application import _STOP_SIGNAL
+
+    assert _STOP_SIGNAL is not None
+    assert callable(Application._update_fetcher)
+
+
+@pytest.fixture
+def app(db, workdir):
+    from bot import build_application
+
+    application, request = build_stub_application(build_application, latency=0.01, record=True,
+                                                  concurrent_updates=2)
+    application.ingest = UpdateIngest(application, capacity=3)
+    return application, request
+
+
+def _replies(request):
+    """chat_id -> тексты отправленных сообщений"""
+    replies = {}
+    for endpoint, params in request.calls:
+        if endpoint == 'sendMessage':
+            replies.setdefault(params['chat_id'], []).append(params['text'])
+    return replies
+
+
+async def _run(application, updates):
+    factory = UpdateFactory()
+    async with application:
+        await application.start()
+        for user_id, text in updates:
+            await application.update_queue.put(Update.de_json(factory.message(user_id, text), application.bot))
+        # Прием разбирает update_queue, обработка начинается, остальное ждет в очереди
+        for _ in range(5):
+            await asyncio.sleep(0)
+        queued = len(application.ingest.queue)
+        # Не зависает: каждый апдейт либо обработан, либо отброшен с task_done()
+        await asyncio.wait_for(application.stop(), 10)
+        await asyncio.wait_for(application.update_queue.join(), 1)
+    return queued
+
+
+def test_stop_with_queued_updates_processes_or_sheds_each(app):
+    application, request = app
+    users = range(1001, 1011)
+    # Двое в обработке (concurrent_updates=2), третий ждет в очереди к моменту stop()
+    assert asyncio.run(_run(application, [(user_id, '/start') for user_id in users])) == 1
+
+    ingest = application.ingest
+    # Апдейты приняты до того, как обработка успела начаться: в очереди место для трех
+    assert ingest.stats()['received'] == {'admin': 0, 'conversation': 0, 'new': 10}
+    assert ingest.shed[NEW] == 7
+    assert len(ingest.queue) == 0
+
+    replies = _replies(request)
+    assert sorted(replies) == list(users)
+    busy = [user_id for user_id, texts in replies.items() if texts == [BUSY_TEXT]]
+    assert len(busy) == 7
+
+
+def test_classification_error_falls_back_to_new(app, monkeypatch):
+    application, request = app
+
+    def broken(update):
+        raise RuntimeError('нет ключа диалога')
+
+    monkeypatch.setattr(application.sessions, 'active', broken)
+    asyncio.run(_run(application, [(1001, '/start')]))
+
+    ingest = application.ingest
+    assert ingest.classify_errors == 1
+    assert ingest.received[NEW] == 1
+    assert BUSY_TEXT not in _replies(request)[1001]
+
+
+def test_intake_failure_is_raised_and_updates_still_processed(app, monkeypatch):
+    application, request = app
+    queue = application.ingest.queue
+    real_put = queue.put
+    calls = []
+
+    def put(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError('сбой очереди')
+        real_put(*args)
+
+    monkeypatch.setattr(queue, 'put', put)
+    asyncio.run(_run(application, [(1001, '/start'), (1002, '/start'), (1003, '/start')]))
+
+    # Апдейт, на котором упал прием, потерян; остальные обработаны по порядку
+    assert sorted(_replies(request)) == [1001, 1003]
+
+
+def test_user_next_update_waits_for_previous_to_finish():
+    queue = PriorityQueue(10)
+    for name, key in (('a1', 1001), ('a2', 1001), ('b1', 1002), ('c1', None)):
+        queue.put(name, key, NEW)
+
+    # Пока апдейт 1001 в обработке, место получают другие пользователи
+    assert queue.pop()[:2] == ('a1', 1001)
+    assert queue.pop()[:2] == ('b1', 1002)
+    assert queue.pop()[:2] == ('c1', None)
+    assert queue.pop() is None
+    assert len(queue) == 1
+
+    queue.done(1001)
+    assert queue.pop()[:2] == ('a2', 1001)
+    assert len(queue) == 0
+
+
+def test_burst_of_one_user_does_not_take_all_slots(app):
+    application, request = app
+    application.ingest = UpdateIngest(application, capacity=10)
+    asyncio.run(_run(application, [(1001, '/start'), (1001, '/start'), (1001, '/start'), (1002, '/start')]))
+
+    # Второй апдейт 1001 ждет конца первого, а второе место сразу занимает 1002
+    chats = [params['chat_id'] for endpoint, params in request.calls if endpoint == 'sendMessage']
+    assert chats.count(1001) == 3
+    assert chats.index(1002) < [position for position, chat in enumerate(chats) if chat == 1001][1]
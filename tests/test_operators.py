@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+import operators
+from operators import OperatorPool
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def _request(user_id):
+    return {'user_id': user_id, 'username': f'user{user_id}', 'product': 'Пылесос', 'known_price': 15000,
+            'city': 'Москва', 'contact': '+79990000000'}
+
+
+@pytest.fixture
+def pool(db):
+    pool = OperatorPool(FakeBot(), operators=((10, 1), (20, 1)), strategy='least_loaded', timeout_minutes=30)
+    pool.register_alert('request', lambda record, details: (f"#{record['id']}", None))
+    yield pool
+    asyncio.run(pool.stop())
+
+
+def test_pick_uses_index_instead_of_scanning(db, pool, monkeypatch):
+    first = db.save_request(_request(1001), operator_id=pool.pick(1001))
+
+    scans = []
+    real_open_records = operators.get_open_records
+    monkeypatch.setattr(operators, 'get_open_records', lambda kind: scans.append(kind) or real_open_records(kind))
+
+    # Загрузка и закрепление за клиентом обновляются обработчиком изменений, без перебора записей
+    owner = db.get_request(first)['operator_id']
+    other = 20 if owner == 10 else 10
+    assert pool.pick(1002) == other
+    db.save_request(_request(1002), operator_id=other)
+    assert pool.pick(1001) == owner
+    assert pool.pick(1003) in (10, 20)
+    assert scans == []
+
+    # Закрытая заявка больше не нагружает оператора
+    db.update_request(first, status='completed')
+    assert pool._index().load == {other: 1}
+    assert scans == []
+
+
+def test_new_record_is_written_once(db, pool, monkeypatch):
+    writes = []
+    real_write = db.write_json
+    monkeypatch.setattr(db, 'write_json', lambda name, data: writes.append(name) or real_write(name, data))
+
+    request_id = db.save_request(_request(1001), operator_id=pool.pick(1001))
+    assert asyncio.run(pool.dispatch('request', request_id)) in (10, 20)
+    assert len(writes) == 1
+    assert pool.bot.sent == [(db.get_request(request_id)['operator_id'], f"#{request_id}")]
+
+
+def test_archived_dict_and_record_are_read_alike(db, pool):
+    record = db.get_request(db.save_request(_request(1001), operator_id=10))
+    archived = record.to_dict()
+
+    for item in (record, archived):
+        assert pool.can_handle(10, item)
+        assert not pool.can_handle(20, item)
+        pool.record_handled(10, item)
+    assert pool.handled[10] == 2
+
+
+def test_overdue_record_moves_to_other_operator(db, pool):
+    request_id = db.save_request(_request(1001), operator_id=10)
+    db.update_request(request_id, assigned_at='2020-01-01 00:00:00')
+
+    assert asyncio.run(pool.reassign_overdue()) == 1
+    assert db.get_request(request_id)['operator_id'] == 20
+    assert pool._index().load == {20: 1}
@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from publisher import ChannelPublisher
+
+
+class FakeBot:
+    """Бот, который либо публикует, либо зависает на посте (процесс упадет, не дождавшись)"""
+
+    def __init__(self, hang=False):
+        self.hang = hang
+        self.posts = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.hang:
+            await asyncio.Event().wait()
+        self.posts.append(chat_id)
+        return SimpleNamespace(message_id=100 + len(self.posts))
+
+
+def test_resume_republishes_reviews_left_approved_by_crash(db):
+    ids = [db.save_review(1000 + n, 'u', f'Отзыв {n}', 5) for n in range(3)]
+    db.update_reviews_status(ids, 'approved', expected_status='pending')
+
+    async def crashed_run():
+        # Процесс падает посреди публикации: stop() не вызывается
+        publisher = ChannelPublisher(FakeBot(hang=True), posts_per_minute=6000)
+        publisher.submit([db.get_review(review_id) for review_id in ids])
+        await asyncio.sleep(0)
+
+    asyncio.run(crashed_run())
+    # До следующего запуска один отзыв успели вернуть на модерацию вручную
+    db.update_review_status(ids[2], 'pending', expected_status='approved')
+
+    async def next_run():
+        bot = FakeBot()
+        publisher = ChannelPublisher(bot, posts_per_minute=6000)
+        publisher.resume()
+        await publisher.drain(5)
+        await publisher.stop()
+        return bot, publisher
+
+    bot, publisher = asyncio.run(next_run())
+    assert publisher.published == 2
+    assert [db.get_review(review_id)['published_message_id'] is not None for review_id in ids] == [True, True, False]
+    assert db.get_review(ids[2])['status'] == 'pending'
+
+    # Очередь пуста: третий запуск ничего не публикует повторно
+    again = ChannelPublisher(FakeBot(), posts_per_minute=6000)
+    again.resume()
+    assert len(again) == 0
@@ -0,0 +1,73 @@
+import pytest
+
+from records import Record, Request, Review
+
+BASELINE_REQUEST = {
+    'id': 7,
+    'user_id': 1001,
+    'username': 'user1001',
+    'product': 'Пылесос',
+    'known_price': 15000,
+    'city': 'Москва',
+    'contact': '+79990000000',
+    'status': 'new',
+    'created_at': '2024-01-15 10:30:00',
+    'updated_at': None,
+    'found_price': None,
+    'economy': None,
+    'commission': None,
+    'notes': '',
+}
+
+
+def test_legacy_record_keeps_unknown_fields():
+    # Запись из базы до появления operator_id/assigned_at, с полем, добавленным вручную
+    data = dict(BASELINE_REQUEST, product_url='https://example.com/item')
+    record = Request.from_dict(data)
+
+    assert record['product_url'] == 'https://example.com/item'
+    assert 'product_url' in record
+    saved = record.to_dict()
+    assert saved['product_url'] == 'https://example.com/item'
+    assert saved['operator_id'] is None
+    assert Request.from_dict(saved).to_dict() == saved
+
+
+def test_bad_date_is_kept_as_is():
+    data = dict(BASELINE_REQUEST, created_at='15.01.2024', updated_at='2024-01-16 08:00:00')
+    record = Request.from_dict(data)
+
+    # В поле даты - None (поля-даты сравниваются как числа), строка не теряется
+    assert record.created_at is None
+    assert record['created_at'] == '15.01.2024'
+    assert record['updated_at'] == '2024-01-16 08:00:00'
+    assert len(record) == len(Request.FIELDS)
+    assert record.to_dict()['created_at'] == '15.01.2024'
+
+    record['created_at'] = '2024-01-15 10:30:00'
+    assert record['created_at'] == '2024-01-15 10:30:00'
+    assert record.to_dict()['created_at'] == '2024-01-15 10:30:00'
+
+
+def test_review_round_trip():
+    data = {
+        'id': 3, 'user_id': 1002, 'username': None, 'review_text': 'Отлично', 'rating': 5,
+        'status': 'approved', 'created_at': '2024-02-01 12:00:00', 'published_at': 'вчера',
+        'published_message_id': 42, 'admin_notes': '',
+    }
+    record = Review.from_dict(data)
+    assert record.published_at is None
+    assert record.to_dict() == dict(data, operator_id=None, assigned_at=None)
+
+
+def test_record_subclass_must_implement_conversion():
+    class Incomplete(Record):
+        FIELDS = ('id',)
+        __slots__ = FIELDS
+
+        @classmethod
+        def from_dict(cls, data):
+            return cls(**data)
+
+    with pytest.raises(TypeError):
+        Incomplete(id=1)
@@ -0,0 +1,45 @@
+import json
+from pathlib import Path
+
+from records import Request
+from search import SearchIndex
+
+
+def _requests(path):
+    requests = []
+    for month, product in (('2024-01', 'Пылесос Dyson'), ('2024-02', 'Телевизор Samsung')):
+        for day in range(1, 4):
+            requests.append({
+                'id': len(requests) + 1, 'user_id': 2000 + day, 'username': 'u', 'product': product,
+                'known_price': 20000, 'city': 'Москва', 'contact': '+79990000000', 'status': 'new',
+                'created_at': f'{month}-{day:02d} 10:00:00', 'updated_at': f'{month}-{day:02d} 10:00:00',
+                'found_price': None, 'economy': None, 'commission': None, 'notes': '',
+                'operator_id': None, 'assigned_at': None,
+            })
+    path.write_text(json.dumps({'requests': requests}), encoding='utf-8')
+
+
+def test_index_applies_other_process_changes_without_rebuild(db, monkeypatch):
+    _requests(Path(db.DB_FILE))
+    index = SearchIndex('request')
+    assert index.search('пылесос') == (3, [3, 2, 1])
+
+    # Другой процесс (своя таблица над теми же файлами) меняет и добавляет заявки текущей части
+    other = db._Table(lambda: db.DB_FILE, 'request', 'requests', Request)
+    with other.transaction():
+        other.find(5)['product'] = 'Утюг Philips'
+        request = dict(other.find(6).items(), id=other.next_id(), product='Утюг Tefal')
+        other.append(request)
+        other.save()
+
+    def rebuild():
+        raise AssertionError('индекс перестроен целиком')
+
+    monkeypatch.setattr(index, 'rebuild', rebuild)
+    assert index.search('утюг') == (2, [7, 5])
+    assert index.search('телевизор') == (2, [6, 4])
+    assert index.search('пылесос') == (3, [3, 2, 1])
+    assert len(index) == 7
+
+    # Журнал перечитываний не покрывает версию индекса - нужна полная перестройка
+    assert db.get_reloaded_ranges('request', index.version - db.RELOAD_LOG_SIZE - 1) is None
@@ -0,0 +1,153 @@
+import asyncio
+import time
+
+import pytest
+from telegram import Update
+from telegram.ext import ConversationHandler
+
+from benchmarks.bench_flows import UpdateFactory
+from benchmarks.stubbot import build_stub_application
+from sessions import TICK, TimingWheel
+
+
+def test_ptb_internals_used_by_sessions_exist():
+    # Версия PTB закреплена в requirements.txt; при обновлении тест покажет, что сломалось
+    handler = ConversationHandler(entry_points=[], states={}, fallbacks=[])
+    assert callable(handler._get_key)
+    assert callable(handler._update_state)
+    assert isinstance(handler._conversations, dict)
+
+
+def test_timing_wheel_schedule_cancel_advance():
+    wheel = TimingWheel(10, 60, now=0)
+    wheel.schedule('a', 15, now=0)
+    wheel.schedule('b', 30, now=0)
+    wheel.schedule('c', 30, now=0)
+    wheel.cancel('c')
+    assert len(wheel) == 2 and 'c' not in wheel
+
+    assert wheel.advance(now=10) == []
+    assert wheel.advance(now=20) == ['a']
+    # Перенос срока: ключ уходит из старой ячейки
+    wheel.schedule('b', 30, now=20)
+    assert wheel.advance(now=30) == []
+    assert wheel.advance(now=50) == ['b']
+    assert len(wheel) == 0
+
+    # Срок дальше оборота колеса наступает только после своего тика
+    wheel.schedule('far', 200, now=50)
+    assert wheel.advance(now=130) == []
+    assert 'far' in wheel
+    # Прыжок на много оборотов вперед просматривает каждую ячейку один раз
+    assert wheel.advance(now=10_000) == ['far']
+
+
+@pytest.fixture
+def app(db, workdir):
+    from bot import build_application
+
+    application, request = build_stub_application(build_application, record=True, concurrent_updates=4)
+    return application, request
+
+
+def _send(application, factory, data):
+    return application.process_update(Update.de_json(data, application.bot))
+
+
+def test_expire_ends_dialog_and_drops_user_data(app):
+    application, request = app
+    factory = UpdateFactory()
+    sessions = application.sessions
+
+    async def main():
+        async with application:
+            await _send(application, factory, factory.message(1001, '/order'))
+            await _send(application, factory, factory.message(1001, 'Пылесос Dyson V15'))
+            assert sessions.memory()['conversations']['order'] == 1
+            assert sessions.memory()['user_data_users'] == 1
+
+            assert await sessions.expire(time.monotonic() + sessions.timeout + 2 * TICK) == 1
+            memory = sessions.memory()
+            assert memory['conversations']['order'] == 0
+            assert memory['user_data_users'] == 0 and memory['user_data_bytes'] == 0
+            assert 1001 not in application.user_data
+            assert request.calls[-1][1]['chat_id'] == 1001
+
+    asyncio.run(main())
+
+
+def test_expire_skips_dialog_continued_while_waiting_for_lock(app):
+    application, request = app
+    factory = UpdateFactory()
+    sessions = application.sessions
+
+    async def main():
+        async with application:
+            await _send(application, factory, factory.message(1001, '/order'))
+            sent = len(request.calls)
+
+            # Апдейт пользователя обрабатывается: expire ждет его замок
+            await application.update_locks.acquire(1001)
+            expire = asyncio.create_task(sessions.expire(time.monotonic() + sessions.timeout + 2 * TICK))
+            await asyncio.sleep(0)
+            assert not expire.done()
+            # За это время пользователь продолжил диалог, срок продлен
+            sessions.wheel.schedule(('order', (1001, 1001)), sessions.timeout)
+            application.update_locks.release(1001)
+
+            assert await expire == 0
+            assert sessions.memory()['conversations']['order'] == 1
+            assert len(request.calls) == sent
+
+    asyncio.run(main())
+
+
+def test_finished_dialog_leaves_no_user_data(app):
+    application, _ = app
+    factory = UpdateFactory()
+    sessions = application.sessions
+
+    async def main():
+        async with application:
+            await _send(application, factory, factory.message(1001, '/order'))
+            await _send(application, factory, factory.message(1001, 'Пылесос Dyson V15'))
+            await _send(application, factory, factory.message(1001, '/cancel'))
+            assert 1001 not in application.user_data
+            assert sessions.memory()['user_data_users'] == 0
+            assert len(sessions.wheel) == 0
+
+    asyncio.run(main())
+
+
+def test_expire_waits_for_update_in_sequential_mode(db, workdir):
+    from bot import build_application
+
+    application, _ = build_stub_application(build_application, concurrent_updates=False)
+    factory = UpdateFactory()
+    sessions = application.sessions
+    real_process = application._process_update
+    proceed = asyncio.Event()
+
+    async def slow_process(update):
+        await proceed.wait()
+        await real_process(update)
+
+    async def main():
+        async with application:
+            await _send(application, factory, factory.message(1001, '/order'))
+
+            # Апдейт пользователя обрабатывается и без concurrent_updates под его замком
+            application._process_update = slow_process
+            update = asyncio.create_task(_send(application, factory, factory.message(1001, 'Пылесос Dyson V15')))
+            await asyncio.sleep(0)
+            expire = asyncio.create_task(sessions.expire(time.monotonic() + sessions.timeout + 2 * TICK))
+            await asyncio.sleep(0)
+            assert not expire.done()
+
+            proceed.set()
+            await update
+            # Диалог продолжен - срок продлен, expire его не завершает
+            assert await expire == 0
+            assert sessions.memory()['conversations']['order'] == 1
+
+    asyncio.run(main())
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+from dataclasses import replace
+
+import httpx
+
+from benchmarks.fake_telegram import ApiServer, FakeTelegram
+from config import get_settings
+from supervisor import MAX_BODY_BYTES, WebhookServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakePool:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, update_data):
+        self.submitted.append(update_data)
+        return True
+
+    def status(self):
+        return []
+
+
+async def _request(port, head, body=b''):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    writer.close()
+    return status_line.decode().split(' ', 2)[1]
+
+
+def _post(length, secret='s3cret'):
+    return (f"POST /webhook HTTP/1.1\r\nHost: x\r\nX-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+            f"Content-Length: {length}\r\n\r\n")
+
+
+def test_webhook_rejects_bad_requests_before_reading_body():
+    async def main():
+        pool = FakePool()
+        server = await asyncio.start_server(WebhookServer(pool, '/webhook', 's3cret').handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            body = json.dumps({'update_id': 1, 'message': {'from': {'id': 5}}}).encode()
+            assert await _request(port, _post(len(body)), body) == '200'
+            # Тело не отправлено: ответ приходит по одним заголовкам
+            assert await _request(port, _post(10 ** 9)) == '413'
+            assert await _request(port, _post(MAX_BODY_BYTES + 1)) == '413'
+            assert await _request(port, _post('abc')) == '400'
+            assert await _request(port, _post('-1')) == '400'
+            assert await _request(port, _post(10 ** 9, secret='wrong')) == '403'
+            assert await _request(port, _post(2), b'[]') == '400'
+            assert await _request(port, "GET /other HTTP/1.1\r\n\r\n") == '404'
+            assert pool.submitted == [json.loads(body)]
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(main())
+
+
+def test_webhook_requires_secret_or_loopback():
+    server = WebhookServer(FakePool(), '/webhook', 's3cret')
+    secret = {'x-telegram-bot-api-secret-token': 's3cret'}
+    assert server.check('POST', '/webhook', {}, '127.0.0.1')[0].startswith('403')
+    assert server.check('POST', '/webhook', secret, '203.0.113.5') is None
+    # Статус воркеров: с секретом или с loopback
+    assert server.check('GET', '/webhook', {}, '203.0.113.5')[0].startswith('403')
+    assert server.check('GET', '/webhook', secret, '203.0.113.5') is None
+    assert server.check('GET', '/webhook', {}, '::1') is None
+
+    # Без секрета - только с loopback
+    open_server = WebhookServer(FakePool(), '/webhook')
+    assert open_server.check('POST', '/webhook', {}, '203.0.113.5')[0].startswith('403')
+    assert open_server.check('GET', '/webhook', {}, '203.0.113.5')[0].startswith('403')
+    assert open_server.check('POST', '/webhook', {}, '127.0.0.1') is None
+
+
+def test_supervisor_refuses_public_listen_without_secret(monkeypatch):
+    import supervisor
+
+    started = []
+    monkeypatch.setattr(supervisor, 'serve', lambda *args: started.append(args))
+    monkeypatch.setattr(supervisor, 'setup_logging', lambda **kwargs: None)
+    monkeypatch.setattr(supervisor, 'get_settings', lambda: replace(get_settings(), webhook_secret=None))
+    monkeypatch.setattr(supervisor.asyncio, 'run', lambda coroutine: None)
+
+    supervisor.main(['--host', '0.0.0.0'])
+    assert started == []
+    supervisor.main(['--host', '127.0.0.1'])
+    assert len(started) == 1
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_supervisor_with_two_workers(workdir):
+    async def main():
+        telegram = FakeTelegram()
+        api = await asyncio.start_server(ApiServer(telegram).handle, '127.0.0.1', 0)
+        api_port = api.sockets[0].getsockname()[1]
+        port = _free_port()
+
+        env = dict(os.environ, BOT_API_URL=f'http://127.0.0.1:{api_port}', WEBHOOK_URL=f'http://127.0.0.1:{port}',
+                   WEBHOOK_SECRET='s3cret', HEALTH_PORT='0', SHUTDOWN_TIMEOUT='5', PYTHONPATH=ROOT)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, 'supervisor.py'), '--workers', '2', '--host', '127.0.0.1',
+            '--port', str(port), env=env, cwd=str(workdir))
+        try:
+            for _ in range(300):
+                if telegram.webhook:
+                    break
+                await asyncio.sleep(0.1)
+            assert telegram.webhook == f'http://127.0.0.1:{port}/webhook'
+
+            users = range(1001, 1021)
+            for user_id in users:
+                telegram.inboxes[user_id] = asyncio.Queue()
+                await telegram.push(telegram.message_update(user_id, '/start'))
+            # Каждый пользователь получает ответ от своего воркера
+            for user_id in users:
+                reply = await asyncio.wait_for(telegram.inboxes[user_id].get(), 120)
+                assert reply['chat']['id'] == user_id
+
+            async with httpx.AsyncClient() as client:
+                status = (await client.get(f'http://127.0.0.1:{port}/webhook')).json()
+            assert status['received'] == len(users)
+            workers = status['workers']
+            assert [worker['alive'] for worker in workers] == [True, True]
+            assert all(worker['routed'] > 0 for worker in workers)
+            assert sum(worker['routed'] for worker in workers) == len(users)
+
+            process.send_signal(signal.SIGTERM)
+            assert await asyncio.wait_for(process.wait(), 60) == 0
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            api.close()
+            await telegram.close()
+
+    asyncio.run(main())
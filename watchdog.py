@@ -0,0 +1,279 @@
+"""
+Сторож event loop и проверка здоровья бота.
+
+Хранилище database.py читает и пишет файлы прямо в обработчиках, поэтому
+event loop может надолго встать, и никто этого не заметит. LoopWatchdog
+каждые TICK_INTERVAL секунд замеряет, насколько позже срока проснулась его
+задача (задержка loop), а фоновый поток следит, чтобы задача вообще
+просыпалась: если loop не отвечает дольше STALL_THRESHOLD_MS, поток пишет в
+лог стек потока loop и обработчик, который его занял.
+
+HealthServer отвечает на GET /healthz из отдельного потока, то есть и тогда,
+когда loop завис: задержка loop и ее перцентили, время записи хранилища,
+длина очередей, время последнего успешного getUpdates. Код ответа 503, если
+loop завис или опрос Telegram давно не проходил - по нему оркестратор может
+перезапустить бота. Включается настройкой HEALTH_PORT:
+    curl localhost:8080/healthz
+"""
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import database
+import inline
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Как часто просыпается задача-сторож, с
+TICK_INTERVAL = 0.1
+
+# Сколько последних замеров задержки входит в перцентили (5 минут)
+LAG_WINDOW = 3000
+
+# Через сколько секунд без успешного getUpdates опрос считается зависшим
+# (long polling Telegram возвращает ответ не реже чем раз в 10 секунд)
+POLLING_STALE_AFTER = 90
+
+
+def percentiles(values):
+    """p50/p90/p99/max замеров в секундах, в миллисекундах; None, если замеров нет"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    count = len(ordered)
+
+    def at(share):
+        return round(ordered[min(count - 1, int(count * share))] * 1000, 1)
+
+    return {'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99), 'max': round(ordered[-1] * 1000, 1)}
+
+
+def _running_handler(frame):
+    """
+    Обработчик, выполняющийся в стеке frame, и ID его апдейта. Ищется
+    ближайший к вершине стека вызов BaseHandler.handle_update: функция,
+    вызванная из него, - callback обработчика.
+    """
+    callee = None
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == 'handle_update' and 'telegram' in code.co_filename:
+            update = frame.f_locals.get('update')
+            name = f"{callee.co_name} ({callee.co_filename}:{callee.co_firstlineno})" if callee else None
+            return name, getattr(update, 'update_id', None)
+        callee = code
+        frame = frame.f_back
+    return None, None
+
+
+class _PollingProbe:
+    """Обертка над ботом для Updater: отмечает время каждого успешного getUpdates"""
+
+    def __init__(self, bot, watchdog):
+        self._bot = bot
+        self._watchdog = watchdog
+
+    def __getattr__(self, name):
+        return getattr(self._bot, name)
+
+    async def get_updates(self, *args, **kwargs):
+        updates = await self._bot.get_updates(*args, **kwargs)
+        self._watchdog.last_get_updates = time.time()
+        return updates
+
+
+class LoopWatchdog:
+    """Замеряет задержку event loop и ловит его зависания"""
+
+    def __init__(self, application, stall_threshold=None):
+        self.application = application
+        if stall_threshold is None:
+            stall_threshold = get_settings().stall_threshold_ms / 1000
+        self.stall_threshold = stall_threshold
+        self.lags = deque(maxlen=LAG_WINDOW)
+        self.stalls = 0
+        self.last_stall = None
+        # time.time() последнего успешного getUpdates
+        self.last_get_updates = None
+        self._started_at = None
+        self._last_tick = None
+        self._loop_thread_id = None
+        # Что поток-наблюдатель увидел в стеке во время текущего зависания
+        self._stall_capture = None
+        self._task = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        if application.updater is not None:
+            application.updater.bot = _PollingProbe(application.updater.bot, self)
+
+    def start(self):
+        """Запускает задачу-сторож и поток-наблюдатель (вызывать из event loop)"""
+        if self._task is not None:
+            return
+        self._started_at = time.time()
+        self._last_tick = time.monotonic()
+        self._loop_thread_id = threading.get_ident()
+        self._stop_event.clear()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop_event.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._thread.join()
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + TICK_INTERVAL
+            await asyncio.sleep(TICK_INTERVAL)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self._last_tick = now
+            self.lags.append(lag)
+
+            capture, self._stall_capture = self._stall_capture, None
+            if lag >= self.stall_threshold:
+                self._record_stall(lag, capture)
+
+    def _record_stall(self, lag, capture):
+        handler, update_id = capture or (None, None)
+        self.stalls += 1
+        self.last_stall = {
+            'at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'duration_ms': round(lag * 1000),
+            'handler': handler,
+            'update_id': update_id,
+        }
+        logger.warning(f"⚠️ Event loop был заблокирован {lag * 1000:.0f} мс"
+                       + (f", обработчик {handler}, апдейт {update_id}" if handler else ""))
+
+    def _watch(self):
+        """Поток-наблюдатель: замечает, что задача-сторож перестала просыпаться"""
+        check_interval = min(TICK_INTERVAL, self.stall_threshold / 4)
+        while not self._stop_event.wait(check_interval):
+            blocked = self.blocked_for()
+            if blocked < self.stall_threshold or self._stall_capture is not None:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            handler, update_id = _running_handler(frame)
+            self._stall_capture = (handler, update_id)
+            stack = ''.join(traceback.format_stack(frame))
+            del frame
+            logger.warning(
+                f"⚠️ Event loop не отвечает {blocked * 1000:.0f} мс. "
+                f"Обработчик: {handler or 'неизвестен'}, апдейт: {update_id}\n"
+                f"Стек потока event loop:\n{stack}"
+            )
+
+    def blocked_for(self):
+        """Сколько секунд задача-сторож просрочила очередное пробуждение"""
+        if self._last_tick is None:
+            return 0.0
+        return max(time.monotonic() - self._last_tick - TICK_INTERVAL, 0.0)
+
+    def health(self):
+        """Состояние бота для /healthz; безопасно вызывать из другого потока"""
+        application = self.application
+        blocked = self.blocked_for()
+        stalled = self._task is not None and blocked >= self.stall_threshold
+
+        updater = application.updater
+        polling = updater is not None and updater.running
+        last_poll = self.last_get_updates or self._started_at
+        polling_stale = polling and last_poll is not None and time.time() - last_poll > POLLING_STALE_AFTER
+
+        if stalled:
+            status = 'stalled'
+        elif polling_stale:
+            status = 'polling_stale'
+        else:
+            status = 'ok'
+
+        return {
+            'status': status,
+            'loop': {
+                'running': self._task is not None,
+                'blocked_ms': round(blocked * 1000, 1),
+                'lag_ms': percentiles(list(self.lags)),
+                'stall_threshold_ms': round(self.stall_threshold * 1000),
+                'stalls': self.stalls,
+                'last_stall': self.last_stall,
+            },
+            'storage_save_ms': percentiles(list(database.save_timings)),
+            'duplicate_updates': application.dedupe.stats(),
+            'inline_cache': inline.cache.stats(),
+            'queues': {
+                'updates': application.update_queue.qsize(),
+                'channel_posts': len(application.publisher),
+            },
+            'ingest': application.ingest.stats(percentiles),
+            'polling': {
+                'running': polling,
+                'last_get_updates': (datetime.fromtimestamp(self.last_get_updates).strftime('%Y-%m-%d %H:%M:%S')
+                                     if self.last_get_updates else None),
+                'seconds_ago': round(time.time() - self.last_get_updates, 1) if self.last_get_updates else None,
+            },
+        }
+
+
+# ========== /healthz ==========
+class HealthServer:
+    """HTTP сервер проверки здоровья в отдельном потоке"""
+
+    def __init__(self, watchdog, host=None, port=None):
+        settings = get_settings()
+        self.watchdog = watchdog
+        self.host = host or settings.health_host
+        self.port = settings.health_port if port is None else port
+        self._server = None
+
+    def start(self):
+        watchdog = self.watchdog
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/healthz', '/health'):
+                    self.send_error(404)
+                    return
+                health = watchdog.health()
+                body = json.dumps(health, ensure_ascii=False).encode('utf-8')
+                self.send_response(200 if health['status'] == 'ok' else 503)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"/healthz: {format % args}")
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name='health-server', daemon=True).start()
+        logger.info(f"Проверка здоровья: http://{self.host}:{self.port}/healthz")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None